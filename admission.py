@@ -0,0 +1,103 @@
+"""
+Admission Control - keeps concurrent analyses within a memory budget.
+
+Every analysis reserves its estimated peak memory (see
+estimate_analysis_memory) before it starts. Reservations that do not fit
+wait in FIFO order until running analyses release theirs; when too many are
+already waiting, new requests are rejected so the client can retry later.
+"""
+
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+class AdmissionRejected(Exception):
+    """The analysis cannot be admitted now (retry_after set) or ever (None)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def default_memory_budget():
+    """Half of the physical memory, or 2 GB when it cannot be determined."""
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (AttributeError, ValueError, OSError):
+        return 2 * 1024 ** 3
+
+
+class MemoryBudget:
+    """Byte budget shared by all analyses of this process."""
+
+    def __init__(self, budget_bytes, max_queue=10, retry_after=30):
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.in_use = 0
+        self._waiting = deque()
+        self._cond = threading.Condition()
+
+    def check(self, nbytes):
+        """
+        Raise AdmissionRejected when nbytes can never fit into the budget, or
+        when it does not fit now and the waiting queue is already full.
+        """
+        if nbytes > self.budget_bytes:
+            raise AdmissionRejected(
+                f"needs ~{nbytes / 1e6:.0f} MB, budget is {self.budget_bytes / 1e6:.0f} MB"
+            )
+        with self._cond:
+            fits_now = not self._waiting and self.in_use + nbytes <= self.budget_bytes
+            if not fits_now and len(self._waiting) >= self.max_queue:
+                raise AdmissionRejected(
+                    f"{len(self._waiting)} analyses already waiting for memory",
+                    retry_after=self.retry_after
+                )
+
+    @contextmanager
+    def reserve(self, nbytes, on_wait=None):
+        """
+        Hold nbytes of the budget for the duration of the with-block, waiting
+        (first come, first served) until they fit. on_wait() is called once,
+        without the budget's lock held, if the caller has to wait.
+        """
+        nbytes = min(nbytes, self.budget_bytes)
+        ticket = object()
+
+        def blocked():
+            return self._waiting[0] is not ticket or self.in_use + nbytes > self.budget_bytes
+
+        with self._cond:
+            self._waiting.append(ticket)
+            must_wait = blocked()
+        try:
+            # Outside the lock: the callback may be slow (e.g. a job event
+            # written to SQLite) and must not hold up other reservations
+            if must_wait and on_wait:
+                on_wait()
+            with self._cond:
+                while blocked():
+                    self._cond.wait()
+                self.in_use += nbytes
+        finally:
+            with self._cond:
+                self._waiting.remove(ticket)
+                # The next in line may fit as well
+                self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= nbytes
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'budget_bytes': self.budget_bytes,
+                'in_use_bytes': self.in_use,
+                'waiting': len(self._waiting),
+            }
@@ -1,29 +1,87 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, jsonify, send_file, send_from_directory
+import time
+IMPORT_STARTED = time.time()  # start-up timing, see /ready
+
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
+import gzip
+import hmac
+import json
 import tempfile
 from datetime import datetime
 import traceback
 import sys
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from admission import AdmissionRejected, MemoryBudget, default_memory_budget
+from artifact_store import ArtifactStore
+from jobs import JobManager
+from state_backend import MemoryStateBackend, SQLiteStateBackend
+from uploads import (DEFAULT_MAX_DECOMPRESSED_BYTES, DEFAULT_PART_SIZE, ChunkedUploads, UploadError,
+                     save_data_stream, save_data_upload)
 
 # Set UTF-8 encoding for prints
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
 
-# Import our modules with error handling
-try:
-    from bad_respondents_detector import analyze_with_questionnaire
-    from spss_syntax_unified import generate_spss_syntax_unified
-    MODULES_LOADED = True
-    print("✓ Modules loaded successfully")
-except ImportError as e:
-    print(f"✗ ERROR: Failed to import modules: {e}")
-    MODULES_LOADED = False
-except Exception as e:
-    print(f"✗ ERROR loading modules: {e}")
-    MODULES_LOADED = False
+# The analysis modules (pandas, numpy, pyreadstat, ...) are imported by
+# load_modules(): under gunicorn with preload_app (see gunicorn.conf.py) once
+# in the master before the workers fork, otherwise by the warm-up thread or
+# the first request that needs them. None = not tried yet.
+MODULES_LOADED = None
+modules_lock = threading.Lock()
+
+def load_modules():
+    """Import the analysis modules (once). Returns True when they are available."""
+    global MODULES_LOADED, analyze_with_questionnaire, apply_thresholds, estimate_analysis_memory
+    global query_respondents, respondent_table, summarize_results, generate_spss_syntax_unified
+    global file_hash, read_sav_metadata
+    if MODULES_LOADED is not None:
+        return MODULES_LOADED
+    with modules_lock:
+        if MODULES_LOADED is not None:
+            return MODULES_LOADED
+        started = time.time()
+        try:
+            from bad_respondents_detector import (analyze_with_questionnaire, apply_thresholds,
+                                                  estimate_analysis_memory, query_respondents,
+                                                  respondent_table, summarize_results)
+            from spss_syntax_unified import generate_spss_syntax_unified
+            from sav_cache import file_hash, read_sav_metadata
+            startup['modules_sec'] = round(time.time() - started, 3)
+            print(f"✓ Modules loaded successfully ({startup['modules_sec']:.2f} s)")
+            MODULES_LOADED = True
+        except ImportError as e:
+            print(f"✗ ERROR: Failed to import modules: {e}")
+            startup['error'] = str(e)
+            MODULES_LOADED = False
+        except Exception as e:
+            print(f"✗ ERROR loading modules: {e}")
+            startup['error'] = str(e)
+            MODULES_LOADED = False
+    return MODULES_LOADED
+
+# Start-up timings (seconds since process start unless noted), see /ready
+startup = {
+    'pid': os.getpid(),
+    'ready': False,
+    'import_sec': None,
+    'modules_sec': None,
+    'warmup_sec': None,
+    'warmup_steps': None,
+    'ready_sec': None,
+    'error': None
+}
 
 app = Flask(__name__, static_folder='static', static_url_path='')
 
@@ -33,19 +91,152 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Profile')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max
+app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max (compressed upload size)
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+# Cap on the size of .sav.gz / .zip uploads after decompression
+MAX_DECOMPRESSED_BYTES = int(os.environ.get('MAX_DECOMPRESSED_MB', 0)) * 1024 * 1024 or DEFAULT_MAX_DECOMPRESSED_BYTES
 
-ALLOWED_SAV = {'sav'}
 ALLOWED_DOCX = {'docx'}
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+# Shared state (jobs, finished analyses, uploads kept after a preview): in
+# this process by default; with STATE_DIR in a SQLite database there, so all
+# gunicorn workers of the host can serve any job, result and download
+# (artifacts and upload parts then default to directories under STATE_DIR)
+STATE_DIR = os.environ.get('STATE_DIR') or None
+
+# Finished analyses (raw per-respondent metrics) are kept so thresholds can
+# be changed via /api/rethreshold without re-uploading the SAV file.
+# Oldest analyses are evicted first.
+MAX_STORED_ANALYSES = int(os.environ.get('MAX_STORED_ANALYSES', 20))
+
+# Uploads of preview runs stay on disk so the full analysis can start without
+# a new upload; removed after KEPT_UPLOAD_TTL_SEC or beyond MAX_KEPT_UPLOADS
+PREVIEW_ROWS = int(os.environ.get('PREVIEW_ROWS', 5000))
+KEPT_UPLOAD_TTL_SEC = int(os.environ.get('KEPT_UPLOAD_TTL_SEC', 3600))
+MAX_KEPT_UPLOADS = int(os.environ.get('MAX_KEPT_UPLOADS', 20))
+
+if STATE_DIR:
+    state = SQLiteStateBackend(STATE_DIR, max_analyses=MAX_STORED_ANALYSES,
+                               upload_ttl_sec=KEPT_UPLOAD_TTL_SEC, max_uploads=MAX_KEPT_UPLOADS)
+else:
+    state = MemoryStateBackend(max_analyses=MAX_STORED_ANALYSES,
+                               upload_ttl_sec=KEPT_UPLOAD_TTL_SEC, max_uploads=MAX_KEPT_UPLOADS)
+
+def store_analysis(results, analysis_id=None):
+    """Keep results (new id, or replace the results of analysis_id)."""
+    analysis_id = analysis_id or uuid.uuid4().hex
+    state.put_analysis(analysis_id, results)
+    return analysis_id
+
+def get_stored_analysis(analysis_id):
+    return state.get_analysis(analysis_id)
+
+# Per-respondent views for /respondents, built on first use; valid while the
+# backend returns the same results object
+respondent_tables = OrderedDict()
+respondent_tables_lock = threading.Lock()
+
+def get_respondent_table(analysis_id, results):
+    with respondent_tables_lock:
+        cached = respondent_tables.get(analysis_id)
+        if cached is not None and cached[0] is results:
+            respondent_tables.move_to_end(analysis_id)
+            return cached[1]
+    table = respondent_table(results)
+    with respondent_tables_lock:
+        respondent_tables[analysis_id] = (results, table)
+        respondent_tables.move_to_end(analysis_id)
+        while len(respondent_tables) > MAX_STORED_ANALYSES:
+            respondent_tables.popitem(last=False)
+    return table
+
+# Background analyses; duplicate uploads of a running job attach to it (also
+# across processes sharing STATE_DIR, unless the running job went silent for
+# JOB_STALE_SEC)
+# Longest a synchronous request waits for its job (async requests follow it instead)
+SYNC_JOB_TIMEOUT_SEC = int(os.environ.get('SYNC_JOB_TIMEOUT_SEC', 1800))
+job_manager = JobManager(retention_sec=int(os.environ.get('JOB_RETENTION_SEC', 3600)), backend=state,
+                         stale_sec=int(os.environ.get('JOB_STALE_SEC', 900)))
+
+# Generated files (SPSS syntax) - unique IDs, expire after ARTIFACT_TTL_SEC,
+# oldest evicted first above ARTIFACT_MAX_MB
+artifact_store = ArtifactStore(
+    os.environ.get('ARTIFACT_DIR') or os.path.join(STATE_DIR or tempfile.gettempdir(),
+                                                   'artifacts' if STATE_DIR else 'brd_artifacts'),
+    ttl_sec=int(os.environ.get('ARTIFACT_TTL_SEC', 3600)),
+    max_bytes=int(float(os.environ.get('ARTIFACT_MAX_MB', 200)) * 1024 * 1024)
+)
+artifact_store.start_sweeper()
+
+# Analyses reserve their estimated peak memory; what does not fit waits in
+# a queue of at most ANALYSIS_QUEUE_MAX, beyond that requests get 503
+memory_budget = MemoryBudget(
+    int(float(os.environ['ANALYSIS_MEMORY_BUDGET_MB']) * 1024 * 1024)
+    if os.environ.get('ANALYSIS_MEMORY_BUDGET_MB') else default_memory_budget(),
+    max_queue=int(os.environ.get('ANALYSIS_QUEUE_MAX', 10)),
+    retry_after=int(os.environ.get('ANALYSIS_RETRY_AFTER_SEC', 30))
+)
+
+# Resumable uploads: parts stored under UPLOAD_PARTS_DIR until complete;
+# the whole file may be up to MAX_UPLOAD_MB (default: the request limit)
+chunked_uploads = ChunkedUploads(
+    os.environ.get('UPLOAD_PARTS_DIR') or os.path.join(STATE_DIR or tempfile.gettempdir(),
+                                                       'uploads' if STATE_DIR else 'brd_uploads'),
+    max_bytes=int(float(os.environ['MAX_UPLOAD_MB']) * 1024 * 1024)
+    if os.environ.get('MAX_UPLOAD_MB') else app.config['MAX_CONTENT_LENGTH'],
+    ttl_sec=int(os.environ.get('UPLOAD_TTL_SEC', 24 * 3600))
+)
+
+# Opt-in profiling of single analyses: every run with PROFILE_ANALYSES=1, or
+# requests sending the admin header X-Profile: <PROFILE_TOKEN>
+PROFILE_ANALYSES = os.environ.get('PROFILE_ANALYSES', '').lower() in ('1', 'true', 'yes')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', 25))
+
+def profiling_requested():
+    if PROFILE_ANALYSES:
+        return True
+    header = request.headers.get('X-Profile')
+    return bool(PROFILE_TOKEN and header and hmac.compare_digest(header, PROFILE_TOKEN))
+
+def store_profile(profiler):
+    """Save a finished profile as an artifact. Returns the response fields."""
+    from profiling import top_functions
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    artifact_id = artifact_store.put(f"profile_{timestamp}.prof", profiler.dump_stats)
+    print(f"✓ Profile saved (artifact {artifact_id})")
+    return {
+        'artifact_id': artifact_id,
+        'download_url': f"/api/download/{artifact_id}",
+        'top_functions': top_functions(profiler, PROFILE_TOP_N)
+    }
+
+# Response fields of a preview - a syntax would delete sampled respondents only
+NO_SYNTAX = {'syntax_file': None, 'artifact_id': None, 'download_url': None}
+
+def store_syntax(results):
+    """Generate the SPSS syntax into the artifact store. Returns the response fields."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    syntax_filename = f"delete_bad_{timestamp}.sps"
+    artifact_id = artifact_store.put(
+        syntax_filename,
+        lambda path: generate_spss_syntax_unified(results, id_column=results['id_column'], output_file=path),
+        mimetype='text/plain'
+    )
+    print(f"✓ Syntax generated: {syntax_filename} (artifact {artifact_id})")
+    return {
+        'syntax_file': syntax_filename,
+        'artifact_id': artifact_id,
+        'download_url': f"/api/download/{artifact_id}"
+    }
+
 # Main page - serve frontend
 @app.route('/')
 def index():
@@ -56,12 +247,30 @@ def index():
 
 @app.route('/health', methods=['GET'])
 def health():
+    """Liveness - the process serves requests (it may still be warming up, see /ready)."""
+    failed = MODULES_LOADED is False
     health_status = {
-        'status': 'ok' if MODULES_LOADED else 'error',
+        'status': 'error' if failed else 'ok',
         'message': 'Bad Respondents Detector v2.0 API running',
-        'modules_loaded': MODULES_LOADED
+        'modules_loaded': MODULES_LOADED,
+        'ready': startup['ready'],
+        'state_backend': state.name,
+        'memory_budget': memory_budget.stats()
     }
-    return jsonify(health_status), 200 if MODULES_LOADED else 500
+    return jsonify(health_status), 500 if failed else 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness - 200 only after the warm-up analysis finished, 503 before."""
+    if startup['ready']:
+        return jsonify({'success': True, 'ready': True, 'startup': startup}), 200
+    return jsonify({
+        'success': False,
+        'ready': False,
+        'error': (f"Server není připraven: {startup['error']}" if startup['error']
+                  else 'Server se zahřívá, zkuste to za chvíli'),
+        'startup': startup
+    }), 503
 
 @app.route('/api/analyze', methods=['POST', 'OPTIONS'])
 def analyze():
@@ -69,7 +278,7 @@ def analyze():
         return '', 204
     
     # Check if modules are loaded
-    if not MODULES_LOADED:
+    if not load_modules():
         return jsonify({
             'success': False,
             'error': 'Server není správně nakonfigurován. Chybí potřebné moduly (pyreadstat, pandas, python-docx).'
@@ -80,194 +289,705 @@ def analyze():
         print("NEW ANALYSIS REQUEST")
         print("="*80)
         
-        # File validation
+        # File validation (the questionnaire may also come inside a zip bundle)
         if 'sav_file' not in request.files:
             return jsonify({'success': False, 'error': 'Chybí SAV soubor'}), 400
         
-        if 'docx_file' not in request.files:
-            return jsonify({'success': False, 'error': 'Chybí dotazník (.docx)'}), 400
-        
         sav_file = request.files['sav_file']
-        docx_file = request.files['docx_file']
+        docx_file = request.files.get('docx_file')
+        if docx_file is not None and docx_file.filename == '':
+            docx_file = None
         
         if sav_file.filename == '':
             return jsonify({'success': False, 'error': 'SAV soubor nebyl vybrán'}), 400
         
-        if docx_file.filename == '':
-            return jsonify({'success': False, 'error': 'Dotazník nebyl vybrán'}), 400
-        
-        if not allowed_file(sav_file.filename, ALLOWED_SAV):
-            return jsonify({'success': False, 'error': 'SAV soubor musí mít příponu .sav'}), 400
-        
-        if not allowed_file(docx_file.filename, ALLOWED_DOCX):
+        if docx_file is not None and not allowed_file(docx_file.filename, ALLOWED_DOCX):
             return jsonify({'success': False, 'error': 'Dotazník musí mít příponu .docx'}), 400
         
-        # Save files
+        # Save files (unique prefix - concurrent uploads in the same second
+        # must not overwrite each other); compressed data is unpacked while
+        # it is written to disk
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        sav_filename = f"{timestamp}_{secure_filename(sav_file.filename)}"
-        docx_filename = f"{timestamp}_{secure_filename(docx_file.filename)}"
+        upload_prefix = f"{timestamp}_{uuid.uuid4().hex[:8]}"
         
-        sav_path = os.path.join(app.config['UPLOAD_FOLDER'], sav_filename)
-        docx_path = os.path.join(app.config['UPLOAD_FOLDER'], docx_filename)
+        try:
+            sav_path, bundled_docx_path = save_data_upload(
+                sav_file, app.config['UPLOAD_FOLDER'], upload_prefix, MAX_DECOMPRESSED_BYTES
+            )
+        except UploadError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        print(f"Saving files:")
+        docx_path = save_questionnaire(docx_file, bundled_docx_path, upload_prefix)
+        if docx_path is None:
+            remove_files(sav_path)
+            return jsonify({'success': False, 'error': 'Chybí dotazník (.docx)'}), 400
+        
+        print(f"Files saved:")
         print(f"  SAV: {sav_path}")
         print(f"  DOCX: {docx_path}")
         
-        sav_file.save(sav_path)
-        docx_file.save(docx_path)
+        return start_analysis(sav_path, docx_path)
         
-        print(f"Files saved successfully")
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {str(e)}")
+        print(traceback.format_exc())
+        print("="*80 + "\n")
         
-        # Analysis
-        print(f"\nStarting analysis...")
+        return jsonify({
+            'success': False,
+            'error': f'Neočekávaná chyba: {str(e)}'
+        }), 500
+
+def save_questionnaire(docx_file, bundled_docx_path, upload_prefix):
+    """
+    Path of the questionnaire to analyze with: an explicitly uploaded DOCX
+    wins over one from a zip bundle. None when there is neither.
+    """
+    if docx_file is None:
+        return bundled_docx_path
+    remove_files(bundled_docx_path)
+    docx_path = os.path.join(app.config['UPLOAD_FOLDER'],
+                             f"{upload_prefix}_{secure_filename(docx_file.filename)}")
+    docx_file.save(docx_path)
+    return docx_path
+
+def start_analysis(sav_path, docx_path, discard=None):
+    """
+    Queue the analysis of saved upload files (form fields segment_by,
+    preview / sample_rows / sample_mode and async apply) and build the
+    response. Takes ownership of both files: when no analysis is started
+    for them, discard() is called (default: delete them).
+    """
+    if discard is None:
+        discard = lambda: remove_files(sav_path, docx_path)
+    
+    try:
+        sample_rows, sample_mode = preview_params()
+    except ValueError:
+        discard()
+        return jsonify({'success': False, 'error': 'Neplatné parametry náhledu (sample_rows, sample_mode)'}), 400
+    
+    # Optional segment variable for segment-relative speeder thresholds
+    segment_by = (request.form.get('segment_by') or '').strip() or None
+    if segment_by:
         try:
-            results, df = analyze_with_questionnaire(sav_path, docx_path)
-            print(f"✓ Analysis completed successfully")
-        except Exception as analysis_error:
-            print(f"✗ Analysis failed: {str(analysis_error)}")
-            print(traceback.format_exc())
-            
-            # Cleanup on error
+            known_column = segment_by in read_sav_metadata(sav_path).column_names
+        except Exception as e:
+            discard()
+            return jsonify({'success': False, 'error': f'Soubor SAV nelze přečíst: {str(e)}'}), 400
+        if not known_column:
+            discard()
+            return jsonify({'success': False, 'error': f'Segmentová proměnná {segment_by} v SAV souboru není'}), 400
+
+    # Identical files already being analyzed -> attach to that run
+    job_key = f"{file_hash(sav_path)}:{file_hash(docx_path)}:{segment_by or ''}"
+    profile = profiling_requested()
+    if profile:
+        job_key += ':profile'  # never attach a profiled request to a plain run
+    if sample_rows:
+        job_key += f":sample{sample_rows}:{sample_mode}"
+
+    # Memory estimate from the SAV header (upper bound - the questionnaire
+    # is not parsed yet); reject early when it cannot be admitted
+    estimate = None
+    if job_manager.active(job_key) is None:
+        try:
+            estimate = estimate_analysis_memory(sav_path)
+            if sample_rows and estimate['rows']:
+                estimate['bytes'] = int(estimate['bytes'] * min(1.0, sample_rows / estimate['rows']))
+            print(f"Estimated memory: {estimate['bytes'] / 1e6:.0f} MB "
+                  f"({estimate['rows']} rows × {estimate['columns']} columns)")
+            memory_budget.check(estimate['bytes'])
+        except AdmissionRejected as rejected:
+            discard()
+            return admission_error(rejected)
+        except Exception as e:
+            discard()
+            return jsonify({'success': False, 'error': f'Soubor SAV nelze přečíst: {str(e)}'}), 400
+
+    # A preview keeps its files so the full run needs no new upload
+    preview_id = uuid.uuid4().hex if sample_rows else None
+    job, created = job_manager.submit(
+        job_key, lambda job: run_analysis(job, sav_path, docx_path, estimate, segment_by, profile,
+                                          sample_rows, sample_mode, preview_id)
+    )
+    if not created:
+        print(f"Duplicate submission - attaching to running job {job.id}")
+        discard()
+
+    if is_async_request():
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'attached': not created,
+            'status_url': f"/api/jobs/{job.id}",
+            'events_url': f"/api/jobs/{job.id}/events"
+        }), 202
+
+    if not job.wait(timeout=SYNC_JOB_TIMEOUT_SEC):
+        return jsonify({
+            'success': False,
+            'error': f'Analýza neskončila do {SYNC_JOB_TIMEOUT_SEC} s; průběh lze sledovat přes status_url',
+            'job_id': job.id,
+            'status_url': f"/api/jobs/{job.id}"
+        }), 504
+    return jsonify(job.payload), job.http_status
+
+def preview_params():
+    """
+    (sample_rows, sample_mode) of a preview request - form fields or query
+    args preview=1 (PREVIEW_ROWS rows) or sample_rows=N, optional
+    sample_mode=strided|random; (None, None) for a full analysis.
+    """
+    def field(name):
+        return (request.form.get(name) or request.args.get(name) or '').strip()
+    
+    rows = field('sample_rows')
+    if rows:
+        rows = int(rows)
+        if rows <= 0:
+            raise ValueError(rows)
+    elif field('preview').lower() in ('1', 'true', 'yes'):
+        rows = PREVIEW_ROWS
+    else:
+        return None, None
+    mode = field('sample_mode') or 'strided'
+    if mode not in ('strided', 'random'):
+        raise ValueError(mode)
+    return rows, mode
+
+def admission_error(rejected):
+    """Response for an analysis that does not fit into the memory budget."""
+    if rejected.retry_after is None:
+        print(f"✗ Rejected - file too large for the memory budget ({rejected})")
+        return jsonify({
+            'success': False,
+            'error': f'Soubor je na dostupnou paměť serveru příliš velký ({rejected}).'
+        }), 413
+    
+    print(f"✗ Rejected - server busy ({rejected})")
+    response = jsonify({
+        'success': False,
+        'error': f'Server je vytížený, zkuste to prosím znovu za {rejected.retry_after} s.',
+        'retry_after': rejected.retry_after
+    })
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response, 503
+
+def is_async_request():
+    """Client asked for 202 + job id instead of waiting for the result."""
+    flag = request.args.get('async') or request.form.get('async') or ''
+    return flag.lower() in ('1', 'true', 'yes')
+
+def remove_files(*paths):
+    for path in paths:
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Warning: Cleanup of {path} failed: {e}")
+
+def run_analysis(job, sav_path, docx_path, estimate=None, segment_by=None, profile=False,
+                 sample_rows=None, sample_mode=None, preview_id=None):
+    """Background part of /api/analyze. Returns (response body, HTTP status)."""
+    try:
+        # Wait until the estimated memory fits into the budget
+        reserved_bytes = estimate['bytes'] if estimate else 0
+        with memory_budget.reserve(
+            reserved_bytes,
+            on_wait=lambda: job.emit('admission', 'waiting', **memory_budget.stats())
+        ):
+            # Analysis
+            print(f"\nStarting analysis (job {job.id}{', profiled' if profile else ''})...")
+            if profile:
+                from profiling import profiled
             try:
-                if os.path.exists(sav_path):
-                    os.remove(sav_path)
-                if os.path.exists(docx_path):
-                    os.remove(docx_path)
-            except:
-                pass
-            
-            return jsonify({
-                'success': False,
-                'error': f'Chyba při analýze dat: {str(analysis_error)}'
-            }), 500
+                # Profiled runs keep the detectors in this thread - cProfile
+                # only sees the thread it was enabled in
+                with profiled() if profile else nullcontext() as profiler:
+                    results, df = analyze_with_questionnaire(sav_path, docx_path, progress=job.progress,
+                                                             segment_by=segment_by,
+                                                             detector_workers=1 if profile else None,
+                                                             sample_rows=sample_rows,
+                                                             sample_mode=sample_mode or 'strided')
+                del df
+                print(f"✓ Analysis completed successfully")
+            except Exception as analysis_error:
+                print(f"✗ Analysis failed: {str(analysis_error)}")
+                print(traceback.format_exc())
+                return {
+                    'success': False,
+                    'error': f'Chyba při analýze dat: {str(analysis_error)}'
+                }, 500
         
-        # Generate syntax
-        print(f"\nGenerating SPSS syntax...")
-        syntax_filename = f"delete_bad_{timestamp}.sps"
-        syntax_path = os.path.join(app.config['UPLOAD_FOLDER'], syntax_filename)
+        # Generate syntax (not for a preview - it would cover the sample only)
+        if preview_id:
+            syntax = NO_SYNTAX
+        else:
+            print(f"\nGenerating SPSS syntax...")
+            job.emit('syntax', 'started')
+            try:
+                syntax = store_syntax(results)
+            except Exception as syntax_error:
+                print(f"✗ Syntax generation failed: {str(syntax_error)}")
+                print(traceback.format_exc())
+                return {
+                    'success': False,
+                    'error': f'Chyba při generování syntaxe: {str(syntax_error)}'
+                }, 500
+            job.emit('syntax', 'finished')
         
-        try:
-            syntax = generate_spss_syntax_unified(
-                results, 
-                id_column=results['id_column'], 
-                output_file=syntax_path
-            )
-            print(f"✓ Syntax generated: {syntax_path}")
-        except Exception as syntax_error:
-            print(f"✗ Syntax generation failed: {str(syntax_error)}")
-            print(traceback.format_exc())
-            return jsonify({
-                'success': False,
-                'error': f'Chyba při generování syntaxe: {str(syntax_error)}'
-            }), 500
+        analysis_id = store_analysis(results)
         
         # Build response
         response_data = {
             'success': True,
-            'results': {
-                'total_respondents': results['total_respondents'],
-                'battery_length': results.get('battery_length', 'N/A'),
-                'id_column': results['id_column'],
-                'speeders': {
-                    'count': len(results['speeders']),
-                    'threshold_sec': results.get('speeder_threshold_sec', 0),
-                    'threshold_min': results.get('speeder_threshold_min', 0)
-                },
-                'suspicious_open': {
-                    'count': len(results['suspicious_open']) + len(results.get('suspicious_open_medium', [])),
-                    'high_risk_count': len(results['suspicious_open']),
-                    'medium_risk_count': len(results.get('suspicious_open_medium', []))
-                },
-                'straight_liners': {
-                    'count': len(results['straight_liners'])
-                },
-                'risk_groups': {
-                    'all_three': len(results['risk_groups']['all_three']),
-                    'speeders_open': len(results['risk_groups']['speeders_open']),
-                    'speeders_straight': len(results['risk_groups']['speeders_straight']),
-                    'open_straight': len(results['risk_groups']['open_straight']),
-                    'speeders_only': len(results['risk_groups']['speeders_only']),
-                    'open_only': len(results['risk_groups']['open_only']),
-                    'straight_only': len(results['risk_groups']['straight_only'])
-                },
-                'recommendations': {
-                    'high_risk': len(results['recommendations']['high_risk']),
-                    'medium_risk': len(results['recommendations']['medium_risk']),
-                    'low_risk': len(results['recommendations']['low_risk'])
-                },
-                'total_bad': len(results['all_bad'])
-            },
-            'syntax_file': syntax_filename
+            'analysis_id': analysis_id,
+            'results': summarize_results(results),
+            **syntax
         }
+        if profile:
+            response_data['profile'] = store_profile(profiler)
+        if preview_id:
+            response_data['preview'] = {
+                'preview_id': preview_id,
+                'full_run_url': f"/api/previews/{preview_id}/analyze",
+                'expires_in_sec': KEPT_UPLOAD_TTL_SEC
+            }
         
         print(f"\n✓ Response prepared successfully")
         print(f"  Total flagged: {len(results['all_bad'])}")
         print(f"  High risk: {len(results['recommendations']['high_risk'])}")
         print(f"  Medium risk: {len(results['recommendations']['medium_risk'])}")
+        print("="*80 + "\n")
         
-        # Cleanup uploaded files (keep syntax file for download)
-        try:
-            if os.path.exists(sav_path):
-                os.remove(sav_path)
-            if os.path.exists(docx_path):
-                os.remove(docx_path)
+        return response_data, 200
+    finally:
+        # Cleanup uploaded files (the syntax lives in the artifact store)
+        if preview_id:
+            state.keep_upload(preview_id, sav_path, docx_path)
+            print(f"✓ Files kept for the full run (preview {preview_id})")
+        else:
+            remove_files(sav_path, docx_path)
             print(f"✓ Cleanup completed")
-        except Exception as cleanup_error:
-            print(f"Warning: Cleanup failed: {cleanup_error}")
+
+@app.route('/api/previews/<preview_id>/analyze', methods=['POST', 'OPTIONS'])
+def analyze_preview_upload(preview_id):
+    """Analyze the files of a finished preview (form fields as /api/analyze)."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if not load_modules():
+        return jsonify({
+            'success': False,
+            'error': 'Server není správně nakonfigurován. Chybí potřebné moduly (pyreadstat, pandas, python-docx).'
+        }), 500
+    
+    files = state.take_upload(preview_id)
+    if files is None:
+        return jsonify({'success': False, 'error': 'Náhled nenalezen (soubory mohly vypršet) - nahrajte data znovu'}), 404
+    sav_path, docx_path = files
+    
+    try:
+        print("\n" + "="*80)
+        print(f"FULL ANALYSIS OF PREVIEW {preview_id}")
+        print("="*80)
+        # Rejected (e.g. server busy) -> keep the files for another attempt
+        return start_analysis(sav_path, docx_path,
+                              discard=lambda: state.keep_upload(preview_id, sav_path, docx_path))
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': f'Neočekávaná chyba: {str(e)}'
+        }), 500
+
+@app.route('/api/uploads', methods=['POST', 'OPTIONS'])
+def upload_init():
+    """Start a resumable upload: {"filename": ..., "size": ..., "part_size": ...}."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    data = request.get_json(silent=True) or {}
+    try:
+        size = int(data.get('size', 0))
+        part_size = int(data.get('part_size') or DEFAULT_PART_SIZE)
+        status = chunked_uploads.create(str(data.get('filename') or ''), size, part_size)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e) if isinstance(e, UploadError) else 'Neplatná velikost'}), 400
+    print(f"Upload {status['id']} started: {status['filename']} "
+          f"({status['size']} B in {status['parts_total']} parts)")
+    return jsonify(dict(status, success=True)), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'DELETE'])
+def upload_status(upload_id):
+    """Received parts (to resume after a dropped connection), or abort."""
+    if request.method == 'DELETE':
+        chunked_uploads.delete(upload_id)
+        return jsonify({'success': True})
+    status = chunked_uploads.status(upload_id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Upload nenalezen (mohl vypršet)'}), 404
+    return jsonify(dict(status, success=True))
+
+@app.route('/api/uploads/<upload_id>/parts/<int:number>', methods=['PUT', 'OPTIONS'])
+def upload_part(upload_id, number):
+    """Raw request body = part `number` (0-based); re-sending replaces it."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    try:
+        status = chunked_uploads.put_part(upload_id, number, request.stream)
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Upload nenalezen (mohl vypršet)'}), 404
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'received': status['received'],
+        'complete': status['complete']
+    })
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST', 'OPTIONS'])
+def upload_complete(upload_id):
+    """
+    Assemble the parts and start the analysis. Form fields as /api/analyze:
+    docx_file (unless the data is a zip bundle with one), segment_by, async.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+    if not load_modules():
+        return jsonify({
+            'success': False,
+            'error': 'Server není správně nakonfigurován. Chybí potřebné moduly (pyreadstat, pandas, python-docx).'
+        }), 500
+    
+    docx_file = request.files.get('docx_file')
+    if docx_file is not None and docx_file.filename == '':
+        docx_file = None
+    if docx_file is not None and not allowed_file(docx_file.filename, ALLOWED_DOCX):
+        return jsonify({'success': False, 'error': 'Dotazník musí mít příponu .docx'}), 400
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    upload_prefix = f"{timestamp}_{uuid.uuid4().hex[:8]}"
+    assembled_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{upload_prefix}_upload.part")
+    try:
+        print("\n" + "="*80)
+        print(f"UPLOAD COMPLETE {upload_id}")
+        print("="*80)
         
-        print("="*80 + "\n")
+        try:
+            meta = chunked_uploads.assemble(upload_id, assembled_path)
+        except KeyError:
+            return jsonify({'success': False, 'error': 'Upload nenalezen (mohl vypršet)'}), 404
+        except UploadError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        return jsonify(response_data), 200
+        try:
+            if meta['kind'] in ('.sav', '.zsav'):
+                # Already the final file - just give it its name
+                sav_path = os.path.join(app.config['UPLOAD_FOLDER'],
+                                        f"{upload_prefix}_{secure_filename(meta['filename']) or 'upload' + meta['kind']}")
+                os.replace(assembled_path, sav_path)
+                bundled_docx_path = None
+            else:
+                with open(assembled_path, 'rb') as assembled:
+                    sav_path, bundled_docx_path = save_data_stream(
+                        assembled, meta['filename'], app.config['UPLOAD_FOLDER'], upload_prefix, MAX_DECOMPRESSED_BYTES
+                    )
+        except UploadError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        finally:
+            remove_files(assembled_path)
+        
+        docx_path = save_questionnaire(docx_file, bundled_docx_path, upload_prefix)
+        if docx_path is None:
+            remove_files(sav_path)
+            return jsonify({'success': False, 'error': 'Chybí dotazník (.docx)'}), 400
         
+        print(f"  SAV: {sav_path} ({meta['parts_total']} parts)")
+        print(f"  DOCX: {docx_path}")
+        return start_analysis(sav_path, docx_path)
+    
     except Exception as e:
         print(f"\n✗ UNEXPECTED ERROR: {str(e)}")
         print(traceback.format_exc())
-        print("="*80 + "\n")
-        
         return jsonify({
             'success': False,
             'error': f'Neočekávaná chyba: {str(e)}'
         }), 500
 
-@app.route('/api/download/<filename>', methods=['GET'])
-def download(filename):
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Úloha nenalezena'}), 404
+    
+    data = job.to_dict()
+    data['success'] = True
+    if job.done:
+        data['result'] = job.payload
+    return jsonify(data), 200
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of the job's progress (ends with stage 'job')."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Úloha nenalezena'}), 404
+    
+    # Reconnecting EventSource clients resume after the last event they saw
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+    
+    def stream():
+        for event in job.iter_events(start=start):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {event['seq']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/rethreshold', methods=['POST', 'OPTIONS'])
+def rethreshold():
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    if not load_modules():
+        return jsonify({
+            'success': False,
+            'error': 'Server není správně nakonfigurován. Chybí potřebné moduly (pyreadstat, pandas, python-docx).'
+        }), 500
+    
     try:
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+        data = request.get_json(silent=True) or {}
+        analysis_id = data.get('analysis_id')
+        thresholds = data.get('thresholds') or {}
         
-        if not os.path.exists(filepath):
-            return jsonify({'success': False, 'error': 'Soubor nenalezen'}), 404
+        if not analysis_id:
+            return jsonify({'success': False, 'error': 'Chybí analysis_id'}), 400
+        if not isinstance(thresholds, dict):
+            return jsonify({'success': False, 'error': 'Prahy musí být objekt {název: hodnota}'}), 400
         
-        response = send_file(
-            filepath, 
-            as_attachment=True,
-            download_name=filename,
-            mimetype='text/plain'
-        )
+        results = get_stored_analysis(analysis_id)
+        if results is None:
+            return jsonify({
+                'success': False,
+                'error': 'Analýza nenalezena (mohla vypršet). Nahrajte prosím soubory znovu.'
+            }), 404
         
-        # Cleanup after download
-        @response.call_on_close
-        def cleanup():
-            try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    print(f"✓ Deleted syntax file: {filepath}")
-            except Exception as e:
-                print(f"Warning: Failed to delete {filepath}: {e}")
+        try:
+            new_results = apply_thresholds(results, thresholds)
+        except ValueError as threshold_error:
+            return jsonify({'success': False, 'error': f'Neplatné prahy: {threshold_error}'}), 400
+        
+        syntax = NO_SYNTAX if new_results.get('sample') else store_syntax(new_results)
+        # Respondent detail follows the latest thresholds
+        store_analysis(new_results, analysis_id)
         
-        return response
+        print(f"✓ Re-thresholded analysis {analysis_id}: {new_results['thresholds']}")
+        
+        return jsonify({
+            'success': True,
+            'analysis_id': analysis_id,
+            'results': summarize_results(new_results),
+            **syntax
+        }), 200
+        
+    except Exception as e:
+        print(f"✗ Rethreshold error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'success': False, 'error': f'Neočekávaná chyba: {str(e)}'}), 500
+
+# Responses above this size are gzipped when the client accepts it
+GZIP_MIN_BYTES = 1024
+
+def fast_json_response(payload, status=200):
+    """JSON response via orjson when installed, gzipped for clients that accept it."""
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+    
+    response = Response(body, status=status, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/api/analyses/<analysis_id>/respondents', methods=['GET'])
+def respondents(analysis_id):
+    """
+    Paginated per-respondent detail of a stored analysis.
+    Query: page, page_size (max 500), risk=high,medium,low,ok,
+    detector=speeders,page_speeders,open_high,open_medium,straight_liners,
+    min_score / max_score (adjusted open-ended score).
+    """
+    if not load_modules():
+        return jsonify({
+            'success': False,
+            'error': 'Server není správně nakonfigurován. Chybí potřebné moduly (pyreadstat, pandas, python-docx).'
+        }), 500
+    
+    try:
+        results = get_stored_analysis(analysis_id)
+        if results is None:
+            return jsonify({
+                'success': False,
+                'error': 'Analýza nenalezena (mohla vypršet). Nahrajte prosím soubory znovu.'
+            }), 404
+        
+        try:
+            page = query_respondents(
+                results, get_respondent_table(analysis_id, results),
+                risk=request.args.get('risk'),
+                detector=request.args.get('detector'),
+                min_score=request.args.get('min_score'),
+                max_score=request.args.get('max_score'),
+                page=request.args.get('page', 1),
+                page_size=request.args.get('page_size', 50)
+            )
+        except ValueError as query_error:
+            return jsonify({'success': False, 'error': f'Neplatný dotaz: {query_error}'}), 400
+        
+        return fast_json_response({'success': True, 'analysis_id': analysis_id, **page})
+        
+    except Exception as e:
+        print(f"✗ Respondents error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'success': False, 'error': f'Neočekávaná chyba: {str(e)}'}), 500
+
+@app.route('/api/analyses/<analysis_id>/export', methods=['GET'])
+def export_respondents(analysis_id):
+    """
+    Per-respondent flags and scores of a stored analysis (see
+    respondent_export.py). Query: format=csv (default, streamed in chunks)
+    or format=parquet (needs pyarrow; written to the artifact store, then sent).
+    """
+    if not load_modules():
+        return jsonify({
+            'success': False,
+            'error': 'Server není správně nakonfigurován. Chybí potřebné moduly (pyreadstat, pandas, python-docx).'
+        }), 500
+    
+    try:
+        from respondent_export import EXPORT_FORMATS, iter_csv, parquet_available, write_parquet
+        
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Neplatný formát exportu: {fmt} (povolené: {', '.join(EXPORT_FORMATS)})"
+            }), 400
+        if fmt == 'parquet' and not parquet_available():
+            return jsonify({
+                'success': False,
+                'error': 'Export do Parquet není na serveru dostupný (chybí balíček pyarrow). Použijte format=csv.'
+            }), 501
+        
+        results = get_stored_analysis(analysis_id)
+        if results is None:
+            return jsonify({
+                'success': False,
+                'error': 'Analýza nenalezena (mohla vypršet). Nahrajte prosím soubory znovu.'
+            }), 404
+        table = get_respondent_table(analysis_id, results)
+        download_name = f"respondents_{analysis_id[:8]}.{fmt}"
+        
+        if fmt == 'csv':
+            return Response(iter_csv(results, table), mimetype='text/csv',
+                            headers={'Content-Disposition': f'attachment; filename={download_name}'})
+        
+        artifact_id = artifact_store.put(download_name,
+                                         lambda path: write_parquet(results, path, table),
+                                         mimetype='application/vnd.apache.parquet')
+        artifact = artifact_store.get(artifact_id)
+        return send_file(artifact['path'], as_attachment=True,
+                         download_name=artifact['download_name'], mimetype=artifact['mimetype'])
+        
+    except Exception as e:
+        print(f"✗ Export error: {str(e)}")
+        print(traceback.format_exc())
+        return jsonify({'success': False, 'error': f'Chyba při exportu: {str(e)}'}), 500
+
+@app.route('/api/download/<artifact_id>', methods=['GET'])
+def download(artifact_id):
+    try:
+        artifact = artifact_store.get(artifact_id)
+        if artifact is None:
+            return jsonify({'success': False, 'error': 'Soubor nenalezen (mohl vypršet)'}), 404
+        
+        # Artifacts stay until they expire, so the file can be downloaded again
+        return send_file(
+            artifact['path'],
+            as_attachment=True,
+            download_name=artifact['download_name'],
+            mimetype=artifact['mimetype']
+        )
         
     except Exception as e:
         print(f"✗ Download error: {str(e)}")
         print(traceback.format_exc())
         return jsonify({'success': False, 'error': f'Chyba při stahování: {str(e)}'}), 500
 
+# =============================================================================
+# START-UP / WARM-UP
+# =============================================================================
+
+# WARMUP=0 skips the synthetic analysis (ready as soon as the modules load)
+WARMUP = os.environ.get('WARMUP', '1').lower() not in ('0', 'false', 'no')
+# Set by gunicorn.conf.py: the app is imported in the gunicorn master, which
+# warms up before forking the workers
+PRELOAD = os.environ.get('BRD_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+def warm_up():
+    """
+    Load the analysis modules and run one tiny synthetic analysis (see
+    warmup.py), so the first real request does not pay for cold code paths.
+    Marks the process ready; a failed warm-up is logged and keeps it unready.
+    """
+    if startup['ready'] or not load_modules():
+        return startup['ready']
+    started = time.time()
+    if WARMUP:
+        try:
+            from warmup import run_warm_up
+            startup['warmup_steps'] = run_warm_up(app)
+        except Exception as e:
+            print(f"✗ Warm-up failed: {e}")
+            print(traceback.format_exc())
+            startup['error'] = f'warm-up selhal: {e}'
+            return False
+    startup['warmup_sec'] = round(time.time() - started, 3)
+    startup['ready_sec'] = round(time.time() - IMPORT_STARTED, 3)
+    startup['ready'] = True
+    print(f"✓ Ready in {startup['ready_sec']:.2f} s (import {startup['import_sec']:.2f} s, "
+          f"modules {startup['modules_sec']:.2f} s, warm-up {startup['warmup_sec']:.2f} s)")
+    return True
+
+def after_fork():
+    """Called in each forked gunicorn worker (threads do not survive fork)."""
+    startup['pid'] = os.getpid()
+    artifact_store.start_sweeper()
+
+startup['import_sec'] = round(time.time() - IMPORT_STARTED, 3)
+if PRELOAD:
+    warm_up()
+else:
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"\n{'='*80}")
     print(f"BAD RESPONDENTS DETECTOR v2.0")
     print(f"Port: {port}")
-    print(f"Modules loaded: {MODULES_LOADED}")
+    print(f"Startup: import {startup['import_sec']:.2f} s (warm-up running in background, see /ready)")
     print(f"{'='*80}\n")
     
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,187 @@
+"""
+Artifact Store - generated output files (SPSS syntax, ...) kept on disk
+under unique IDs until they expire.
+
+Layout of the store directory:
+    <id>            file content
+    <id>.json       metadata: download name, mimetype, size, creation time
+
+The directory is the only source of truth, so several server processes can
+share one store. Artifacts older than the TTL are removed by a background
+sweeper; when the total size exceeds the cap, the oldest artifacts are
+evicted first.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+ARTIFACT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ArtifactStore:
+    """Directory of expiring artifacts with a total-size cap."""
+
+    def __init__(self, root, ttl_sec=3600, max_bytes=200 * 1024 * 1024, sweep_interval=60):
+        self.root = root
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._sweeper_pid = None
+        os.makedirs(root, exist_ok=True)
+
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+
+    def put(self, download_name, write, mimetype='application/octet-stream'):
+        """
+        Create an artifact: write(path) fills the file. Returns the artifact id.
+        The artifact becomes visible only after write() succeeded.
+        """
+        artifact_id = uuid.uuid4().hex
+        path = self.path(artifact_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        info = {
+            'id': artifact_id,
+            'download_name': download_name,
+            'mimetype': mimetype,
+            'size': os.path.getsize(path),
+            'created': time.time(),
+        }
+        with open(self._meta_path(artifact_id), 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False)
+
+        self.enforce_quota(keep=artifact_id)
+        return artifact_id
+
+    def get(self, artifact_id):
+        """Metadata dict (with 'path') of a live artifact, or None."""
+        if not ARTIFACT_ID_RE.match(artifact_id or ''):
+            return None
+        try:
+            with open(self._meta_path(artifact_id), encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(info, time.time()) or not os.path.exists(self.path(artifact_id)):
+            return None
+        info['path'] = self.path(artifact_id)
+        return info
+
+    def delete(self, artifact_id):
+        for path in (self._meta_path(artifact_id), self.path(artifact_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Warning: Could not delete artifact file {path}: {e}")
+
+    def path(self, artifact_id):
+        return os.path.join(self.root, artifact_id)
+
+    # -------------------------------------------------------------------------
+    # Expiry and quota
+    # -------------------------------------------------------------------------
+
+    def sweep(self):
+        """Remove expired artifacts, then enforce the size cap. Returns count removed."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for info in self._list():
+                if self._expired(info, now):
+                    self.delete(info['id'])
+                    removed += 1
+            # Leftovers of interrupted writes (content without metadata)
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                artifact_id = name[:-4] if name.endswith('.tmp') else name
+                if not ARTIFACT_ID_RE.match(artifact_id) or os.path.exists(self._meta_path(artifact_id)):
+                    continue
+                try:
+                    if os.path.getmtime(path) + self.ttl_sec < now:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed + self.enforce_quota()
+
+    def enforce_quota(self, keep=None):
+        """Evict the oldest artifacts (except `keep`) until under max_bytes."""
+        removed = 0
+        with self._lock:
+            artifacts = sorted(self._list(), key=lambda info: info['created'])
+            total = sum(info['size'] for info in artifacts)
+            for info in artifacts:
+                if total <= self.max_bytes:
+                    break
+                if info['id'] == keep:
+                    continue
+                self.delete(info['id'])
+                total -= info['size']
+                removed += 1
+        if removed:
+            print(f"Artifact store: evicted {removed} oldest artifact(s) (size cap {self.max_bytes} bytes)")
+        return removed
+
+    def start_sweeper(self):
+        """
+        Run sweep() every sweep_interval seconds in a daemon thread. Safe to
+        call again after a fork (threads do not survive it) - the child then
+        starts its own sweeper.
+        """
+        if self._sweeper is not None and self._sweeper_pid == os.getpid():
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Warning: Artifact sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=loop, name='artifact-sweeper', daemon=True)
+        self._sweeper_pid = os.getpid()
+        self._sweeper.start()
+
+    def stats(self):
+        artifacts = self._list()
+        return {'count': len(artifacts), 'bytes': sum(info['size'] for info in artifacts)}
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _meta_path(self, artifact_id):
+        return os.path.join(self.root, f"{artifact_id}.json")
+
+    def _expired(self, info, now):
+        return info['created'] + self.ttl_sec < now
+
+    def _list(self):
+        """Metadata of all artifacts on disk (unreadable entries skipped)."""
+        artifacts = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.json') or not ARTIFACT_ID_RE.match(name[:-5]):
+                continue
+            try:
+                with open(os.path.join(self.root, name), encoding='utf-8') as f:
+                    artifacts.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return artifacts
@@ -6,37 +6,43 @@ Bad Respondents Detector v2.0
 - Straight-lining detection from questionnaire batteries
 """
 
-import pyreadstat
-import pandas as pd
 import numpy as np
 import re
 import os
+import sys
+import importlib.util
+import time
+import tracemalloc
+from contextlib import contextmanager
 from datetime import datetime
 from difflib import SequenceMatcher
 
-# Import questionnaire parser
-try:
-    from questionnaire_parser import parse_questionnaire
-except ImportError:
-    parse_questionnaire = None
+# pandas, pyreadstat (via sav_cache) and the gibberish model are imported
+# inside the functions that use them, so `--help` and argument errors of
+# the CLI do not pay for loading them
 
 
 # =============================================================================
 # OPEN-ENDED ANSWER QUALITY SCORING (NEW v2.0)
 # =============================================================================
 
-def answer_quality_score(text):
+def answer_quality_score(text, gibberish=None):
     """
     Score an open-ended answer from 0 (worst) to 1 (best).
     
+    gibberish: precomputed verdict of the trigram model (gibberish.py) for
+    this text; computed here when None. Batch callers should use
+    answer_quality_scores() instead.
+    
     NOTE: Scoring is primarily LENGTH-BASED. This is a conscious trade-off:
     short but meaningful answers (e.g. "Protože je drahá.") may score lower
     than expected. That's why 'medium_risk' category exists as "review" not
-    "auto-delete". Future improvement: add Claude API call for content
-    relevance assessment.
+    "auto-delete". Content relevance is scored separately (relevance.py):
+    answers similar to their question text earn a bonus on the respondent's
+    adjusted score (threshold open_relevance_weight).
     
     Score tiers:
-    0.0 - 0.05: Gibberish, filler characters
+    0.0 - 0.05: Gibberish (consonant clusters, keyboard mashes), filler characters
     0.1:         Explicit non-answers (nevím, nic, nwm...)
     0.2:         Single word answer
     0.3:         Two word answer  
@@ -44,6 +50,8 @@ def answer_quality_score(text):
     0.65:        5-8 word answer
     0.8+:        Substantial answer (9+ words)
     """
+    import pandas as pd
+
     if pd.isna(text) or str(text).strip() == '':
         return 0.0
     
@@ -80,6 +88,13 @@ def answer_quality_score(text):
     if t_lower in non_answers:
         return 0.1
     
+    # --- Level 0.05: Gibberish (improbable letter sequences, e.g. "asdasd fgfg") ---
+    if gibberish is None:
+        from gibberish import gibberish_mask
+        gibberish = bool(gibberish_mask([t])[0])
+    if gibberish:
+        return 0.05
+    
     # --- Level 0.2: Single word ---
     if word_count == 1:
         return 0.2
@@ -104,6 +119,20 @@ def answer_quality_score(text):
     return min(1.0, 0.85 + (word_count - 15) * 0.01)
 
 
+def answer_quality_scores(texts):
+    """
+    answer_quality_score() of many answers at once: {stripped text: score}.
+    
+    Duplicates are scored once and the gibberish model runs in one
+    vectorized pass over all unique answers.
+    """
+    from gibberish import gibberish_mask
+
+    unique = list(dict.fromkeys(str(t).strip() for t in texts))
+    flags = gibberish_mask(unique)
+    return {text: answer_quality_score(text, bool(flag)) for text, flag in zip(unique, flags)}
+
+
 def cross_question_similarity(answers):
     """
     Check if answers are suspiciously similar across questions.
@@ -148,21 +177,28 @@ def cross_question_similarity(answers):
     return 0
 
 
-def classify_open_ended_quality(scores_list, similarity_penalty):
+def classify_open_ended_quality(scores_list, similarity_penalty, relevance=0.0, thresholds=None):
     """
-    Classify respondent based on their average open-ended quality score.
+    Classify respondent based on their open-ended answer scores, the same
+    way apply_thresholds() does (open_adjusted_scores() against the
+    open_high_risk / open_medium_risk thresholds).
     
     Returns: 'high_risk', 'medium_risk', or 'ok'
     """
     if not scores_list:
         return 'ok'
     
-    avg_score = sum(scores_list) / len(scores_list)
-    adjusted_score = avg_score - similarity_penalty
+    t = resolve_thresholds(thresholds)
+    raw = {
+        'open_avg': np.array([sum(scores_list) / len(scores_list)]),
+        'open_penalty': np.array([similarity_penalty]),
+        'open_relevance': np.array([relevance]),
+    }
+    adjusted_score = open_adjusted_scores(raw, t)[0]
     
-    if adjusted_score <= 0.2:
+    if adjusted_score <= t['open_high_risk']:
         return 'high_risk'
-    elif adjusted_score <= 0.35:
+    elif adjusted_score <= t['open_medium_risk']:
         return 'medium_risk'
     else:
         return 'ok'
@@ -182,11 +218,15 @@ def is_suspicious_answer(text):
 # =============================================================================
 
 def find_variable_names(df, q_code):
-    """Find matching variable names in DataFrame for a question code."""
+    """
+    Find matching variable names in DataFrame for a question code.
+    Also accepts a plain list of column names (e.g. from SAV metadata).
+    """
+    columns = df.columns if hasattr(df, 'columns') else df
     q_code_clean = q_code.replace('.', '').strip()
     matches = []
     
-    for col in df.columns:
+    for col in columns:
         if col.upper() == f'Q{q_code_clean}'.upper():
             matches.append(col)
         elif col.upper() == f'QQ{q_code_clean}'.upper():
@@ -197,7 +237,7 @@ def find_variable_names(df, q_code):
             matches.append(col)
     
     if not matches:
-        for col in df.columns:
+        for col in columns:
             if q_code_clean.upper() in col.upper():
                 matches.append(col)
     
@@ -222,11 +262,116 @@ def find_id_column(df):
     return df.columns[0]
 
 
+# Smallest integer types for coded answers: (numpy type, nullable pandas type)
+INT_DTYPES = [(np.int8, 'Int8'), (np.int16, 'Int16'), (np.int32, 'Int32')]
+
+def compact_string_dtype():
+    """
+    Arrow-backed string dtype, much more compact than Python str objects;
+    None without pyarrow (text columns then keep their type, categories
+    still apply).
+    """
+    import pandas as pd
+
+    return pd.StringDtype('pyarrow') if importlib.util.find_spec('pyarrow') else None
+
+
+def optimize_dtypes(df, meta=None):
+    """
+    Shrink a freshly loaded SAV DataFrame in place of its float64/str columns.
+    
+    - whole-number numeric columns (coded answers, scales) become int8/int16/
+      int32; the range covers observed values and the codes in
+      meta.variable_value_labels. Columns with missing values use the
+      nullable Int8/Int16/Int32 types.
+    - text columns with many repeated values become categorical, the rest
+      a compact (Arrow) string dtype when pyarrow is installed.
+    
+    Returns (df, {'before_bytes': ..., 'after_bytes': ...}).
+    """
+    import pandas as pd
+
+    string_dtype = compact_string_dtype()
+    before = int(df.memory_usage(deep=True).sum())
+    value_labels = getattr(meta, 'variable_value_labels', None) or {}
+    
+    for col in df.columns:
+        series = df[col]
+        if series.dtype.kind == 'f':
+            values = series.to_numpy()
+            observed = values[~np.isnan(values)]
+            if observed.size and not (np.all(np.isfinite(observed)) and np.all(observed == np.round(observed))):
+                continue  # Real decimals (e.g. durations) stay float64
+            bounds = [float(k) for k in value_labels.get(col, {}) if isinstance(k, (int, float))]
+            if observed.size:
+                bounds += [observed.min(), observed.max()]
+            low, high = min(bounds, default=0), max(bounds, default=0)
+            for numpy_type, nullable_type in INT_DTYPES:
+                info = np.iinfo(numpy_type)
+                if info.min <= low and high <= info.max:
+                    df[col] = series.astype(nullable_type if observed.size < len(values) else numpy_type)
+                    break
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+            if series.nunique(dropna=False) <= len(series) // 2:
+                df[col] = series.astype('category')
+            elif string_dtype is not None:
+                df[col] = series.astype(string_dtype)
+    
+    after = int(df.memory_usage(deep=True).sum())
+    return df, {'before_bytes': before, 'after_bytes': after}
+
+
+# Peak memory of an analysis relative to the loaded columns (decode buffers,
+# detector temporaries, results) - measured on synthetic exports
+ANALYSIS_MEMORY_FACTOR = 3
+
+# Python str overhead per text cell as loaded by pyreadstat
+STRING_CELL_OVERHEAD = 49
+
+
+def estimate_analysis_memory(sav_file, structure=None, detectors=None, cache_dir=None):
+    """
+    Rough peak memory of analyze_with_questionnaire() on sav_file, from the
+    SAV header only (metadataonly read, no data rows).
+
+    Returns {'rows', 'columns', 'bytes'}.
+    """
+    from detectors import DEFAULT_DETECTORS, select_pipeline_columns
+    from sav_cache import read_sav_metadata
+
+    meta = read_sav_metadata(sav_file, cache_dir=cache_dir)
+    usecols = select_pipeline_columns(meta.column_names, meta, structure,
+                                      DEFAULT_DETECTORS if detectors is None else detectors)
+    widths = meta.variable_storage_width or {}
+    row_bytes = 0
+    for col in usecols:
+        if meta.readstat_variable_types.get(col) == 'string':
+            row_bytes += STRING_CELL_OVERHEAD + widths.get(col, 8)
+        else:
+            row_bytes += 8
+
+    rows = meta.number_rows
+    if rows is None or rows < 0:
+        # Row count missing in the header - bound it by the file size
+        file_row_bytes = sum(widths.get(col, 8) for col in meta.column_names) or 8
+        rows = os.path.getsize(sav_file) // file_row_bytes
+
+    return {
+        'rows': int(rows),
+        'columns': len(usecols),
+        'bytes': int(rows * row_bytes * ANALYSIS_MEMORY_FACTOR),
+    }
+
+
 def parse_duration_to_seconds(duration_val):
     """Parse duration value to seconds (handles various formats).
     Supports: H:MM:SS, H:MM:SS.ms, numeric seconds, Czech decimal comma.
     Logs a warning if parsing fails so user knows why speeders may be missing.
     """
+    import pandas as pd
+
     if pd.isna(duration_val):
         return None
     
@@ -264,288 +409,327 @@ def parse_duration_to_seconds(duration_val):
     return None
 
 
-# =============================================================================
-# MAIN ANALYSIS FUNCTION
-# =============================================================================
+def current_rss_bytes():
+    """Resident set size of this process (Linux /proc), or None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
 
-def analyze_with_questionnaire(sav_file, docx_file=None):
+def peak_rss_bytes():
+    """Highest RSS this process ever had, or None."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KB
+
+
+class StageStats:
     """
-    Main analysis function. Reads SAV file and optionally a DOCX questionnaire.
-    
-    Returns:
-        results: dict with all detection results
-        df: the DataFrame
+    Wall time and memory of each analysis stage.
+    
+    Per stage: elapsed_sec, rss_bytes at the end, rss_peak_growth_bytes (how
+    much the stage raised the process RSS high-water mark) and, while
+    tracemalloc is tracing (e.g. PYTHONTRACEMALLOC=1), traced_peak_bytes -
+    how far the traced heap (Python objects and numpy buffers) rose above its
+    level at the start of the stage. Memory figures are process-wide,
+    so concurrent analyses blur them.
     """
-    print("=" * 80)
-    print("BAD RESPONDENTS DETECTOR v2.0")
-    print("=" * 80)
-    
-    # Read SAV file
-    df, meta = pyreadstat.read_sav(sav_file)
-    print(f"\nData: {len(df)} respondents, {len(df.columns)} variables")
-    
-    # Find ID column
-    id_column = find_id_column(df)
-    print(f"ID column: {id_column}")
-    
-    # Initialize results
-    results = {
-        'total_respondents': len(df),
-        'id_column': id_column,
-        'speeders': [],
-        'suspicious_open': [],
-        'suspicious_open_medium': [],  # NEW: medium risk open-ended
-        'straight_liners': [],
-        'risk_groups': {
-            'all_three': [],
-            'speeders_open': [],
-            'speeders_straight': [],
-            'open_straight': [],
-            'speeders_only': [],
-            'open_only': [],
-            'straight_only': []
-        },
-        'recommendations': {
-            'high_risk': [],
-            'medium_risk': [],
-            'low_risk': []
-        },
-        'all_bad': [],
-        'open_ended_scores': {},  # NEW: per-respondent scoring details
-    }
     
-    # Parse questionnaire if provided
-    structure = None
-    if docx_file and parse_questionnaire:
+    def __init__(self):
+        self.stages = []
+    
+    @contextmanager
+    def track(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        peak_before = peak_rss_bytes()
+        started = time.perf_counter()
         try:
-            structure = parse_questionnaire(docx_file)
-            print(f"Questionnaire parsed: {len(structure.get('open_questions', []))} open Qs, "
-                  f"{len(structure.get('batteries', []))} batteries")
-        except Exception as e:
-            print(f"Warning: Could not parse questionnaire: {e}")
-    
-    # =========================================================================
-    # 1. SPEEDERS DETECTION
-    # =========================================================================
-    print(f"\n1. SPEEDERS DETECTION")
-    
-    duration_col = None
-    for col_name in ['duration', 'Duration', 'DURATION', 'interview_length']:
-        if col_name in df.columns:
-            duration_col = col_name
-            break
-    
-    if duration_col:
-        durations_sec = []
-        for val in df[duration_col]:
-            sec = parse_duration_to_seconds(val)
-            if sec is not None:
-                durations_sec.append(sec)
-            else:
-                durations_sec.append(None)
-        
-        df['_duration_sec'] = durations_sec
-        valid_durations = [d for d in durations_sec if d is not None and d > 0]
-        
-        if valid_durations:
-            median_duration = np.median(valid_durations)
-            # Threshold: less than 1/3 of median
-            speeder_threshold = median_duration / 3
-            
-            results['speeder_threshold_sec'] = round(speeder_threshold)
-            results['speeder_threshold_min'] = round(speeder_threshold / 60, 1)
-            
-            print(f"   Median duration: {median_duration:.0f}s ({median_duration/60:.1f} min)")
-            print(f"   Speeder threshold: < {speeder_threshold:.0f}s ({speeder_threshold/60:.1f} min)")
-            
-            for idx, row in df.iterrows():
-                dur = row.get('_duration_sec')
-                if dur is not None and dur < speeder_threshold:
-                    results['speeders'].append(row[id_column])
-            
-            print(f"   Speeders found: {len(results['speeders'])}")
-        else:
-            print(f"   No valid duration data found")
-    else:
-        print(f"   No duration column found")
-    
-    # =========================================================================
-    # 2. OPEN-ENDED ANSWER QUALITY (NEW SCORING APPROACH v2.0)
-    # =========================================================================
-    print(f"\n2. OPEN-ENDED ANSWER QUALITY (scoring v2.0)")
-    
-    all_open_cols = []
-    
-    if structure and structure.get('open_questions'):
-        open_questions = structure['open_questions']
-        print(f"   From questionnaire: {len(open_questions)} open questions")
-        for q in open_questions:
-            print(f"   - {q['code']}: {q['text'][:60]}...")
-            cols = find_variable_names(df, q['code'])
-            all_open_cols.extend(cols)
-    
-    # Fallback: find text columns heuristically
-    if not all_open_cols:
-        system_cols = {'start', 'end', 'duration', 'RespondentFinishedOnQuestion', 
-                       'ExternalId', 'ReferralCode', 'QuestionaryUserId', 'email', 
-                       'UserPanelId', '_duration_sec'}
-        for col in df.columns:
-            if (df[col].dtype == 'object' 
-                and col not in system_cols 
-                and not col.startswith('User')
-                and not col.endswith('_jina')):  # Skip "jiné" text fields
-                # Check if it's actually an open-ended (has varied content, not coded)
-                non_null = df[col].dropna()
-                if len(non_null) > 0:
-                    avg_len = non_null.str.len().mean()
-                    if avg_len > 3:  # More than just codes
-                        all_open_cols.append(col)
-        print(f"   Heuristic detection: {len(all_open_cols)} text columns")
-    
-    if all_open_cols:
-        # Deduplicate
-        all_open_cols = list(dict.fromkeys(all_open_cols))
-        print(f"   Analyzing {len(all_open_cols)} open-ended columns: {all_open_cols}")
-        
-        for idx, row in df.iterrows():
-            resp_id = row[id_column]
-            answers = []
-            scores = []
-            
-            for col in all_open_cols:
-                val = row[col]
-                if pd.notna(val) and str(val).strip() != '':
-                    answers.append(str(val).strip())
-                    scores.append(answer_quality_score(val))
-            
-            if not scores:
-                continue
-            
-            # Calculate similarity penalty
-            sim_penalty = cross_question_similarity(answers)
-            
-            # Classify
-            avg_score = sum(scores) / len(scores)
-            adjusted_score = avg_score - sim_penalty
-            
-            # Store detailed scores
-            results['open_ended_scores'][resp_id] = {
-                'avg_score': round(avg_score, 2),
-                'similarity_penalty': round(sim_penalty, 2),
-                'adjusted_score': round(adjusted_score, 2),
-                'individual_scores': [round(s, 2) for s in scores],
-                'answers': answers
+            yield
+        finally:
+            entry = {
+                'stage': name,
+                'elapsed_sec': round(time.perf_counter() - started, 3),
+                'rss_bytes': current_rss_bytes(),
             }
-            
-            classification = classify_open_ended_quality(scores, sim_penalty)
-            
-            if classification == 'high_risk':
-                results['suspicious_open'].append(resp_id)
-            elif classification == 'medium_risk':
-                results['suspicious_open_medium'].append(resp_id)
-        
-        print(f"   High risk (score ≤ 0.2): {len(results['suspicious_open'])} respondents")
-        print(f"   Medium risk (score ≤ 0.35): {len(results['suspicious_open_medium'])} respondents")
-    else:
-        print(f"   No open-ended columns found")
-    
-    # =========================================================================
-    # 3. STRAIGHT-LINING IN BATTERIES
-    # =========================================================================
-    print(f"\n3. STRAIGHT-LINING DETECTION")
-    
-    battery_groups = []
-    
-    if structure and structure.get('batteries'):
-        for bat in structure['batteries']:
-            q_code = bat['code']
-            items = bat.get('items', [])
-            cols = find_variable_names(df, q_code)
-            
-            if len(cols) >= 4:  # Only check batteries with 4+ items
-                battery_groups.append({
-                    'code': q_code,
-                    'columns': cols,
-                    'item_count': len(cols)
-                })
-                print(f"   Battery {q_code}: {len(cols)} items")
-    
-    # Fallback: detect batteries by column naming pattern (QXX__1, QXX__2, ...)
-    if not battery_groups:
-        col_groups = {}
-        for col in df.columns:
-            match = re.match(r'(Q+\w+?)__(\d+)$', col)
-            if match:
-                base = match.group(1)
-                if base not in col_groups:
-                    col_groups[base] = []
-                col_groups[base].append(col)
-        
-        for base, cols in col_groups.items():
-            if len(cols) >= 4:
-                # Check if numeric (not text)
-                sample = df[cols[0]].dropna()
-                if len(sample) > 0 and sample.dtype != 'object':
-                    # IMPORTANT: Exclude binary/multi-select questions (0/1 or 1/2 values)
-                    # These are checkbox questions, not rating scales
-                    all_vals = set()
-                    for col in cols:
-                        try:
-                            all_vals.update(df[col].dropna().astype(float).unique())
-                        except:
-                            pass
-                    
-                    is_binary = all_vals <= {0.0, 1.0, 2.0}
-                    if is_binary:
-                        continue  # Skip multi-select questions
-                    
-                    battery_groups.append({
-                        'code': base,
-                        'columns': sorted(cols),
-                        'item_count': len(cols)
-                    })
-        
-        if battery_groups:
-            print(f"   Heuristic detection: {len(battery_groups)} rating batteries (excluding multi-select)")
-            for bg in battery_groups:
-                print(f"   - {bg['code']}: {bg['item_count']} items")
+            peak_after = peak_rss_bytes()
+            if peak_before is not None and peak_after is not None:
+                entry['rss_peak_growth_bytes'] = peak_after - peak_before
+            if tracing:
+                entry['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1] - traced_before
+            self.stages.append(entry)
+    
+    def format(self):
+        parts = []
+        for entry in self.stages:
+            text = f"{entry['stage']} {entry['elapsed_sec']:.2f}s"
+            if 'traced_peak_bytes' in entry:
+                text += f" (peak {entry['traced_peak_bytes'] / 1e6:.1f} MB)"
+            elif entry.get('rss_peak_growth_bytes'):
+                text += f" (RSS +{entry['rss_peak_growth_bytes'] / 1e6:.1f} MB)"
+            parts.append(text)
+        return ', '.join(parts)
+
+
+# =============================================================================
+# THRESHOLDS & RISK COMBINATION
+# =============================================================================
+
+DEFAULT_THRESHOLDS = {
+    'speeder_ratio': 1 / 3,         # speeder: duration < median * ratio
+    'speeder_min_segment_size': 30, # segments with fewer valid durations use the global median
+    'open_high_risk': 0.2,          # open-ended high risk: adjusted score <= value
+    'open_medium_risk': 0.35,       # open-ended medium risk: adjusted score <= value
+    'open_relevance_weight': 0.2,   # bonus = weight * relevance of answers to the question (relevance.py)
+    'straight_min_batteries': 2,    # straight-liner: straight-lining in N+ batteries
+    'page_speeder_ratio': 1 / 3,    # fast page: page time < page median * ratio
+    'page_speeder_share': 0.5,      # page speeder: fast on this share of timed pages
+    # Extra battery flags (None = off). A battery hitting any enabled flag
+    # counts like a straight-lined one towards straight_min_batteries.
+    'battery_longest_run_min': None,    # N+ identical answers in a row
+    'battery_sd_max': None,             # standard deviation of answers <= value
+    'battery_midpoint_share_min': None, # share of scale-midpoint answers >= value
+    'battery_pattern_min': None,        # share of zig-zag or diagonal steps >= value
+}
+
+OPTIONAL_THRESHOLDS = {name for name, value in DEFAULT_THRESHOLDS.items() if value is None}
+
+
+def resolve_thresholds(overrides=None):
+    """
+    Merge threshold overrides into DEFAULT_THRESHOLDS.
+    Raises ValueError for unknown names or out-of-range values.
+    """
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for name, value in (overrides or {}).items():
+        if name not in DEFAULT_THRESHOLDS:
+            raise ValueError(f"Unknown threshold: {name}")
+        if value is None and name in OPTIONAL_THRESHOLDS:
+            thresholds[name] = None
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Threshold {name} must be a number")
+        if not np.isfinite(value):
+            raise ValueError(f"Threshold {name} must be a finite number")
+        thresholds[name] = value
+    
+    if not 0 < thresholds['speeder_ratio'] <= 1:
+        raise ValueError("speeder_ratio must be in (0, 1]")
+    if thresholds['open_high_risk'] > thresholds['open_medium_risk']:
+        raise ValueError("open_high_risk must not be greater than open_medium_risk")
+    if not 0 <= thresholds['open_relevance_weight'] <= 1:
+        raise ValueError("open_relevance_weight must be in [0, 1]")
+    if thresholds['speeder_min_segment_size'] < 1 or not float(thresholds['speeder_min_segment_size']).is_integer():
+        raise ValueError("speeder_min_segment_size must be a whole number >= 1")
+    thresholds['speeder_min_segment_size'] = int(thresholds['speeder_min_segment_size'])
+    for name in ('page_speeder_ratio', 'page_speeder_share'):
+        if not 0 < thresholds[name] <= 1:
+            raise ValueError(f"{name} must be in (0, 1]")
+    if thresholds['straight_min_batteries'] < 1 or not float(thresholds['straight_min_batteries']).is_integer():
+        raise ValueError("straight_min_batteries must be a whole number >= 1")
+    thresholds['straight_min_batteries'] = int(thresholds['straight_min_batteries'])
+    
+    longest_run = thresholds['battery_longest_run_min']
+    if longest_run is not None:
+        if longest_run < 2 or not float(longest_run).is_integer():
+            raise ValueError("battery_longest_run_min must be a whole number >= 2")
+        thresholds['battery_longest_run_min'] = int(longest_run)
+    if thresholds['battery_sd_max'] is not None and thresholds['battery_sd_max'] < 0:
+        raise ValueError("battery_sd_max must not be negative")
+    for name in ('battery_midpoint_share_min', 'battery_pattern_min'):
+        if thresholds[name] is not None and not 0 < thresholds[name] <= 1:
+            raise ValueError(f"{name} must be in (0, 1]")
+    
+    return thresholds
+
+
+def speeder_reference(durations, segments=None, min_segment_size=1):
+    """
+    Median duration each respondent is compared with.
     
-    results['battery_length'] = max([bg['item_count'] for bg in battery_groups]) if battery_groups else 0
+    durations: seconds (NaN / <= 0 = invalid). segments: optional integer
+    segment code per respondent (-1 = no segment). Respondents in a segment
+    with at least min_segment_size valid durations get the segment median
+    (one groupby-transform pass), everybody else the global median.
+    Returns (reference per respondent, global median or None).
+    """
+    valid = np.where(durations > 0, durations, np.nan)
+    if not np.any(valid > 0):
+        return np.full(len(durations), np.nan), None
+    global_median = float(np.nanmedian(valid))
+    reference = np.full(len(durations), global_median)
+    if segments is None:
+        return reference, global_median
+    
+    import pandas as pd
+
+    grouped = pd.Series(valid).groupby(segments)
+    segment_median = grouped.transform('median').to_numpy()
+    segment_size = grouped.transform('count').to_numpy()
+    own = (segments >= 0) & (segment_size >= min_segment_size)
+    reference[own] = segment_median[own]
+    return reference, global_median
+
+
+def page_speeder_mask(raw, thresholds):
+    """
+    Respondents who were fast (time < page median * page_speeder_ratio) on
+    at least page_speeder_share of their timed pages. All False when no
+    per-page timing is available.
+    """
+    ratios = raw.get('page_time_ratio')
+    if ratios is None or not ratios.size:
+        return np.zeros(len(raw['ids']), dtype=bool)
     
-    if battery_groups:
-        straight_line_counts = {}
-        
-        for bg in battery_groups:
-            cols = bg['columns']
-            if len(cols) < 4:
-                continue
-            
-            for idx, row in df.iterrows():
-                resp_id = row[id_column]
-                values = [row[col] for col in cols if pd.notna(row[col])]
-                
-                if len(values) >= 4 and len(set(values)) == 1:
-                    if resp_id not in straight_line_counts:
-                        straight_line_counts[resp_id] = 0
-                    straight_line_counts[resp_id] += 1
-        
-        # Threshold: For short batteries (4-5 items), require straight-lining in 2+ batteries
-        # For longer batteries (6+ items), 1 is enough
-        # This reduces false positives from 4-item batteries where random agreement is common
-        min_batteries_threshold = 2
-        
-        for resp_id, count in straight_line_counts.items():
-            if count >= min_batteries_threshold:
-                results['straight_liners'].append(resp_id)
-        
-        print(f"   Straight-liners found: {len(results['straight_liners'])} (threshold: {min_batteries_threshold}+ batteries)")
-    else:
-        print(f"   No batteries found for straight-lining check")
+    timed = (~np.isnan(ratios)).sum(axis=1)
+    fast = (ratios < thresholds['page_speeder_ratio']).sum(axis=1)
+    return (timed > 0) & (fast >= thresholds['page_speeder_share'] * timed)
+
+
+def open_adjusted_scores(raw, thresholds):
+    """
+    Per respondent: average open-ended score minus the cross-question
+    similarity penalty plus the relevance bonus (NaN = no open answers).
+    """
+    adjusted = raw['open_avg'] - raw['open_penalty']
+    relevance = raw.get('open_relevance')
+    if relevance is not None and thresholds['open_relevance_weight']:
+        adjusted = adjusted + thresholds['open_relevance_weight'] * relevance
+    return adjusted
+
+
+def count_flagged_batteries(raw, thresholds):
+    """
+    Per respondent: batteries that are straight-lined or hit one of the
+    enabled extra battery flags. Falls back to raw['straight_count'] when
+    no per-battery metrics are available.
+    """
+    if 'battery_straight' not in raw:
+        return raw['straight_count']
+    
+    t = thresholds
+    flagged = raw['battery_straight'].copy()
+    # NaN metrics (battery not answered) compare False - never flagged
+    if t['battery_longest_run_min'] is not None:
+        flagged |= raw['battery_longest_run'] >= t['battery_longest_run_min']
+    if t['battery_sd_max'] is not None:
+        flagged |= raw['battery_sd'] <= t['battery_sd_max']
+    if t['battery_midpoint_share_min'] is not None:
+        flagged |= raw['battery_midpoint_share'] >= t['battery_midpoint_share_min']
+    if t['battery_pattern_min'] is not None:
+        pattern = np.fmax(raw['battery_alternating'], raw['battery_diagonal'])
+        flagged |= pattern >= t['battery_pattern_min']
+    return flagged.sum(axis=1)
+
+
+def apply_thresholds(results, thresholds=None):
+    """
+    Classify respondents from the raw per-respondent metrics in
+    results['raw_metrics'] and rebuild risk groups and recommendations.
     
-    # =========================================================================
-    # 4. COMBINE RESULTS & RISK CLASSIFICATION
-    # =========================================================================
-    print(f"\n4. COMBINING RESULTS")
+    Vectorized and independent of the SAV file, so re-thresholding a stored
+    analysis takes milliseconds. Returns a new results dict; the input is
+    left untouched.
+    """
+    raw = results['raw_metrics']
+    ids = raw['ids']
+    t = resolve_thresholds(thresholds)
+    
+    new = dict(results)
+    new['thresholds'] = t
+    for key in ('median_duration_sec', 'speeder_threshold_sec', 'speeder_threshold_min'):
+        new.pop(key, None)
+    
+    # Speeders: duration below a fraction of the median of valid durations -
+    # of the respondent's segment when segments are set (see speeder_reference)
+    durations = raw['duration_sec']
+    segments = raw.get('segment')
+    reference, median_duration = speeder_reference(durations, segments, t['speeder_min_segment_size'])
+    speeder_mask = durations < reference * t['speeder_ratio']
+    if median_duration is not None:
+        speeder_threshold = median_duration * t['speeder_ratio']
+        new['median_duration_sec'] = round(median_duration)
+        new['speeder_threshold_sec'] = round(speeder_threshold)
+        new['speeder_threshold_min'] = round(speeder_threshold / 60, 1)
+    new['raw_metrics'] = dict(raw, duration_reference_sec=reference)
+    if segments is not None:
+        new['speeder_segments'] = segment_summary(results['segment_labels'], segments, durations,
+                                                  reference, t)
+    
+    # Page-level speeders join the speeders group
+    page_mask = page_speeder_mask(raw, t)
+    new['page_speeders'] = [ids[i] for i in np.flatnonzero(page_mask)]
+    speeder_mask = speeder_mask | page_mask
+    
+    # Open-ended: average score minus cross-question similarity penalty plus
+    # relevance bonus (NaN = respondent without any open answer, never flagged)
+    adjusted = open_adjusted_scores(raw, t)
+    open_high_mask = adjusted <= t['open_high_risk']
+    open_medium_mask = ~open_high_mask & (adjusted <= t['open_medium_risk'])
+    
+    straight_mask = count_flagged_batteries(raw, t) >= t['straight_min_batteries']
+    
+    new['speeders'] = [ids[i] for i in np.flatnonzero(speeder_mask)]
+    new['suspicious_open'] = [ids[i] for i in np.flatnonzero(open_high_mask)]
+    new['suspicious_open_medium'] = [ids[i] for i in np.flatnonzero(open_medium_mask)]
+    new['straight_liners'] = [ids[i] for i in np.flatnonzero(straight_mask)]
+    
+    combine_results(new)
+    if new.get('sample'):
+        new['sample'] = dict(new['sample'], estimates=sample_estimates(new))
+    return new
+
+
+def segment_summary(labels, segments, durations, reference, thresholds):
+    """Per segment: respondents, reference median, threshold, global fallback."""
+    positions = np.flatnonzero(segments >= 0)
+    codes = segments[positions]
+    respondents = np.bincount(codes, minlength=len(labels))
+    valid_counts = np.bincount(codes, weights=durations[positions] > 0, minlength=len(labels))
+    # Reference of one respondent per segment (the same for all its members)
+    member = np.full(len(labels), -1)
+    member[codes] = positions
+    
+    summary = []
+    for code, label in enumerate(labels):
+        if member[code] < 0 or np.isnan(reference[member[code]]):
+            continue
+        median = float(reference[member[code]])
+        summary.append({
+            'segment': label,
+            'respondents': int(respondents[code]),
+            'median_sec': round(median),
+            'threshold_sec': round(median * thresholds['speeder_ratio']),
+            'global_fallback': bool(valid_counts[code] < thresholds['speeder_min_segment_size']),
+        })
+    return summary
+
+
+def combine_results(results):
+    """Fill risk_groups, recommendations and all_bad from the detector lists."""
+    results['risk_groups'] = {
+        'all_three': [],
+        'speeders_open': [],
+        'speeders_straight': [],
+        'open_straight': [],
+        'speeders_only': [],
+        'open_only': [],
+        'straight_only': []
+    }
+    results['recommendations'] = {
+        'high_risk': [],
+        'medium_risk': [],
+        'low_risk': []
+    }
     
     speeders_set = set(results['speeders'])
     # Combine high and medium risk open-ended for the "suspicious_open" used in risk groups
@@ -588,19 +772,197 @@ def analyze_with_questionnaire(sav_file, docx_file=None):
             results['recommendations']['low_risk'].append(resp_id)
     
     results['all_bad'] = list(all_flagged)
-    
-    # Summary
+
+
+def load_questionnaire(docx_file):
+    """
+    Parsed questionnaire structure, or None when it cannot be read (the
+    analysis then falls back to heuristics). Imported lazily - mammoth /
+    python-docx are only needed when there is a questionnaire to read.
+    """
+    try:
+        from questionnaire_parser import parse_questionnaire
+        structure = parse_questionnaire(docx_file)
+    except Exception as e:
+        print(f"Warning: Could not parse questionnaire: {e}")
+        return None
+    print(f"Questionnaire parsed: {len(structure.get('open_questions', []))} open Qs, "
+          f"{len(structure.get('batteries', []))} batteries")
+    return structure
+
+
+def empty_results(total_respondents, id_column, memory=None, sample=None):
+    """The results structure before the detectors fill it in."""
+    return {
+        'total_respondents': total_respondents,
+        'id_column': id_column,
+        'speeders': [],
+        'suspicious_open': [],
+        'suspicious_open_medium': [],  # NEW: medium risk open-ended
+        'straight_liners': [],
+        'risk_groups': {
+            'all_three': [],
+            'speeders_open': [],
+            'speeders_straight': [],
+            'open_straight': [],
+            'speeders_only': [],
+            'open_only': [],
+            'straight_only': []
+        },
+        'recommendations': {
+            'high_risk': [],
+            'medium_risk': [],
+            'low_risk': []
+        },
+        'all_bad': [],
+        'open_ended_scores': {},  # NEW: per-respondent scoring details
+        'battery_length': 0,
+        'memory': memory,
+        'sample': sample,
+    }
+
+
+def print_summary(results, stages):
+    """Print the closing summary block of an analysis log."""
+    sample = results.get('sample')
     print(f"\n{'=' * 80}")
     print(f"SUMMARY:")
     print(f"  Total respondents: {results['total_respondents']}")
     print(f"  Speeders: {len(results['speeders'])}")
+    if results.get('page_speeders'):
+        print(f"    (page-level speeders: {len(results['page_speeders'])})")
     print(f"  Open-ended high risk: {len(results['suspicious_open'])}")
     print(f"  Open-ended medium risk: {len(results['suspicious_open_medium'])}")
     print(f"  Straight-liners: {len(results['straight_liners'])}")
     print(f"  Total flagged: {len(results['all_bad'])}")
     print(f"  HIGH RISK (recommend delete): {len(results['recommendations']['high_risk'])}")
     print(f"  MEDIUM RISK (consider delete): {len(results['recommendations']['medium_risk'])}")
+    if sample:
+        bad = sample['estimates']['all_bad']
+        print(f"  PREVIEW: {sample['rows']} of {sample['total_rows']} respondents - estimated bad rate "
+              f"{bad['rate']:.1%} (95% CI {bad['ci_low']:.1%}-{bad['ci_high']:.1%})")
+    print(f"  Stages: {stages.format()}")
     print(f"{'=' * 80}")
+
+
+# =============================================================================
+# MAIN ANALYSIS FUNCTION
+# =============================================================================
+
+def analyze_with_questionnaire(sav_file, docx_file=None, cache_dir=None, thresholds=None,
+                               detectors=None, progress=None, optimize_memory=True, segment_by=None,
+                               detector_workers=None, sample_rows=None, sample_mode='strided',
+                               sample_seed=None):
+    """
+    Main analysis function. Reads SAV file and optionally a DOCX questionnaire.
+    
+    cache_dir: optional columnar SAV cache (see sav_cache.py); defaults to
+    the BRD_CACHE_DIR environment variable, no caching when unset.
+    thresholds: optional overrides of DEFAULT_THRESHOLDS.
+    detectors: detector set to run (see detectors.py), default DEFAULT_DETECTORS.
+    progress: optional callback progress(stage, status, done=None, total=None),
+    called when each stage starts/finishes and with row progress inside the
+    per-respondent loops (status 'progress', done/total rows).
+    optimize_memory: downcast columns right after loading (optimize_dtypes).
+    segment_by: optional column (routing variable, quota cell, ...) - speeders
+    are then judged against the median duration of their segment.
+    detector_workers: threads for the detectors (default: one per detector;
+    1 runs them in the calling thread, e.g. for profiling).
+    sample_rows: preview mode - analyze only about this many rows, read in
+    blocks spread over the file (sample_mode 'strided' or 'random', see
+    sav_cache.sample_blocks). results['sample'] then holds the estimated
+    rates with confidence intervals (sample_estimates).
+    
+    Returns:
+        results: dict with all detection results
+        df: the DataFrame (only the columns the detectors needed)
+    """
+    # Imported here - detectors.py builds on the helpers in this module
+    from detectors import DEFAULT_DETECTORS, report_progress, run_detectors, select_analysis_columns
+    from sav_cache import read_sav_cached, read_sav_metadata, read_sav_sample
+    
+    print("=" * 80)
+    print("BAD RESPONDENTS DETECTOR v2.0")
+    print("=" * 80)
+    
+    thresholds = resolve_thresholds(thresholds)
+    detectors = DEFAULT_DETECTORS if detectors is None else detectors
+    ctx = {'thresholds': thresholds, 'progress': progress, 'segment_by': segment_by}
+    stages = StageStats()
+    
+    # Parse questionnaire if provided
+    structure = None
+    if docx_file:
+        report_progress(ctx, 'questionnaire', 'started')
+        with stages.track('questionnaire'):
+            structure = load_questionnaire(docx_file)
+        report_progress(ctx, 'questionnaire', 'finished')
+    
+    # Read only the columns the detectors asked for (decided from metadata),
+    # from the columnar cache when enabled
+    report_progress(ctx, 'load', 'started')
+    with stages.track('load'):
+        meta = read_sav_metadata(sav_file, cache_dir=cache_dir)
+        total_columns = meta.number_columns
+        usecols = select_analysis_columns(meta, structure, detectors, segment_by)
+        total_rows = meta.number_rows
+        sample = None
+        if sample_rows and total_rows and sample_rows < total_rows:
+            df, meta = read_sav_sample(sav_file, sample_rows, usecols=usecols, cache_dir=cache_dir,
+                                       mode=sample_mode, seed=sample_seed)
+            sample = {'rows': len(df), 'total_rows': total_rows, 'mode': sample_mode}
+        else:
+            df, meta = read_sav_cached(sav_file, usecols=usecols, cache_dir=cache_dir)
+    print(f"\nData: {len(df)} respondents, {len(df.columns)} of {total_columns} variables loaded"
+          + (f" (preview sample of {total_rows}, {sample_mode})" if sample else ""))
+    report_progress(ctx, 'load', 'finished', len(df), len(df))
+    
+    # Compact dtypes (int8 codes, categories, Arrow strings) - detectors
+    # work on them directly
+    memory = None
+    if optimize_memory:
+        report_progress(ctx, 'optimize', 'started')
+        with stages.track('optimize'):
+            df, memory = optimize_dtypes(df, meta)
+        saved = 1 - memory['after_bytes'] / memory['before_bytes'] if memory['before_bytes'] else 0
+        print(f"Memory: {memory['before_bytes'] / 1e6:.1f} MB → {memory['after_bytes'] / 1e6:.1f} MB "
+              f"({saved:.0%} saved)")
+        report_progress(ctx, 'optimize', 'finished')
+    
+    # Find ID column
+    id_column = find_id_column(df)
+    print(f"ID column: {id_column}")
+    
+    # Initialize results
+    results = empty_results(len(df), id_column, memory=memory, sample=sample)
+    
+    # =========================================================================
+    # 1.-3. DETECTORS (speeders, open-ended quality, straight-lining)
+    # =========================================================================
+    ctx.update({
+        'id_column': id_column,
+        'structure': structure,
+        'meta': meta,
+    })
+    with stages.track('detectors'):
+        raw, detector_results = run_detectors(df, ctx, detectors, max_workers=detector_workers)
+    results.update(detector_results)
+    
+    # =========================================================================
+    # 4. COMBINE RESULTS & RISK CLASSIFICATION
+    # =========================================================================
+    print(f"\n{len(detectors) + 1}. COMBINING RESULTS")
+    report_progress(ctx, 'combine', 'started')
+    
+    # Raw metrics stay in results so the analysis can be re-thresholded
+    # later (apply_thresholds) without reading the SAV file again
+    with stages.track('combine'):
+        results['raw_metrics'] = raw
+        results = apply_thresholds(results, thresholds)
+    report_progress(ctx, 'combine', 'finished')
+    results['stages'] = stages.stages
+    
+    print_summary(results, stages)
     
     return results, df
 
@@ -654,3 +1016,528 @@ def generate_spss_syntax(results, id_column='ExternalId', output_file=None):
         print(f"\nSyntax saved to: {output_file}")
     
     return syntax
+
+
+# =============================================================================
+# RESULT SUMMARY (shared by the API response and the command line tool)
+# =============================================================================
+
+def summarize_results(results):
+    """Build the compact, JSON-serializable summary of an analysis (counts only)."""
+    return {
+        'total_respondents': results['total_respondents'],
+        'battery_length': results.get('battery_length', 'N/A'),
+        'id_column': results['id_column'],
+        'speeders': {
+            'count': len(results['speeders']),
+            'threshold_sec': results.get('speeder_threshold_sec', 0),
+            'threshold_min': results.get('speeder_threshold_min', 0),
+            'page_count': len(results.get('page_speeders', [])),
+            'segment_column': results.get('segment_column'),
+            'segments': len(results.get('speeder_segments', [])),
+            'segments_global_fallback': sum(1 for seg in results.get('speeder_segments', [])
+                                            if seg['global_fallback'])
+        },
+        'suspicious_open': {
+            'count': len(results['suspicious_open']) + len(results.get('suspicious_open_medium', [])),
+            'high_risk_count': len(results['suspicious_open']),
+            'medium_risk_count': len(results.get('suspicious_open_medium', []))
+        },
+        'straight_liners': {
+            'count': len(results['straight_liners'])
+        },
+        'risk_groups': {
+            'all_three': len(results['risk_groups']['all_three']),
+            'speeders_open': len(results['risk_groups']['speeders_open']),
+            'speeders_straight': len(results['risk_groups']['speeders_straight']),
+            'open_straight': len(results['risk_groups']['open_straight']),
+            'speeders_only': len(results['risk_groups']['speeders_only']),
+            'open_only': len(results['risk_groups']['open_only']),
+            'straight_only': len(results['risk_groups']['straight_only'])
+        },
+        'recommendations': {
+            'high_risk': len(results['recommendations']['high_risk']),
+            'medium_risk': len(results['recommendations']['medium_risk']),
+            'low_risk': len(results['recommendations']['low_risk'])
+        },
+        'total_bad': len(results['all_bad']),
+        'thresholds': results.get('thresholds', DEFAULT_THRESHOLDS),
+        'memory': results.get('memory'),
+        'stages': results.get('stages', []),
+        'sample': results.get('sample')
+    }
+
+
+# =============================================================================
+# SAMPLED PREVIEW
+# =============================================================================
+
+SAMPLE_Z = 1.96  # 95 % confidence
+
+
+def wilson_interval(count, n, population=None, z=SAMPLE_Z):
+    """
+    Wilson score interval for a proportion count/n. When the sample is a
+    large part of `population`, the finite population correction enters as
+    the effective sample size n * (N - 1) / (N - n); a sample of the whole
+    population gives the observed proportion exactly.
+    """
+    if n <= 0:
+        return 0.0, 1.0
+    p = count / n
+    if population and population > 1:
+        if n >= population:
+            return p, p
+        n = n * (population - 1) / (population - n)
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def sample_estimates(results):
+    """
+    Estimated rates of a preview run: for every detector list and risk tier
+    the sample count, rate, 95 % confidence interval and the projected count
+    in the whole file. Rows are read in blocks, so the interval is slightly
+    optimistic when neighbouring respondents are alike.
+    """
+    sample = results['sample']
+    n, population = sample['rows'], sample['total_rows']
+    counts = {
+        'speeders': len(results['speeders']),
+        'page_speeders': len(results.get('page_speeders', [])),
+        'suspicious_open': len(results['suspicious_open']),
+        'suspicious_open_medium': len(results['suspicious_open_medium']),
+        'straight_liners': len(results['straight_liners']),
+        'high_risk': len(results['recommendations']['high_risk']),
+        'medium_risk': len(results['recommendations']['medium_risk']),
+        'all_bad': len(results['all_bad']),
+    }
+    estimates = {}
+    for key, count in counts.items():
+        low, high = wilson_interval(count, n, population)
+        estimates[key] = {
+            'count': count,
+            'rate': round(count / n, 4) if n else 0.0,
+            'ci_low': round(float(low), 4),
+            'ci_high': round(float(high), 4),
+            'estimated_total': round(count / n * population) if n else 0,
+        }
+    return estimates
+
+
+# =============================================================================
+# PER-RESPONDENT DETAIL (paginated API)
+# =============================================================================
+
+# Detector filter names -> results list holding the flagged IDs
+DETAIL_DETECTORS = {
+    'speeders': 'speeders',
+    'page_speeders': 'page_speeders',
+    'open_high': 'suspicious_open',
+    'open_medium': 'suspicious_open_medium',
+    'straight_liners': 'straight_liners',
+}
+
+RISK_TIERS = ('high', 'medium', 'low', 'ok')
+
+
+def respondent_table(results):
+    """
+    Column-wise per-respondent view of an analysis (row order of the SAV
+    file): id, risk tier, one flag array per detector and the key metrics.
+    Built once per analysis; query_respondents() filters it with masks.
+    """
+    raw = results['raw_metrics']
+    ids = raw['ids']
+    n = len(ids)
+    
+    table = {'id': np.array(ids, dtype=object)}
+    for name, key in DETAIL_DETECTORS.items():
+        flagged = set(results.get(key, []))
+        table[name] = np.fromiter((resp_id in flagged for resp_id in ids), dtype=bool, count=n)
+    
+    risk = np.full(n, 'ok', dtype=object)
+    for tier in ('low', 'medium', 'high'):
+        tier_ids = set(results['recommendations'][f'{tier}_risk'])
+        risk[np.fromiter((resp_id in tier_ids for resp_id in ids), dtype=bool, count=n)] = tier
+    table['risk'] = risk
+    
+    table['duration_sec'] = raw['duration_sec']
+    table['duration_reference_sec'] = raw.get('duration_reference_sec', np.full(n, np.nan))
+    thresholds = results.get('thresholds') or resolve_thresholds()
+    table['open_score'] = open_adjusted_scores(raw, thresholds)
+    table['flagged_batteries'] = count_flagged_batteries(raw, thresholds)
+    return table
+
+
+def _parse_choices(value, allowed, label):
+    if not value:
+        return None
+    choices = [v.strip() for v in value.split(',') if v.strip()]
+    unknown = [v for v in choices if v not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown {label}: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return choices
+
+
+def _float_or_none(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def query_respondents(results, table, risk=None, detector=None, min_score=None, max_score=None,
+                      page=1, page_size=50, max_page_size=500):
+    """
+    One page of flagged/filtered respondents.
+    
+    risk / detector: comma-separated lists (any of); min_score / max_score
+    bound the adjusted open-ended score (respondents without open answers
+    are excluded by a score filter). Raises ValueError for bad parameters.
+    Returns {'total', 'page', 'page_size', 'pages', 'respondents'}.
+    """
+    risks = _parse_choices(risk, RISK_TIERS, 'risk tier')
+    detectors = _parse_choices(detector, list(DETAIL_DETECTORS), 'detector')
+    try:
+        page = int(page)
+        page_size = int(page_size)
+        min_score = None if min_score in (None, '') else float(min_score)
+        max_score = None if max_score in (None, '') else float(max_score)
+    except (TypeError, ValueError):
+        raise ValueError("page, page_size, min_score and max_score must be numbers")
+    if page < 1 or not 1 <= page_size <= max_page_size:
+        raise ValueError(f"page must be >= 1 and page_size between 1 and {max_page_size}")
+    
+    mask = np.ones(len(table['id']), dtype=bool)
+    if risks:
+        mask &= np.isin(table['risk'], risks)
+    if detectors:
+        mask &= np.logical_or.reduce([table[name] for name in detectors])
+    if min_score is not None:
+        mask &= table['open_score'] >= min_score
+    if max_score is not None:
+        mask &= table['open_score'] <= max_score
+    
+    positions = np.flatnonzero(mask)
+    total = int(positions.size)
+    page_positions = positions[(page - 1) * page_size:page * page_size]
+    
+    open_scores = results.get('open_ended_scores', {})
+    respondents = []
+    for pos in page_positions:
+        resp_id = table['id'][pos]
+        open_detail = open_scores.get(resp_id)
+        respondents.append({
+            'id': resp_id,
+            'risk': table['risk'][pos],
+            'flags': [name for name in DETAIL_DETECTORS if table[name][pos]],
+            'duration_sec': _float_or_none(table['duration_sec'][pos]),
+            'duration_reference_sec': _float_or_none(table['duration_reference_sec'][pos]),
+            'open_score': _float_or_none(round(table['open_score'][pos], 2)),
+            'flagged_batteries': int(table['flagged_batteries'][pos]),
+            'open_answers': open_detail['answers'] if open_detail else [],
+            'open_answer_scores': open_detail['individual_scores'] if open_detail else [],
+            'open_relevance': open_detail.get('relevance') if open_detail else None,
+        })
+    
+    return {
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'pages': (total + page_size - 1) // page_size,
+        'respondents': respondents,
+    }
+
+
+# =============================================================================
+# COMMAND LINE INTERFACE (python -m bad_respondents_detector)
+# =============================================================================
+
+SUMMARY_CSV_FIELDS = [
+    'file', 'status', 'error', 'elapsed_sec', 'total_respondents', 'id_column',
+    'speeders', 'open_high_risk', 'open_medium_risk', 'straight_liners',
+    'total_bad', 'high_risk', 'medium_risk', 'low_risk', 'syntax_file', 'export_file',
+]
+
+
+def collect_sav_files(inputs, recursive=False):
+    """Expand files, directories and glob patterns into a sorted list of SAV/ZSAV paths."""
+    import glob
+
+    found = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in ('*.sav', '*.zsav'):
+                pattern = os.path.join(item, '**', name) if recursive else os.path.join(item, name)
+                found.extend(glob.glob(pattern, recursive=recursive))
+        elif glob.has_magic(item):
+            found.extend(glob.glob(item, recursive=recursive))
+        else:
+            found.append(item)
+    
+    # Directories/globs on case-insensitive exports may contain .SAV too
+    return sorted(dict.fromkeys(p for p in found if p.lower().endswith(('.sav', '.zsav'))))
+
+
+def output_names(sav_files):
+    """
+    Output base name of each SAV file: its stem, with a _2, _3, ... suffix
+    when several files share it (wave1/data.sav, wave2/data.sav), so their
+    outputs in one output directory do not overwrite each other. Compared
+    case-insensitively (data.sav and DATA.zsav collide on some filesystems).
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in sav_files]
+    taken = {stem.lower() for stem in stems}
+    seen = set()
+    names = []
+    for path, stem in zip(sav_files, stems):
+        name = stem
+        if stem.lower() in seen:
+            number = 2
+            while f"{stem}_{number}".lower() in taken:
+                number += 1
+            name = f"{stem}_{number}"
+            taken.add(name.lower())
+            print(f"Warning: output name {stem} is used by an earlier file; "
+                  f"writing {path} as {name}", file=sys.stderr)
+        seen.add(stem.lower())
+        names.append(name)
+    return names
+
+
+def _json_default(value):
+    """json.dump fallback for numpy scalars left in results."""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _process_sav_file(sav_path, docx_path, output_dir, verbose=False, cache_dir=None, thresholds=None,
+                      segment_by=None, sharding=None, export=None, name=None):
+    """
+    Analyze one SAV file and write its syntax + JSON summary into output_dir.
+    name: base name of the outputs (default: the SAV file name, see
+    output_names).
+    Runs inside a worker process, so it never raises - failures are returned.
+    sharding: optional keyword arguments of sharding.analyze_sharded - the
+    file is then split into row ranges processed by shard workers.
+    export: optional format ('csv' / 'parquet') of a per-respondent table
+    written next to the syntax (see respondent_export.py).
+    """
+    import contextlib
+    import io
+    import json
+    import time
+    from spss_syntax_unified import generate_spss_syntax_unified
+
+    stem = name or os.path.splitext(os.path.basename(sav_path))[0]
+    syntax_path = os.path.join(output_dir, f"{stem}.sps")
+    summary_path = os.path.join(output_dir, f"{stem}.json")
+    record = {
+        'file': sav_path,
+        'questionnaire': docx_path,
+        'status': 'ok',
+        'error': None,
+        'syntax_file': syntax_path,
+        'export_file': None,
+    }
+    
+    started = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            if sharding:
+                from sharding import analyze_sharded
+                results = analyze_sharded(sav_path, docx_path, cache_dir=cache_dir, thresholds=thresholds,
+                                          segment_by=segment_by, verbose=verbose, **sharding)
+            else:
+                results, df = analyze_with_questionnaire(sav_path, docx_path, cache_dir=cache_dir,
+                                                         thresholds=thresholds, segment_by=segment_by)
+            generate_spss_syntax_unified(results, id_column=results['id_column'], output_file=syntax_path)
+            if export:
+                from respondent_export import write_export
+                export_path = os.path.join(output_dir, f"{stem}_respondents.{export}")
+                write_export(results, export_path, export)
+                record['export_file'] = export_path
+        record['summary'] = summarize_results(results)
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+        record['syntax_file'] = None
+        record['export_file'] = None
+    record['elapsed_sec'] = round(time.perf_counter() - started, 2)
+    
+    try:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2, default=_json_default)
+    except OSError as e:
+        record['status'] = 'error'
+        record['error'] = f"Could not write summary: {e}"
+    
+    return record
+
+
+def _summary_csv_row(record):
+    """Flatten a per-file record into one row of summary.csv."""
+    row = {key: record.get(key)
+           for key in ('file', 'status', 'error', 'elapsed_sec', 'syntax_file', 'export_file')}
+    summary = record.get('summary')
+    if summary:
+        row.update({
+            'total_respondents': summary['total_respondents'],
+            'id_column': summary['id_column'],
+            'speeders': summary['speeders']['count'],
+            'open_high_risk': summary['suspicious_open']['high_risk_count'],
+            'open_medium_risk': summary['suspicious_open']['medium_risk_count'],
+            'straight_liners': summary['straight_liners']['count'],
+            'total_bad': summary['total_bad'],
+            'high_risk': summary['recommendations']['high_risk'],
+            'medium_risk': summary['recommendations']['medium_risk'],
+            'low_risk': summary['recommendations']['low_risk'],
+        })
+    return row
+
+
+def main(argv=None):
+    """
+    Batch entry point: analyze every SAV file found in the inputs.
+    
+    Exit status: 0 = all files OK, 1 = at least one file failed,
+    2 = bad arguments / no SAV files found.
+    """
+    import argparse
+    import csv
+
+    parser = argparse.ArgumentParser(
+        prog='python -m bad_respondents_detector',
+        description='Batch detection of bad respondents in SAV files (no web server needed).'
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='SAV files, directories or glob patterns (e.g. "data/*.sav")')
+    parser.add_argument('-q', '--questionnaire',
+                        help='DOCX questionnaire used for all files. Without it, a DOCX with '
+                             'the same name next to each SAV file is used when present.')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='Directory for .sps syntax files and summaries (default: current dir)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='Search directories recursively')
+    parser.add_argument('--cache-dir',
+                        help='Columnar SAV cache for fast re-runs (default: $BRD_CACHE_DIR, off if unset)')
+    parser.add_argument('-t', '--threshold', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a detection threshold, e.g. -t battery_longest_run_min=5 '
+                             f"(repeatable; names: {', '.join(DEFAULT_THRESHOLDS)})")
+    parser.add_argument('--segment-by', metavar='COLUMN',
+                        help='Judge speeders against the median of their segment (routing variable, '
+                             'quota cell, RespondentFinishedOnQuestion, ...)')
+    parser.add_argument('--shards', type=int, metavar='N',
+                        help='Split each file into N row ranges analyzed by --jobs shard workers '
+                             '(files are then processed one after another)')
+    parser.add_argument('--listen', metavar='HOST:PORT',
+                        help='With --shards: also serve shards to workers on other hosts '
+                             '(python sharding.py --connect HOST:PORT, same $BRD_SHARD_AUTHKEY)')
+    parser.add_argument('--export', choices=('csv', 'parquet'),
+                        help='Also write a per-respondent table of flags and scores '
+                             '(<name>_respondents.csv / .parquet; parquet needs pyarrow)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Print the full analysis log of every file')
+    args = parser.parse_args(argv)
+    
+    if args.questionnaire and not os.path.isfile(args.questionnaire):
+        parser.error(f"questionnaire not found: {args.questionnaire}")
+    
+    thresholds = {}
+    for item in args.threshold:
+        name, sep, value = item.partition('=')
+        if not sep:
+            parser.error(f"threshold must be NAME=VALUE: {item}")
+        thresholds[name.strip()] = None if value.strip().lower() in ('', 'none', 'off') else value
+    try:
+        resolve_thresholds(thresholds)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.export == 'parquet':
+        from respondent_export import parquet_available
+        if not parquet_available():
+            parser.error("--export parquet needs pyarrow (pip install pyarrow)")
+    
+    sharding = None
+    if args.shards is not None or args.listen:
+        if args.shards is not None and args.shards < 1:
+            parser.error("--shards must be at least 1")
+        sharding = {'shards': args.shards, 'workers': max(0, args.jobs)}
+        if args.listen:
+            from sharding import AUTHKEY_ENV, parse_address
+            if not os.environ.get(AUTHKEY_ENV):
+                parser.error(f"--listen needs a shared secret in ${AUTHKEY_ENV}")
+            try:
+                sharding['listen'] = parse_address(args.listen)
+            except ValueError as e:
+                parser.error(str(e))
+    
+    sav_files = collect_sav_files(args.inputs, recursive=args.recursive)
+    if not sav_files:
+        print("No SAV files found.", file=sys.stderr)
+        return 2
+    
+    os.makedirs(args.output_dir, exist_ok=True)
+    
+    tasks = []
+    for sav_path, name in zip(sav_files, output_names(sav_files)):
+        docx_path = args.questionnaire
+        if not docx_path:
+            candidate = os.path.splitext(sav_path)[0] + '.docx'
+            docx_path = candidate if os.path.isfile(candidate) else None
+        tasks.append((sav_path, docx_path, args.output_dir, args.verbose, args.cache_dir, thresholds,
+                      args.segment_by, sharding, args.export, name))
+    
+    # Sharded files use the workers for their shards - one file at a time
+    jobs = 1 if sharding else max(1, min(args.jobs, len(tasks)))
+    print(f"Processing {len(tasks)} SAV file(s) with {jobs} worker(s)...")
+    
+    records = []
+    
+    def report(record):
+        records.append(record)
+        if record['status'] == 'ok':
+            summary = record['summary']
+            print(f"  ✓ {record['file']}: {summary['total_bad']} flagged / "
+                  f"{summary['total_respondents']} ({record['elapsed_sec']}s)")
+        else:
+            print(f"  ✗ {record['file']}: {record['error']}", file=sys.stderr)
+    
+    if jobs == 1:
+        # No pool - avoids process start-up cost for single files
+        for task in tasks:
+            report(_process_sav_file(*task))
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(_process_sav_file, *task): task[0] for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    report(future.result())
+                except Exception as e:
+                    # Worker crashed (e.g. killed by the OOM killer)
+                    report({'file': futures[future], 'status': 'error',
+                            'error': f"Worker failed: {e}", 'syntax_file': None})
+    
+    records.sort(key=lambda r: r['file'])
+    summary_csv = os.path.join(args.output_dir, 'summary.csv')
+    with open(summary_csv, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(_summary_csv_row(record))
+    
+    failed = [r for r in records if r['status'] != 'ok']
+    print(f"Done: {len(records) - len(failed)} OK, {len(failed)} failed. Summary: {summary_csv}")
+    
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
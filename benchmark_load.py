@@ -0,0 +1,371 @@
+"""
+HTTP load test of the analysis API.
+
+Starts app.py (Flask development server) or gunicorn locally - or targets a
+running server - and replays a mix of synthetic SAV + DOCX uploads
+(POST /api/analyze, waiting for the result) at each concurrency level.
+Reports throughput, p50/p95/p99 latency, error rate and the peak RSS of the
+server process tree, so worker classes and counts can be compared.
+
+Usage:
+    python benchmark_load.py                                  # Flask, concurrency 1,2,4
+    python benchmark_load.py --server gunicorn --workers 4 --worker-class gthread --threads 4
+    python benchmark_load.py --mix 2000:3,20000:1 --concurrency 1,4,8 --requests 40
+    python benchmark_load.py --url http://127.0.0.1:5000 --output load.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyreadstat
+
+from synthetic import make_survey, write_questionnaire
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MIX = '2000:3,20000:1'
+DEFAULT_CONCURRENCY = '1,2,4'
+DEFAULT_REQUESTS = 20
+STARTUP_TIMEOUT_SEC = 60
+REQUEST_TIMEOUT_SEC = 600
+RSS_SAMPLE_SEC = 0.2
+
+
+# =============================================================================
+# SYNTHETIC UPLOADS
+# =============================================================================
+
+def parse_mix(text):
+    """'2000:3,20000:1' -> [(2000, 3.0), (20000, 1.0)] (rows: relative weight)."""
+    mix = []
+    for item in text.split(','):
+        rows, _, weight = item.strip().partition(':')
+        mix.append((int(rows), float(weight or 1)))
+    if not mix or any(rows < 10 or weight <= 0 for rows, weight in mix):
+        raise ValueError(f"Invalid mix: {text}")
+    return mix
+
+
+def prepare_uploads(directory, mix, variants):
+    """
+    `variants` different SAV files per size (different seeds). Concurrent
+    requests never send identical files - the server would attach them to
+    one job instead of running them.
+    """
+    docx_path = os.path.join(directory, 'questionnaire.docx')
+    write_questionnaire(docx_path)
+    uploads = {}
+    for rows, _ in mix:
+        uploads[rows] = queue.Queue()
+        for variant in range(variants):
+            sav_path = os.path.join(directory, f'survey_{rows}_{variant}.sav')
+            pyreadstat.write_sav(make_survey(rows, seed=variant), sav_path)
+            uploads[rows].put(sav_path)
+    return uploads, docx_path
+
+
+def multipart_body(files):
+    """(body, content type) of a multipart/form-data request with files {field: path}."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for field, path in files.items():
+        with open(path, 'rb') as f:
+            content = f.read()
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                     f'filename="{os.path.basename(path)}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# =============================================================================
+# SERVER UNDER TEST
+# =============================================================================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port, work_dir, log_file):
+    env = dict(os.environ, PORT=str(port))
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-w', str(args.workers),
+                   '-k', args.worker_class, '--threads', str(args.threads),
+                   '--timeout', str(REQUEST_TIMEOUT_SEC), 'app:app']
+        if args.workers > 1 and not env.get('STATE_DIR'):
+            # Jobs, results and downloads shared by the workers, as in production
+            env['STATE_DIR'] = os.path.join(work_dir, 'state')
+    else:
+        command = [sys.executable, 'app.py']
+    return subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url, process=None, timeout=STARTUP_TIMEOUT_SEC):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f'{url}/health', timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} not ready within {timeout}s")
+
+
+def process_tree_rss(pid):
+    """RSS in bytes of pid and all its descendants (Linux /proc), or None."""
+    children = {}
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return None
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # ppid is the 2nd field after the parenthesized command name
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """Samples the server's RSS in a background thread; peak per measurement window."""
+
+    def __init__(self, pid, interval=RSS_SAMPLE_SEC):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reset(self):
+        self.peak = process_tree_rss(self.pid) if self.pid else None
+
+    def start(self):
+        if not self.pid:
+            return
+        self.reset()
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                rss = process_tree_rss(self.pid)
+                if rss is not None:
+                    self.peak = max(self.peak or 0, rss)
+
+        self._thread = threading.Thread(target=loop, name='rss-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# =============================================================================
+# LOAD
+# =============================================================================
+
+def post_upload(url, sav_path, docx_path, timeout=REQUEST_TIMEOUT_SEC):
+    """One synchronous analysis. Returns (ok, latency seconds, error label or None)."""
+    body, content_type = multipart_body({'sav_file': sav_path, 'docx_file': docx_path})
+    request = urllib.request.Request(f'{url}/api/analyze', data=body, method='POST',
+                                     headers={'Content-Type': content_type})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.loads(response.read())
+        error = None if payload.get('success') else 'success=false'
+    except urllib.error.HTTPError as e:
+        error = f'HTTP {e.code}'
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        error = type(getattr(e, 'reason', e)).__name__
+    return error is None, time.perf_counter() - started, error
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def run_level(url, uploads, docx_path, schedule, concurrency, sampler, timeout):
+    """Send the scheduled uploads with `concurrency` clients. Returns the level report."""
+    def one(rows):
+        sav_path = uploads[rows].get()
+        try:
+            return (rows,) + post_upload(url, sav_path, docx_path, timeout)
+        finally:
+            uploads[rows].put(sav_path)
+
+    sampler.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, schedule))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for _, ok, latency, _ in outcomes if ok]
+    errors = {}
+    for _, ok, _, error in outcomes:
+        if not ok:
+            errors[error] = errors.get(error, 0) + 1
+    by_size = {}
+    for rows in sorted(set(schedule)):
+        size_latencies = [latency for r, ok, latency, _ in outcomes if ok and r == rows]
+        by_size[rows] = {'requests': sum(1 for r in schedule if r == rows),
+                         'p50_sec': percentile(size_latencies, 50)}
+    return {
+        'concurrency': concurrency,
+        'requests': len(outcomes),
+        'ok': len(latencies),
+        'error_rate': round(1 - len(latencies) / len(outcomes), 4) if outcomes else 0,
+        'errors': errors,
+        'elapsed_sec': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'p50_sec': percentile(latencies, 50),
+        'p95_sec': percentile(latencies, 95),
+        'p99_sec': percentile(latencies, 99),
+        'server_rss_peak_bytes': sampler.peak,
+        'by_size': by_size,
+    }
+
+
+def print_report(levels):
+    print(f"\n{'=' * 80}")
+    print(f"{'conc':>5} {'reqs':>5} {'err%':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'RSS MB':>8}")
+    for level in levels:
+        rss = level['server_rss_peak_bytes']
+
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+
+        print(f"{level['concurrency']:>5} {level['requests']:>5} {level['error_rate'] * 100:>6.1f} "
+              f"{fmt(level['throughput_rps'], '7.2f'):>7} {fmt(level['p50_sec'], '7.2f'):>7} "
+              f"{fmt(level['p95_sec'], '7.2f'):>7} {fmt(level['p99_sec'], '7.2f'):>7} "
+              f"{fmt(rss / 1e6 if rss else None, '8.0f'):>8}")
+        if level['errors']:
+            print(f"      errors: {level['errors']}")
+    print(f"{'=' * 80}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the analysis API with synthetic uploads.")
+    parser.add_argument('--url', help="Test a running server instead of starting one (no RSS unless --pid)")
+    parser.add_argument('--pid', type=int, help="With --url: server process whose RSS to sample")
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='flask',
+                        help="Server to start (default: flask = python app.py)")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers (default: 2)")
+    parser.add_argument('--worker-class', default='sync', help="gunicorn worker class (default: sync)")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker (default: 1)")
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help=f"Upload sizes as ROWS:WEIGHT,... (default: {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY,
+                        help=f"Comma-separated concurrency levels (default: {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS,
+                        help=f"Requests per level (default: {DEFAULT_REQUESTS})")
+    parser.add_argument('--warmup', type=int, default=1, help="Unmeasured requests before the first level")
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT_SEC, help="Per-request timeout (s)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the request order")
+    parser.add_argument('--output', help="Write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+        levels = [int(level) for level in args.concurrency.split(',')]
+    except ValueError as e:
+        parser.error(str(e))
+    if any(level < 1 for level in levels) or args.requests < 1:
+        parser.error("concurrency levels and --requests must be at least 1")
+
+    rng = np.random.default_rng(args.seed)
+    sizes = np.array([rows for rows, _ in mix])
+    weights = np.array([weight for _, weight in mix])
+    weights = weights / weights.sum()
+
+    with tempfile.TemporaryDirectory(prefix='brd_load_') as work_dir:
+        print(f"Generating uploads ({args.mix}, {max(levels)} variant(s) per size)...")
+        uploads, docx_path = prepare_uploads(work_dir, mix, max(levels))
+
+        process = None
+        log_path = os.path.join(work_dir, 'server.log')
+        with open(log_path, 'wb') as log_file:
+            try:
+                if args.url:
+                    url, pid = args.url.rstrip('/'), args.pid
+                    wait_ready(url)
+                else:
+                    port = free_port()
+                    url = f'http://127.0.0.1:{port}'
+                    process = start_server(args, port, work_dir, log_file)
+                    pid = process.pid
+                    started = time.perf_counter()
+                    wait_ready(url, process)
+                    print(f"Server ({args.server}) ready in {time.perf_counter() - started:.1f}s at {url}")
+
+                sampler = RssSampler(pid)
+                sampler.start()
+                for _ in range(args.warmup):
+                    post_upload(url, uploads[mix[0][0]].queue[0], docx_path, args.timeout)
+
+                report = []
+                for concurrency in levels:
+                    schedule = [int(rows) for rows in rng.choice(sizes, size=args.requests, p=weights)]
+                    print(f"Concurrency {concurrency}: {len(schedule)} request(s)...")
+                    report.append(run_level(url, uploads, docx_path, schedule, concurrency, sampler, args.timeout))
+                sampler.stop()
+            except RuntimeError as e:
+                print(f"✗ {e}", file=sys.stderr)
+                log_file.flush()
+                with open(log_path, 'rb') as f:
+                    print(f.read().decode('utf-8', 'replace')[-3000:], file=sys.stderr)
+                return 1
+            finally:
+                if process is not None:
+                    process.terminate()
+                    try:
+                        process.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+
+    print_report(report)
+    if args.output:
+        setup = {key: getattr(args, key) for key in ('url', 'server', 'workers', 'worker_class', 'threads',
+                                                      'mix', 'requests', 'seed')}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'setup': setup, 'levels': report}, f, indent=2)
+            f.write('\n')
+        print(f"Report written: {args.output}")
+    return 0 if all(level['ok'] for level in report) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
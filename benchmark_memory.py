@@ -0,0 +1,102 @@
+"""
+Memory regression benchmark.
+
+Generates a reference synthetic survey, analyzes it with tracemalloc running
+and compares the peak traced memory per respondent against the committed
+baseline (benchmark_baseline.json). Exits with status 1 when the value
+regressed by more than the tolerance.
+
+Usage:
+    python benchmark_memory.py                  # check against the baseline
+    python benchmark_memory.py --tolerance 0.2  # allow +20 %
+    python benchmark_memory.py --update         # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import pyreadstat
+
+from bad_respondents_detector import analyze_with_questionnaire
+from synthetic import make_survey
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_ROWS = 20_000
+DEFAULT_TOLERANCE = 0.10
+
+
+def measure(rows):
+    """Run the analysis on the reference dataset; returns the measurement dict."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sav_path = os.path.join(tmp, 'benchmark.sav')
+        pyreadstat.write_sav(make_survey(rows), sav_path)
+
+        tracemalloc.start()
+        try:
+            results, _ = analyze_with_questionnaire(sav_path)
+        finally:
+            tracemalloc.stop()
+
+    stages = results['stages']
+    peak = max(stage['traced_peak_bytes'] for stage in stages)
+    return {
+        'rows': rows,
+        'peak_traced_bytes': peak,
+        'bytes_per_respondent': round(peak / rows, 1),
+        'stages': {stage['stage']: stage['traced_peak_bytes'] for stage in stages},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory per respondent regression check.")
+    parser.add_argument('--rows', type=int, default=None,
+                        help=f"Respondents in the reference dataset (default: baseline's, else {DEFAULT_ROWS})")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help=f"Allowed relative growth (default: baseline's, else {DEFAULT_TOLERANCE})")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument('--update', action='store_true', help="Write the measurement as the new baseline")
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    rows = args.rows or (baseline or {}).get('rows', DEFAULT_ROWS)
+    tolerance = args.tolerance if args.tolerance is not None else (baseline or {}).get('tolerance', DEFAULT_TOLERANCE)
+
+    current = measure(rows)
+    print(f"\n{'=' * 80}")
+    print(f"MEMORY BENCHMARK ({rows} respondents)")
+    for stage, nbytes in current['stages'].items():
+        print(f"  {stage:<14} peak {nbytes / 1e6:8.1f} MB")
+    print(f"  bytes/respondent: {current['bytes_per_respondent']:.0f}")
+
+    if args.update:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(dict(current, tolerance=tolerance), f, indent=2)
+            f.write('\n')
+        print(f"Baseline written: {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"No baseline at {args.baseline} - run with --update first")
+        return 1
+    if baseline.get('rows') != rows:
+        print(f"Warning: baseline was measured on {baseline.get('rows')} rows, not {rows}")
+
+    limit = baseline['bytes_per_respondent'] * (1 + tolerance)
+    change = current['bytes_per_respondent'] / baseline['bytes_per_respondent'] - 1
+    print(f"  baseline: {baseline['bytes_per_respondent']:.0f} ({change:+.1%}, limit +{tolerance:.0%})")
+    if current['bytes_per_respondent'] > limit:
+        print("FAIL: peak memory per respondent regressed")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
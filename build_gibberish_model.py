@@ -0,0 +1,221 @@
+"""
+Build gibberish_trigrams.npy - the character-trigram model used by gibberish.py.
+
+The corpus below is ordinary Czech and English prose plus typical survey
+answers. The table holds interpolated log P(c3 | c1 c2) over the folded
+alphabet, stored as float16 (27^3 entries, ~40 KB).
+
+Usage:
+    python build_gibberish_model.py [--output gibberish_trigrams.npy] [--corpus extra.txt ...]
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from gibberish import ALPHABET_SIZE, MODEL_FILE, encode, fold_text, trigram_ids
+
+BACKOFF = 10.0
+
+CORPUS_CS = """
+Produkt se mi líbí, protože je kvalitní a cena odpovídá tomu, co za ni dostanu.
+Nejvíce oceňuji rychlé doručení a příjemný přístup zákaznické podpory.
+Nelíbí se mi, že balení je zbytečně velké a obal se špatně otevírá.
+Chuť je výborná, ale cena je na můj vkus trochu vyšší než u konkurence.
+Obchod navštěvuji pravidelně, většinou jednou týdně, hlavně kvůli čerstvému pečivu.
+Zlepšil bych otevírací dobu, o víkendu je prodejna zavřená příliš brzy.
+Personál byl ochotný a poradil mi s výběrem, takže jsem odcházel spokojený.
+Aplikace je přehledná, jen by mohla rychleji načítat a méně často padat.
+Reklama mě zaujala hudbou a vtipným příběhem, ale nepamatuji si značku.
+Značku znám od dětství, rodiče ji kupovali a mám s ní dobré zkušenosti.
+Doporučil bych ji známým, protože za tu cenu nic lepšího na trhu není.
+Kvalita se v posledních letech zhoršila a výrobek už nevydrží tak dlouho.
+Chtěla bych, aby nabídka obsahovala více zdravých a veganských variant.
+Služba funguje spolehlivě, nikdy jsem neměl problém s platbou ani s objednávkou.
+Ceny energií a potravin stále rostou, proto více porovnávám nabídky a šetřím.
+Na dovolenou jezdíme většinou k moři, letos jsme ale zůstali v Čechách na horách.
+Ve volném čase rád sportuji, čtu knihy a chodím s rodinou na procházky do přírody.
+Banka by měla zjednodušit internetové bankovnictví a snížit poplatky za vedení účtu.
+Doprava ve městě je špatná, autobusy jezdí pozdě a tramvaje bývají přeplněné.
+Nejdůležitější je pro mě spolehlivost, bezpečnost a dobrý poměr ceny a výkonu.
+Líbilo se mi, že zaměstnanci byli milí, vstřícní a všechno mi trpělivě vysvětlili.
+Nevím přesně, co bych změnil, asi nic, jsem celkově spokojená.
+Telefon používám hlavně na volání, zprávy, sociální sítě a fotografování.
+Myslím si, že firma by měla více komunikovat se zákazníky a naslouchat jejich připomínkám.
+Výrobek jsem koupil v akci, jinak bych si ho za plnou cenu asi nepořídil.
+Zákaznická linka je dlouho obsazená a operátoři často nevědí, jak problém vyřešit.
+Vůně je příjemná a jemná, ale rychle vyprchá, takže ji musím používat častěji.
+Pojištění jsem si sjednal přes internet, bylo to jednoduché a rychlé.
+Rád bych viděl větší výběr velikostí a barev, hlavně u dětského oblečení.
+Pracuji jako učitelka na základní škole a do práce jezdím autem nebo vlakem.
+Zdravotní péče je u nás na dobré úrovni, ale čekací doby u specialistů jsou dlouhé.
+Jídlo bylo chutné, porce dostatečné a obsluha rychlá, určitě se vrátíme.
+Internet doma je pomalý a často vypadává, uvažuji o změně poskytovatele.
+Nejčastěji nakupuji v supermarketu, protože tam najdu všechno na jednom místě.
+Televizi skoro nesleduji, zprávy čtu na internetu a poslouchám rádio v autě.
+Elektromobil bych si koupil, kdyby byl levnější a bylo více nabíjecích stanic.
+Obec by měla opravit chodníky, přidat lavičky a postarat se o zeleň v parku.
+Vadí mi hluk z dálnice a prach ze stavby, která je hned vedle našeho domu.
+Děti chodí do školky a odpoledne na kroužky, takže máme hodně nabitý program.
+Tento dotazník byl dlouhý, ale otázky byly srozumitelné a zajímavé.
+Byl bych rád, kdyby obchod nabízel možnost vrácení zboží bez udání důvodu.
+Zboží přišlo poškozené, reklamace trvala tři týdny a nikdo se mi neomluvil.
+Oceňuji ekologický přístup, recyklovatelný obal a lokální suroviny.
+Preferuji české výrobky, protože podporuji místní firmy a zemědělce.
+Cestování vlakem je pohodlné, mohu si číst nebo pracovat na počítači.
+Mobilní operátor má drahé tarify a nabídka dat je v porovnání se sousedy slabá.
+Ráno piji kávu s mlékem, k snídani mám chléb s máslem nebo jogurt s ovocem.
+Dárky kupuji většinou na poslední chvíli, nejraději přes internet.
+Kosmetiku vybírám podle složení a recenzí, na značce mi tolik nezáleží.
+Výstava byla krásná, jen vstupné bylo vysoké a popisky nebyly přeložené.
+Ve středu jsem byl u lékaře, doktor mi předepsal léky a doporučil odpočinek.
+Nákupní centrum je daleko, proto objednávám potraviny domů s dovozem zdarma.
+Chybí mi parkoviště u obchodu a bezbariérový vstup pro kočárky a vozíčkáře.
+Velmi dobrá zkušenost, technik přijel včas, opravu provedl rychle a uklidil po sobě.
+Hypotéka je pro mladé rodiny skoro nedostupná, byty jsou drahé a nájmy vysoké.
+Chodím do posilovny třikrát týdně a v létě jezdím na kole nebo plavu v rybníce.
+Kupuji hlavně oblíbené značky jako Coca-Cola, Nestlé, Tesco, Lidl, Kaufland, Albert, Billa a Penny.
+Fast food jako McDonald's, KFC nebo Burger King navštěvuji jen výjimečně na cestách.
+Mám telefon Samsung, Apple, Xiaomi nebo Huawei a používám Facebook, Instagram, YouTube, WhatsApp, Google, Seznam, Netflix a Spotify.
+Značky aut: Škoda, Volkswagen, Toyota, Hyundai, Ford, Renault, Peugeot, BMW, Audi, Mercedes.
+Obchody s elektronikou Alza, Datart, Electro World, Mall, Notino, Rohlík, Košík, Zásilkovna.
+Nejvíc mě štve, že se neustále mění pravidla a člověk se v tom nevyzná.
+Myslím, že by pomohlo lepší značení v prodejně a více pokladen v době špičky.
+Chutnalo mi to, ale bylo to moc slané a porce byla menší, než jsem čekal.
+Jsem důchodce, žiji sám na vesnici a do města jezdím jednou za čtrnáct dní.
+Studuji vysokou školu v Praze a při studiu pracuji jako brigádník v kavárně.
+Nejraději mám klidné prostředí, hezký výhled a možnost posedět venku na zahrádce.
+Program byl pestrý, děti se bavily a my jsme si odpočinuli, vřele doporučuji.
+Nemám rád dlouhé fronty, nepříjemné prodavače a zboží, které chybí v regálech.
+Zpráva přišla pozdě a nebylo z ní jasné, co mám udělat a do kdy.
+Ekologie je důležitá, třídíme odpad, šetříme vodou a jezdíme méně autem.
+Vítám možnost platit kartou i mobilem, hotovost už skoro nepoužívám.
+Vysvětlení bylo srozumitelné, ale formulář byl zbytečně složitý a dlouhý.
+Hodnotím kladně čistotu, vybavení a ochotu personálu, záporně hluk a teplotu.
+Je to zbytečně komplikované, chtělo by to jednodušší ovládání a větší písmo.
+Většinou vařím doma, do restaurace chodíme jen na oslavy a o víkendech.
+Moje oblíbená barva je modrá a nejraději nosím pohodlné oblečení a tenisky.
+Pes potřebuje procházky dvakrát denně, takže jsem hodně venku v každém počasí.
+Na horách jsme lyžovali, večer jsme hráli společenské hry a jedli domácí jídlo.
+Firma mi nabídla práci z domova, což mi ušetří čas i peníze za dojíždění.
+Zaujalo mě, že výrobce uvádí původ surovin a celý postup výroby na obalu.
+Odpověď na můj dotaz přišla do hodiny, což považuji za velmi profesionální.
+Skvělé, výborné, perfektní, úžasné, příjemné, spolehlivé, pohodlné, praktické.
+Hrozné, špatné, nepříjemné, drahé, pomalé, složité, nekvalitní, nespolehlivé.
+Pizza, pizzerie, kebab, sushi, hamburger, hranolky, špagety. Mňam, dobrota, pecka, bomba, paráda, nuda, hnus, otrava, v klidu, v pohodě.
+Ahoj, jak se máš? Mám se dobře, děkuji. Dobrý den, na shledanou, prosím, díky.
+Wi-Fi, e-shop, online, software, hardware, smartphone, notebook, tablet, e-mail.
+Ano, souhlasím. Ne, nesouhlasím. Spíše ano. Spíše ne. Nemám názor.
+Moc dobré, chutná mi to. Je to drahé. Je to levné. Nic mi nechybí.
+Dobrá kvalita, rychlé dodání, příjemná cena, hezký design, snadné použití.
+Proto, že je to praktické. Kvůli ceně. Kvůli kvalitě. Z důvodu dostupnosti.
+Všechno bylo v pořádku. Bez problémů. Jsem spokojený. Jsem spokojená.
+Jednou za měsíc. Několikrát týdně. Denně. Výjimečně. Vůbec ne. Občas.
+Praha, Brno, Ostrava, Plzeň, Olomouc, Liberec, České Budějovice, Hradec Králové.
+Česká republika, Slovensko, Německo, Rakousko, Polsko, Evropa, svět.
+pondělí úterý středa čtvrtek pátek sobota neděle leden únor březen duben květen
+červen červenec srpen září říjen listopad prosinec jaro léto podzim zima
+jedna dva tři čtyři pět šest sedm osm devět deset sto tisíc milion
+máma táta bratr sestra babička dědeček manžel manželka syn dcera kamarád
+zákazník obchod prodejna nákup zboží služba cena sleva akce nabídka kvalita
+chleba mléko sýr maso zelenina ovoce pivo víno voda káva čaj čokoláda
+auto vlak autobus kolo letadlo cesta silnice město vesnice domov byt dům
+práce škola úřad nemocnice lékař zdraví nemoc rodina peníze banka účet
+"""
+
+CORPUS_EN = """
+I like the product because it is good quality and the price is fair for what you get.
+The delivery was fast and the customer service team was friendly and helpful.
+I do not like that the packaging is too big and hard to open without scissors.
+The taste is great, but the price is a bit higher than other brands in the store.
+I usually shop there once a week, mostly for fresh bread, fruit and vegetables.
+They should improve the opening hours, because the store closes too early on weekends.
+The app is easy to use, but it could load faster and crash less often.
+I remember the advertisement because of the music and the funny story, not the brand.
+I would recommend it to my friends and family since nothing else is as good for the money.
+The quality has gone down over the last few years and it does not last as long anymore.
+The service works reliably and I never had a problem with payment or my order.
+Prices of energy and food keep rising, so I compare offers more often and try to save.
+In my free time I enjoy sports, reading books and walking with my family in the countryside.
+Public transport in the city is poor, buses are often late and trams are overcrowded.
+The most important things for me are reliability, safety and good value for money.
+Honestly I am not sure what I would change, I am quite satisfied overall.
+I use my phone mostly for calls, messages, social media and taking photos.
+The company should communicate more with customers and listen to their feedback.
+The staff were kind and patient and explained everything clearly to me.
+My favourite brands are Apple, Samsung, Nike, Adidas, Amazon, Google and Microsoft.
+Fast food from McDonald's or Burger King is fine when travelling, but not every day.
+The website was confusing and I could not find the contact form or the phone number.
+The hotel room was clean and quiet, breakfast was excellent and the staff very welcoming.
+I think the government should invest more in schools, hospitals and public transport.
+Shipping costs are too high, and the tracking information was not updated for days.
+Great value, highly recommended, would buy again, works as expected, easy to install.
+Terrible experience, rude staff, long wait, poor quality, broke after a week.
+We watched the show together as a family and the children loved the characters.
+Working from home saves time, but I miss meeting my colleagues in the office.
+Yes, I agree. No, I disagree. Maybe. Not really. It depends on the situation.
+Very good, tasty, expensive, cheap, nothing is missing, everything was fine.
+Because it is practical. Because of the price. Because of the quality. Convenience.
+Once a month. Several times a week. Every day. Rarely. Never. Sometimes.
+This survey was long, but the questions were clear and interesting to answer.
+The product arrived damaged and the return process took almost three weeks.
+I prefer local products because I want to support small businesses and farmers.
+"""
+
+SURVEY_ANSWERS = """
+nevím nevim nic nemám nemam žádné zadne nic mě nenapadá nic moc bez názoru
+dobrá cena dobra cena kvalita sluzba rychle doruceni produkt libi nelibi protoze
+drahy levny pekny obal chut chuti chutna dobre spatne super fajn vyborne hrozne
+vsechno ok vse v poradku spokojenost nespokojenost cena vykon poměr ceny a kvality
+"""
+
+
+def build(texts, backoff=BACKOFF):
+    """
+    Interpolated log-probability table (ALPHABET_SIZE^3 float16 values):
+    P(c3 | c1 c2) = l3 * P_ml(c3 | c1 c2) + (1 - l3) * [l2 * P_ml(c3 | c2) + (1 - l2) * P(c3)]
+    with l = count(context) / (count(context) + backoff), so rare or unseen
+    contexts fall back to bigram and unigram statistics instead of a uniform
+    guess.
+    """
+    folded = [fold_text(line) for text in texts for line in text.splitlines() if line.strip()]
+    codes, owner = encode(folded)
+    ids = trigram_ids(codes)
+    ids = ids[owner[:-2] == owner[2:]]
+
+    size = ALPHABET_SIZE
+    tri = np.bincount(ids, minlength=size ** 3).astype(np.float64).reshape(size, size, size)
+    bi = tri.sum(axis=0)                        # (c2, c3)
+    uni = (bi.sum(axis=0) + 1) / (bi.sum() + size)
+
+    def interpolate(counts, lower):
+        context = counts.sum(axis=-1, keepdims=True)
+        weight = context / (context + backoff)
+        ml = np.divide(counts, context, out=np.zeros_like(counts), where=context > 0)
+        return weight * ml + (1 - weight) * lower
+
+    p_bi = interpolate(bi, uni)                 # (c2, c3)
+    p_tri = interpolate(tri, p_bi[None, :, :])  # (c1, c2, c3)
+    return np.log(p_tri).ravel().astype(np.float16), int(len(ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the gibberish trigram model.")
+    parser.add_argument('--output', default=MODEL_FILE, help="Output .npy file")
+    parser.add_argument('--corpus', nargs='*', default=[], help="Extra UTF-8 text files to learn from")
+    args = parser.parse_args()
+
+    texts = [CORPUS_CS, CORPUS_EN, SURVEY_ANSWERS]
+    for path in args.corpus:
+        with open(path, encoding='utf-8') as f:
+            texts.append(f.read())
+
+    table, trigrams = build(texts)
+    np.save(args.output, table)
+    print(f"Model written: {args.output} ({trigrams} trigrams, {table.nbytes / 1024:.0f} KB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,783 @@
+"""
+Detector pipeline - pluggable bad-respondent detectors.
+
+Each detector declares the SAV columns it needs (decided from metadata and
+the parsed questionnaire, before any data is read) and returns raw
+per-respondent metrics. The pipeline loads the union of all requested
+columns once, runs the detectors concurrently and merges their output into
+the standard `results` structure. Classification into speeders /
+open-ended risk / straight-liners happens afterwards in apply_thresholds().
+
+Writing a new detector:
+    class MyDetector(Detector):
+        name = 'my_detector'
+        title = 'MY DETECTION'
+
+        def select_columns(self, columns, meta, structure):
+            return [c for c in columns if c.startswith('X')]
+
+        def run(self, df, ctx):
+            result = DetectorResult()
+            result.raw['my_metric'] = ...   # one value per row of df
+            return result
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bad_respondents_detector import (
+    answer_quality_scores,
+    cross_question_similarity,
+    find_variable_names,
+    open_adjusted_scores,
+    page_speeder_mask,
+    parse_duration_to_seconds,
+    speeder_reference,
+)
+from relevance import RelevanceModel
+
+DURATION_COLUMNS = ['duration', 'Duration', 'DURATION', 'interview_length']
+
+# Columns never treated as open-ended answers by the heuristic fallback
+SYSTEM_COLUMNS = {'start', 'end', 'duration', 'RespondentFinishedOnQuestion',
+                  'ExternalId', 'ReferralCode', 'QuestionaryUserId', 'email',
+                  'UserPanelId', '_duration_sec'}
+
+PREFERRED_ID_COLUMNS = ['ExternalId', 'UserPanelId', 'QuestionaryUserId', 'email', 'ReferralCode']
+
+BATTERY_COLUMN_RE = re.compile(r'(Q+\w+?)__(\d+)$')
+
+
+class DetectorResult:
+    """Output of one detector run."""
+
+    def __init__(self):
+        self.raw = {}        # per-respondent metric arrays (row order of df)
+        self.results = {}    # extra keys merged into the results dict
+        self.columns = {}    # derived columns added to df after all detectors ran
+        self.messages = []   # log lines, printed in detector order
+
+    def log(self, message):
+        self.messages.append(message)
+
+
+class Detector:
+    """Base class of all detectors."""
+
+    name = 'detector'
+    title = 'DETECTOR'
+
+    def select_columns(self, columns, meta, structure):
+        """Return the column names this detector needs (metadata only)."""
+        return []
+
+    def run(self, df, ctx):
+        """
+        Compute raw metrics on df (holding at least the selected columns).
+        ctx: dict with 'id_column', 'structure', 'meta', 'thresholds' and
+        optionally 'progress'. Must not modify df - detectors run concurrently.
+        """
+        raise NotImplementedError
+
+
+# Row progress events per per-respondent loop
+PROGRESS_STEPS = 20
+
+
+def report_progress(ctx, stage, status, done=None, total=None):
+    """Forward a progress event to ctx['progress'] when a listener is set."""
+    progress = ctx.get('progress')
+    if progress:
+        progress(stage, status, done, total)
+
+
+def iter_with_progress(ctx, stage, iterable, total):
+    """enumerate(iterable) that reports row progress PROGRESS_STEPS times."""
+    if not ctx.get('progress'):
+        yield from enumerate(iterable)
+        return
+    step = max(1, total // PROGRESS_STEPS)
+    for pos, item in enumerate(iterable):
+        if pos % step == 0:
+            report_progress(ctx, stage, 'progress', pos, total)
+        yield pos, item
+    report_progress(ctx, stage, 'progress', total, total)
+
+
+def is_text_column(meta, col):
+    """True for SAV string variables."""
+    return meta.readstat_variable_types.get(col) == 'string'
+
+
+# =============================================================================
+# 1. SPEEDERS
+# =============================================================================
+
+class SpeederDetector(Detector):
+    """Total interview duration, compared against the median later."""
+
+    name = 'speeders'
+    title = 'SPEEDERS DETECTION'
+
+    def select_columns(self, columns, meta, structure):
+        for col_name in DURATION_COLUMNS:
+            if col_name in columns:
+                return [col_name]
+        return []
+
+    def run(self, df, ctx):
+        result = DetectorResult()
+        duration_col = next((c for c in DURATION_COLUMNS if c in df.columns), None)
+        if not duration_col:
+            result.log("   No duration column found")
+            return result
+
+        durations_sec = [parse_duration_to_seconds(val) for _, val in
+                         iter_with_progress(ctx, self.name, df[duration_col], len(df))]
+        durations = np.array([np.nan if d is None else d for d in durations_sec], dtype=float)
+        result.columns['_duration_sec'] = durations_sec
+        result.raw['duration_sec'] = durations
+
+        segments = None
+        segment_col = ctx.get('segment_by')
+        min_size = ctx['thresholds']['speeder_min_segment_size']
+        if segment_col:
+            # Integer code per respondent (-1 = missing); medians per segment are
+            # taken in apply_thresholds, so the minimum size stays adjustable
+            codes, labels = pd.factorize(df[segment_col], use_na_sentinel=True)
+            segments = codes.astype(np.int32)
+            result.raw['segment'] = segments
+            result.results['segment_column'] = segment_col
+            result.results['segment_labels'] = [str(label) for label in labels]
+            valid_counts = np.bincount(segments[(segments >= 0) & (durations > 0)], minlength=len(labels))
+            result.log(f"   Segments by {segment_col}: {len(labels)} "
+                       f"({int(np.sum(valid_counts < min_size))} with < {min_size} valid durations "
+                       f"use the global median)")
+
+        reference, median_duration = speeder_reference(durations, segments, min_size)
+        if median_duration is not None:
+            speeder_threshold = median_duration * ctx['thresholds']['speeder_ratio']
+            result.log(f"   Median duration: {median_duration:.0f}s ({median_duration/60:.1f} min)")
+            result.log(f"   Speeder threshold: < {speeder_threshold:.0f}s ({speeder_threshold/60:.1f} min)"
+                       + (" overall, per segment otherwise" if segments is not None else ""))
+            result.log(f"   Speeders found: "
+                       f"{int(np.sum(durations < reference * ctx['thresholds']['speeder_ratio']))}")
+        else:
+            result.log("   No valid duration data found")
+        return result
+
+
+# =============================================================================
+# 2. OPEN-ENDED ANSWER QUALITY
+# =============================================================================
+
+class OpenEndedDetector(Detector):
+    """Scoring of open-ended answers + cross-question similarity penalty."""
+
+    name = 'open_ended'
+    title = 'OPEN-ENDED ANSWER QUALITY (scoring v2.0)'
+
+    def select_columns(self, columns, meta, structure):
+        cols = []
+        if structure and structure.get('open_questions'):
+            for q in structure['open_questions']:
+                cols.extend(find_variable_names(columns, q['code']))
+        if cols:
+            return list(dict.fromkeys(cols))
+
+        # Fallback candidates: string variables that are not system fields
+        # or "jiné" text fields; the content check happens in run()
+        return [col for col in columns
+                if is_text_column(meta, col)
+                and col not in SYSTEM_COLUMNS
+                and not col.startswith('User')
+                and not col.endswith('_jina')]
+
+    def _open_columns(self, df, ctx, result):
+        """Open-ended columns and {column: question code} (empty for heuristic columns)."""
+        structure = ctx['structure']
+        columns = list(df.columns)
+        cols = []
+        question_of = {}
+        if structure and structure.get('open_questions'):
+            open_questions = structure['open_questions']
+            result.log(f"   From questionnaire: {len(open_questions)} open questions")
+            for q in open_questions:
+                result.log(f"   - {q['code']}: {q['text'][:60]}...")
+                for col in find_variable_names(columns, q['code']):
+                    cols.append(col)
+                    question_of.setdefault(col, q['code'])
+
+        if not cols:
+            for col in self.select_columns(columns, ctx['meta'], None):
+                # Check if it's actually an open-ended (has varied content, not coded)
+                non_null = df[col].dropna()
+                if len(non_null) > 0 and non_null.astype(str).str.len().mean() > 3:
+                    cols.append(col)
+            result.log(f"   Heuristic detection: {len(cols)} text columns")
+
+        return list(dict.fromkeys(cols)), question_of
+
+    def _relevance(self, open_cols, column_values, question_of, ctx, result):
+        """
+        Per open column: {answer: relevance to its question text} (see
+        relevance.py), scored in one batch per question; empty for columns
+        without a question.
+        """
+        relevance_of = [{} for _ in open_cols]
+        if not question_of:
+            return relevance_of
+        questions = ctx['structure'].get('all_questions') or ctx['structure']['open_questions']
+        model = RelevanceModel([q['text'] for q in questions])
+        position = {}
+        for i, q in enumerate(questions):
+            position.setdefault(q['code'], i)
+
+        by_question = {}
+        for j, col in enumerate(open_cols):
+            if question_of.get(col) in position:
+                by_question.setdefault(question_of[col], []).append(j)
+        scored = 0
+        for code, col_indexes in by_question.items():
+            answers = list(dict.fromkeys(
+                str(val).strip() for j in col_indexes for val in column_values[j]
+                if pd.notna(val) and str(val).strip() != ''
+            ))
+            scores = dict(zip(answers, model.scores(position[code], answers)))
+            for j in col_indexes:
+                relevance_of[j] = scores
+            scored += len(answers)
+        result.log(f"   Relevance to question text: {scored} distinct answers scored")
+        return relevance_of
+
+    def run(self, df, ctx):
+        result = DetectorResult()
+        n = len(df)
+        open_avg = np.full(n, np.nan)
+        open_penalty = np.zeros(n)
+        open_relevance = np.zeros(n)
+        scores_by_id = {}
+        result.raw['open_avg'] = open_avg
+        result.raw['open_penalty'] = open_penalty
+        result.raw['open_relevance'] = open_relevance
+        result.results['open_ended_scores'] = scores_by_id
+
+        open_cols, question_of = self._open_columns(df, ctx, result)
+        if not open_cols:
+            result.log("   No open-ended columns found")
+            return result
+
+        result.log(f"   Analyzing {len(open_cols)} open-ended columns: {open_cols}")
+
+        ids = df[ctx['id_column']].tolist()
+        column_values = [df[col].tolist() for col in open_cols]
+        # Score each distinct answer once (gibberish model runs batched)
+        score_of = answer_quality_scores(
+            val for values in column_values for val in values
+            if pd.notna(val) and str(val).strip() != ''
+        )
+        relevance_of = self._relevance(open_cols, column_values, question_of, ctx, result)
+        for pos, _ in iter_with_progress(ctx, self.name, range(n), n):
+            answers = []
+            scores = []
+            relevance = []
+            for values, relevance_map in zip(column_values, relevance_of):
+                val = values[pos]
+                if pd.notna(val) and str(val).strip() != '':
+                    answer = str(val).strip()
+                    answers.append(answer)
+                    scores.append(score_of[answer])
+                    relevance.append(relevance_map.get(answer, 0.0))
+
+            if not scores:
+                continue
+
+            sim_penalty = cross_question_similarity(answers)
+            avg_score = sum(scores) / len(scores)
+            avg_relevance = float(sum(relevance) / len(relevance))
+            open_avg[pos] = avg_score
+            open_penalty[pos] = sim_penalty
+            open_relevance[pos] = avg_relevance
+
+            # The adjusted score depends on thresholds (open_relevance_weight),
+            # so it is derived from raw metrics when read (open_adjusted_scores)
+            scores_by_id[ids[pos]] = {
+                'avg_score': round(avg_score, 2),
+                'similarity_penalty': round(sim_penalty, 2),
+                'relevance': round(avg_relevance, 2),
+                'individual_scores': [round(s, 2) for s in scores],
+                'answers': answers
+            }
+
+        thresholds = ctx['thresholds']
+        adjusted = open_adjusted_scores(result.raw, thresholds)
+        high_count = int(np.sum(adjusted <= thresholds['open_high_risk']))
+        medium_count = int(np.sum(adjusted <= thresholds['open_medium_risk'])) - high_count
+        result.log(f"   High risk (score ≤ {thresholds['open_high_risk']}): {high_count} respondents")
+        result.log(f"   Medium risk (score ≤ {thresholds['open_medium_risk']}): {medium_count} respondents")
+        return result
+
+
+# =============================================================================
+# 3. STRAIGHT-LINING
+# =============================================================================
+
+class StraightLiningDetector(Detector):
+    """Identical answers across all items of rating batteries."""
+
+    name = 'straight_lining'
+    title = 'STRAIGHT-LINING DETECTION'
+
+    def _questionnaire_batteries(self, columns, structure):
+        groups = []
+        if structure and structure.get('batteries'):
+            for bat in structure['batteries']:
+                cols = find_variable_names(columns, bat['code'])
+                if len(cols) >= 4:  # Only check batteries with 4+ items
+                    groups.append({'code': bat['code'], 'columns': cols, 'item_count': len(cols)})
+        return groups
+
+    def _pattern_batteries(self, columns, meta):
+        """Column groups named QXX__1, QXX__2, ... with 4+ numeric items."""
+        col_groups = {}
+        for col in columns:
+            match = BATTERY_COLUMN_RE.match(col)
+            if match:
+                col_groups.setdefault(match.group(1), []).append(col)
+        return {base: cols for base, cols in col_groups.items()
+                if len(cols) >= 4 and not is_text_column(meta, cols[0])}
+
+    def select_columns(self, columns, meta, structure):
+        groups = self._questionnaire_batteries(columns, structure)
+        if groups:
+            return [col for g in groups for col in g['columns']]
+        return [col for cols in self._pattern_batteries(columns, meta).values() for col in cols]
+
+    def _battery_groups(self, df, ctx, result):
+        columns = list(df.columns)
+        groups = self._questionnaire_batteries(columns, ctx['structure'])
+        for bg in groups:
+            result.log(f"   Battery {bg['code']}: {bg['item_count']} items")
+        if groups:
+            return groups
+
+        # Fallback: detect batteries by column naming pattern (QXX__1, QXX__2, ...)
+        for base, cols in self._pattern_batteries(columns, ctx['meta']).items():
+            if df[cols[0]].dropna().empty:
+                continue
+            # IMPORTANT: Exclude binary/multi-select questions (0/1 or 1/2 values)
+            # These are checkbox questions, not rating scales
+            all_vals = set()
+            for col in cols:
+                try:
+                    all_vals.update(df[col].dropna().astype(float).unique())
+                except (TypeError, ValueError):
+                    pass
+            if all_vals <= {0.0, 1.0, 2.0}:
+                continue  # Skip multi-select questions
+
+            # Item order matters for run / alternating / diagonal metrics:
+            # QXX__2 before QXX__10
+            items = sorted(cols, key=lambda col: int(BATTERY_COLUMN_RE.match(col).group(2)))
+            groups.append({'code': base, 'columns': items, 'item_count': len(cols)})
+
+        if groups:
+            result.log(f"   Heuristic detection: {len(groups)} rating batteries (excluding multi-select)")
+            for bg in groups:
+                result.log(f"   - {bg['code']}: {bg['item_count']} items")
+        return groups
+
+    def run(self, df, ctx):
+        result = DetectorResult()
+        straight_count = np.zeros(len(df), dtype=np.int32)
+        result.raw['straight_count'] = straight_count
+
+        battery_groups = self._battery_groups(df, ctx, result)
+        result.results['battery_length'] = max([bg['item_count'] for bg in battery_groups]) if battery_groups else 0
+        if not battery_groups:
+            result.log("   No batteries found for straight-lining check")
+            return result
+
+        # All batteries at once: respondents × batteries × items, in row chunks
+        # so the padded array stays small for big files
+        midpoints = battery_midpoints(df, battery_groups)
+        metrics = {}
+        for start in range(0, len(df), BATTERY_CHUNK_ROWS):
+            chunk = df.iloc[start:start + BATTERY_CHUNK_ROWS]
+            for key, values in battery_metrics(battery_cube(chunk, battery_groups), midpoints).items():
+                metrics.setdefault(key, []).append(values)
+            report_progress(ctx, self.name, 'progress', min(start + BATTERY_CHUNK_ROWS, len(df)), len(df))
+        for key, parts in metrics.items():
+            result.raw[f"battery_{key}"] = np.concatenate(parts)
+        straight_count[:] = result.raw['battery_straight'].sum(axis=1)
+        result.results['battery_codes'] = [bg['code'] for bg in battery_groups]
+
+        # Threshold: For short batteries (4-5 items), require straight-lining in 2+ batteries
+        # This reduces false positives from 4-item batteries where random agreement is common
+        min_batteries = ctx['thresholds']['straight_min_batteries']
+        result.log(f"   Straight-liners found: {int(np.sum(straight_count >= min_batteries))} "
+                   f"(threshold: {min_batteries}+ batteries)")
+        extra_flags = [name for name in BATTERY_FLAG_THRESHOLDS if ctx['thresholds'].get(name) is not None]
+        if extra_flags:
+            result.log(f"   Extra battery flags enabled: {', '.join(extra_flags)}")
+        return result
+
+
+# Minimum answered items for a battery to be judged at all
+BATTERY_MIN_ANSWERS = 4
+
+# Respondents per block of the vectorized battery metrics
+BATTERY_CHUNK_ROWS = 50_000
+
+# Optional thresholds (see DEFAULT_THRESHOLDS) that flag a battery in
+# addition to exact straight-lining
+BATTERY_FLAG_THRESHOLDS = ('battery_longest_run_min', 'battery_sd_max',
+                           'battery_midpoint_share_min', 'battery_pattern_min')
+
+
+def _battery_values(df, columns):
+    try:
+        return df[columns].to_numpy(dtype=np.float32, na_value=np.nan)
+    except (TypeError, ValueError):
+        # Non-numeric codes - compare what converts, treat the rest as missing
+        return df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+def battery_cube(df, groups):
+    """Answers as a respondents × batteries × items array (NaN = missing/padding)."""
+    width = max(g['item_count'] for g in groups)
+    cube = np.full((len(df), len(groups), width), np.nan, dtype=np.float32)
+    for b, g in enumerate(groups):
+        cube[:, b, :g['item_count']] = _battery_values(df, g['columns'])
+    return cube
+
+
+def battery_midpoints(df, groups):
+    """Middle code of each battery's observed scale; NaN for even scales."""
+    midpoints = np.full(len(groups), np.nan, dtype=np.float32)
+    for b, g in enumerate(groups):
+        values = _battery_values(df, g['columns'])
+        if np.isnan(values).all():
+            continue
+        low, high = np.nanmin(values), np.nanmax(values)
+        if high > low and (low + high) % 2 == 0:
+            midpoints[b] = (low + high) / 2
+    return midpoints
+
+
+def battery_metrics(cube, midpoints):
+    """
+    Per respondent × battery quality metrics of a battery_cube():
+        straight         all answered items identical
+        longest_run      longest run of identical consecutive answers
+        sd               standard deviation of the answers
+        midpoint_share   share of answers on the scale midpoint
+        alternating      share of zig-zag steps (4-5-4-5, 1-5-1-5)
+        diagonal         share of constant steps (1-2-3-4, 5-4-3-2)
+    Batteries with fewer than BATTERY_MIN_ANSWERS answers get
+    straight=False, longest_run=0 and NaN for the rest.
+    """
+    answered = ~np.isnan(cube)
+    count = answered.sum(axis=2)
+    valid = count >= BATTERY_MIN_ANSWERS
+
+    low = np.where(answered, cube, np.inf).min(axis=2)
+    high = np.where(answered, cube, -np.inf).max(axis=2)
+    straight = valid & (low == high)
+
+    # Run lengths: one step per item position, vectorized over everything else
+    run = answered[:, :, 0].astype(np.int16)
+    longest = run.copy()
+    same = cube[:, :, 1:] == cube[:, :, :-1]
+    for j in range(same.shape[2]):
+        run = np.where(same[:, :, j], run + 1, answered[:, :, j + 1]).astype(np.int16)
+        np.maximum(longest, run, out=longest)
+    longest[~valid] = 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        safe_count = np.maximum(count, 1)
+        mean = np.where(answered, cube, 0).sum(axis=2) / safe_count
+        deviation = np.where(answered, cube - mean[:, :, None], 0)
+        sd = np.sqrt((deviation ** 2).sum(axis=2) / safe_count)
+
+        midpoint_share = (cube == midpoints[None, :, None]).sum(axis=2) / safe_count
+        midpoint_share[:, np.isnan(midpoints)] = np.nan
+
+        steps = np.diff(cube, axis=2)
+        before, after = steps[:, :, :-1], steps[:, :, 1:]
+        pairs = (~np.isnan(before) & ~np.isnan(after)).sum(axis=2)
+        moved = before != 0
+        alternating = (moved & (after == -before)).sum(axis=2) / pairs
+        diagonal = (moved & (after == before)).sum(axis=2) / pairs
+
+    metrics = {
+        'straight': straight,
+        'longest_run': longest,
+        'sd': sd,
+        'midpoint_share': midpoint_share,
+        'alternating': alternating,
+        'diagonal': diagonal,
+    }
+    for key in ('sd', 'midpoint_share', 'alternating', 'diagonal'):
+        values = metrics[key].astype(np.float32)
+        values[~valid] = np.nan
+        metrics[key] = values
+    return metrics
+
+
+# =============================================================================
+# 4. PAGE-LEVEL SPEEDERS
+# =============================================================================
+
+# Per-page / per-question timing variables: page_3, time_Q5, Q5_time,
+# Q5_sec, T_5, ... (case-insensitive). A bare "t" prefix needs a separator
+# and a digit, so trust_1, type or total are not pages.
+PAGE_TIMING_RE = re.compile(
+    r'^(?:page|time|timing)_?(?P<prefixed>[A-Za-z0-9]\w*)$'
+    r'|^t_(?P<numbered>\d\w*)$'
+    r'|^(?P<suffixed>\w+?)_(?:time|timing|secs?|seconds)$',
+    re.IGNORECASE
+)
+
+# Names that say by themselves the variable holds a time; other matching
+# names (page_3, t_5) must have an SPSS time format
+PAGE_TIMING_NAMED_RE = re.compile(r'^timing?_|_(?:time|timing|secs?|seconds)$', re.IGNORECASE)
+
+# SPSS formats of time variables (TIME8, DTIME11, DATETIME20, ...)
+PAGE_TIMING_FORMAT_RE = re.compile(r'^(?:TIME|DTIME|MTIME|DATETIME|YMDHMS)', re.IGNORECASE)
+
+# Words of whole-interview timestamps, not pages (whole tokens of the name)
+PAGE_TIMING_EXCLUDED = {'start', 'end', 'stamp', 'zone', 'finish', 'submit', 'total'}
+
+# Fewer timing columns than this is not a page timing block
+PAGE_MIN_COLUMNS = 3
+
+# Respondents with fewer timed pages are not judged
+PAGE_MIN_ANSWERED = 3
+
+# Plausible page durations: none negative or longer than a day, and more
+# distinct values than a rating scale has
+PAGE_MAX_SECONDS = 24 * 3600
+PAGE_MIN_DISTINCT = 12
+
+
+def _timing_page(col, meta=None):
+    """Page name of a timing variable, None for other columns."""
+    match = PAGE_TIMING_RE.match(col)
+    if not match:
+        return None
+    if set(re.split(r'[^a-z]+', col.lower())) & PAGE_TIMING_EXCLUDED:
+        return None
+    if not PAGE_TIMING_NAMED_RE.search(col):
+        formats = getattr(meta, 'original_variable_types', None) or {}
+        if not PAGE_TIMING_FORMAT_RE.match(formats.get(col) or ''):
+            return None
+    return match.group('prefixed') or match.group('numbered') or match.group('suffixed')
+
+
+def _plausible_durations(seconds):
+    """Whether a column of seconds looks like a timer, not a coded variable."""
+    valid = seconds[~np.isnan(seconds)]
+    if not valid.size:
+        return True  # nobody timed; dropped later as untimed
+    if valid.min() < 0 or valid.max() > PAGE_MAX_SECONDS:
+        return False
+    return len(np.unique(valid)) >= min(PAGE_MIN_DISTINCT, valid.size // 2)
+
+
+def _timing_to_seconds(value):
+    if hasattr(value, 'hour') and hasattr(value, 'second') and not hasattr(value, 'date'):
+        # datetime.time from SPSS TIME formats
+        return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+    seconds = parse_duration_to_seconds(value)
+    return np.nan if seconds is None else seconds
+
+
+class PageSpeederDetector(Detector):
+    """
+    Time spent per page, relative to the median time of that page.
+
+    Timing variables are recognized by name (PAGE_TIMING_RE) plus an SPSS
+    time format or an explicit time name (Q5_time, Q5_sec), and must hold
+    plausible durations. They hold either durations (seconds, H:MM:SS) or page
+    timestamps (SPSS DATETIME); timestamps are ordered by their median and
+    turned into durations of the consecutive pages. The raw metric is a
+    respondents × pages matrix of time / page median, classified later by
+    page_speeder_ratio and page_speeder_share.
+    """
+
+    name = 'page_speeders'
+    title = 'PAGE-LEVEL SPEEDERS DETECTION'
+
+    def select_columns(self, columns, meta, structure):
+        excluded = SYSTEM_COLUMNS | set(DURATION_COLUMNS) | set(PREFERRED_ID_COLUMNS)
+        timing = [col for col in columns if col not in excluded and _timing_page(col, meta)]
+        return timing if len(timing) >= PAGE_MIN_COLUMNS else []
+
+    def _timing_matrix(self, df, columns):
+        """respondents × pages durations in seconds (NaN = not timed)."""
+        stamps = [col for col in columns if df[col].dtype.kind == 'M']
+        durations = [col for col in columns if col not in stamps]
+        blocks = []
+        pages = []
+
+        if durations:
+            block = np.empty((len(df), len(durations)), dtype=np.float64)
+            for j, col in enumerate(durations):
+                series = df[col]
+                if series.dtype.kind in 'biuf':
+                    block[:, j] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+                else:
+                    block[:, j] = [_timing_to_seconds(v) for v in series]
+            # Coded or ID-like variables with timer names are not pages
+            plausible = [_plausible_durations(block[:, j]) for j in range(len(durations))]
+            blocks.append(block[:, plausible])
+            pages.extend(col for col, keep in zip(durations, plausible) if keep)
+
+        if len(stamps) >= 2:
+            times = np.column_stack([
+                df[col].to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9 for col in stamps
+            ])
+            times[np.column_stack([df[col].isna().to_numpy() for col in stamps])] = np.nan
+            # Page order = order of the median submit times
+            order = np.argsort(np.nanmedian(times, axis=0))
+            times = times[:, order]
+            blocks.append(np.diff(times, axis=1))
+            pages.extend(stamps[order[k + 1]] for k in range(len(stamps) - 1))
+
+        matrix = np.hstack(blocks) if blocks else np.empty((len(df), 0))
+        matrix[~(matrix > 0)] = np.nan
+        return matrix, pages
+
+    def page_times(self, df, ctx):
+        """(respondents × pages seconds, page names) of the pages timed by anybody."""
+        columns = self.select_columns(list(df.columns), ctx['meta'], ctx['structure'])
+        if not columns:
+            return None, []
+        with np.errstate(all='ignore'):
+            matrix, pages = self._timing_matrix(df, columns)
+            timed = ~np.isnan(matrix).all(axis=0)
+        if timed.sum() < PAGE_MIN_COLUMNS:
+            timed[:] = False
+        return matrix[:, timed], [p for p, keep in zip(pages, timed) if keep]
+
+    def run(self, df, ctx):
+        result = DetectorResult()
+        matrix, pages = self.page_times(df, ctx)
+        if matrix is None:
+            result.log("   No per-page timing variables found")
+            return result
+        if not pages:
+            result.log("   Per-page timing variables contain no valid times")
+            return result
+
+        with np.errstate(all='ignore'):
+            medians = np.nanmedian(matrix, axis=0)
+        ratios = page_time_ratios(matrix, medians)
+
+        result.raw['page_time_ratio'] = ratios
+        result.results['timing_pages'] = pages
+        result.log(f"   Timed pages: {len(pages)} ({', '.join(pages[:5])}{', ...' if len(pages) > 5 else ''})")
+        result.log(f"   Page medians: {np.min(medians):.0f}s - {np.max(medians):.0f}s")
+
+        page_count = int(np.sum(page_speeder_mask(result.raw, ctx['thresholds'])))
+        result.log(f"   Page speeders found: {page_count} "
+                   f"(< {ctx['thresholds']['page_speeder_ratio']:.2f} × page median on "
+                   f"{ctx['thresholds']['page_speeder_share']:.0%}+ of pages)")
+        return result
+
+
+def page_time_ratios(matrix, medians):
+    """Page time / page median; respondents with too few timed pages get NaN."""
+    with np.errstate(all='ignore'):
+        ratios = (matrix / medians).astype(np.float32)
+    ratios[(~np.isnan(ratios)).sum(axis=1) < PAGE_MIN_ANSWERED] = np.nan
+    return ratios
+
+
+DEFAULT_DETECTORS = (SpeederDetector(), OpenEndedDetector(), StraightLiningDetector(),
+                     PageSpeederDetector())
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+def id_column_candidates(columns):
+    """Columns find_id_column() may choose from (decided from names only)."""
+    candidates = [col for col in columns
+                  if col in PREFERRED_ID_COLUMNS
+                  or ('id' in col.lower() and col != 'RespondentFinishedOnQuestion')]
+    if columns:
+        candidates.append(columns[0])  # find_id_column fallback
+    return candidates
+
+
+def select_pipeline_columns(columns, meta, structure, detectors=DEFAULT_DETECTORS):
+    """Union of the columns needed by the ID lookup and all detectors, in file order."""
+    wanted = set(id_column_candidates(columns))
+    for detector in detectors:
+        wanted.update(detector.select_columns(columns, meta, structure))
+    return [col for col in columns if col in wanted]
+
+
+def select_analysis_columns(meta, structure, detectors=DEFAULT_DETECTORS, segment_by=None):
+    """Columns to load for an analysis: pipeline columns plus the segment column."""
+    usecols = select_pipeline_columns(meta.column_names, meta, structure, detectors)
+    if segment_by:
+        if segment_by not in meta.column_names:
+            raise ValueError(f"Segment column not found: {segment_by}")
+        usecols = [col for col in meta.column_names if col in usecols or col == segment_by]
+    return usecols
+
+
+def empty_raw_metrics(ids):
+    """Neutral raw metrics - used for metrics no detector provided."""
+    n = len(ids)
+    return {
+        'ids': ids,
+        'duration_sec': np.full(n, np.nan),
+        'open_avg': np.full(n, np.nan),
+        'open_penalty': np.zeros(n),
+        'open_relevance': np.zeros(n),
+        'straight_count': np.zeros(n, dtype=np.int32),
+    }
+
+
+def run_detectors(df, ctx, detectors=DEFAULT_DETECTORS, max_workers=None):
+    """
+    Run detectors concurrently on df and merge their output.
+
+    Returns (raw_metrics, extra_results). Log lines are printed per detector
+    in the order of `detectors`; derived columns are added to df at the end.
+    """
+    detectors = list(detectors)
+
+    def run_one(detector):
+        report_progress(ctx, detector.name, 'started')
+        output = detector.run(df, ctx)
+        report_progress(ctx, detector.name, 'finished')
+        return output
+
+    workers = max_workers or len(detectors) or 1
+    if workers == 1 or len(detectors) <= 1:
+        outputs = [run_one(detector) for detector in detectors]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='detector') as pool:
+            outputs = list(pool.map(run_one, detectors))
+
+    raw = empty_raw_metrics(df[ctx['id_column']].tolist())
+    extra = {}
+    for number, (detector, output) in enumerate(zip(detectors, outputs), start=1):
+        print(f"\n{number}. {detector.title}")
+        for message in output.messages:
+            print(message)
+        raw.update(output.raw)
+        extra.update(output.results)
+        for col, values in output.columns.items():
+            df[col] = values
+
+    return raw, extra
@@ -0,0 +1,181 @@
+"""
+Gibberish detection - character-trigram language model for open answers.
+
+The model is a table of log P(c3 | c1 c2) over a folded alphabet (space +
+a-z; Czech diacritics are folded to ASCII, everything else becomes a space),
+shipped as gibberish_trigrams.npy and built by build_gibberish_model.py from
+Czech and English text. Keyboard mashes ("asdasd fgfg", "jkljkl") are made of
+trigrams that are rare in both languages, so their per-character perplexity
+is far above that of real words.
+
+Scoring is batched: answers are concatenated, folded and converted to
+trigram ids in one numpy pass per chunk of about SCORE_CHUNK_CHARS
+characters, so cost does not grow with Python per-cell overhead and memory
+does not grow with the total length of all answers.
+"""
+
+import os
+import threading
+import unicodedata
+
+import numpy as np
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gibberish_trigrams.npy')
+
+ALPHABET = ' abcdefghijklmnopqrstuvwxyz'
+ALPHABET_SIZE = len(ALPHABET)
+
+# Answers with fewer letters carry too few trigrams to judge
+GIBBERISH_MIN_LETTERS = 4
+# Per-character perplexity above which an answer counts as gibberish
+GIBBERISH_PERPLEXITY = 60.0
+
+# Texts are scored in chunks of about this many characters (text_chunks)
+SCORE_CHUNK_CHARS = 1 << 12
+
+# Byte -> alphabet code (0 = space) for folded ASCII text
+_CODES = np.zeros(256, dtype=np.uint8)
+for _code, _char in enumerate(ALPHABET):
+    _CODES[ord(_char)] = _code
+    if _char != ' ':
+        _CODES[ord(_char.upper())] = _code
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def fold_text(text):
+    """Lowercase ASCII letters and single spaces, padded with one space each side."""
+    decomposed = unicodedata.normalize('NFKD', str(text).lower())
+    ascii_text = decomposed.encode('ascii', 'ignore').decode('ascii')
+    letters = ''.join(c if 'a' <= c <= 'z' else ' ' for c in ascii_text)
+    return f" {' '.join(letters.split())} "
+
+
+def encode(texts):
+    """
+    Folded texts -> (codes, owner): alphabet codes (uint8) of all texts
+    concatenated, and the index (int32) of the text each code belongs to.
+    """
+    joined = ''.join(texts).encode('ascii')
+    codes = _CODES[np.frombuffer(joined, dtype=np.uint8)]
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int32, count=len(texts))
+    owner = np.repeat(np.arange(len(texts), dtype=np.int32), lengths)
+    return codes, owner
+
+
+def text_chunks(texts, max_chars=SCORE_CHUNK_CHARS):
+    """
+    (start, stop) slices of texts with about max_chars characters each (a
+    longer text gets a chunk of its own).
+    """
+    ends = np.cumsum(np.fromiter((len(str(t)) + 1 for t in texts), dtype=np.int64, count=len(texts)))
+    start = 0
+    while start < len(texts):
+        offset = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, offset + max_chars, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+
+# Folding of many texts at once (encode_texts): every byte except a-z and the
+# separator (0) becomes a space
+_FOLD_BYTES = bytes(c if ord('a') <= c <= ord('z') or c == 0 else ord(' ') for c in range(256))
+_SPACE = ord(' ')
+
+
+def encode_texts(texts):
+    """
+    encode([fold_text(t) for t in texts]) in a few vectorized passes over
+    all texts joined together instead of a Python-level fold per text.
+    """
+    texts = [str(t) for t in texts]
+    joined = '\x00'.join(texts)
+    if not texts or joined.count('\x00') != len(texts) - 1:
+        # A text contains the separator itself
+        return encode([fold_text(t) for t in texts])
+    decomposed = unicodedata.normalize('NFKD', joined.lower())
+    raw = np.frombuffer(decomposed.encode('ascii', 'ignore').translate(_FOLD_BYTES), dtype=np.uint8)
+
+    # Collapse runs of spaces, then drop spaces next to a separator or at
+    # either end (what ' '.join(text.split()) does per text)
+    space = raw == _SPACE
+    raw = raw[~(space & np.concatenate(([False], space[:-1])))]
+    space = raw == _SPACE
+    boundary = raw == 0
+    edge = np.concatenate(([True], boundary[:-1])) | np.concatenate((boundary[1:], [True]))
+    raw = raw[~(space & edge)]
+
+    # Pad every text with one space on each side
+    padded = np.frombuffer(b' ' + raw.tobytes().replace(b'\x00', b' \x00 ') + b' ', dtype=np.uint8)
+
+    bounds = np.flatnonzero(padded == 0)
+    lengths = np.diff(np.concatenate(([-1], bounds, [len(padded)]))) - 1
+    owner = np.repeat(np.arange(len(texts), dtype=np.int32), lengths)
+    return _CODES[padded[padded != 0]], owner
+
+
+def trigram_ids(codes):
+    """Trigram ids (int32) of consecutive alphabet codes."""
+    ids = codes[:-2].astype(np.int32)
+    ids *= ALPHABET_SIZE
+    ids += codes[1:-1]
+    ids *= ALPHABET_SIZE
+    ids += codes[2:]
+    return ids
+
+
+def load_model(path=MODEL_FILE):
+    """The shipped log-probability table (cached), or None if it is missing."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            try:
+                table = np.load(path)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Gibberish model not available ({e}); using consonant ratio only")
+                table = False
+            else:
+                table = table.astype(np.float32).ravel()
+                if table.size != ALPHABET_SIZE ** 3:
+                    print(f"Warning: Gibberish model {path} has wrong size; using consonant ratio only")
+                    table = False
+            _model = table
+        return _model if _model is not False else None
+
+
+def perplexities(texts, model=None):
+    """
+    Per-character trigram perplexity of each text (np.nan when it has fewer
+    than GIBBERISH_MIN_LETTERS letters, or the model is unavailable).
+    """
+    result = np.full(len(texts), np.nan)
+    if model is None:
+        model = load_model()
+    if model is None or not len(texts):
+        return result
+
+    for start, stop in text_chunks(texts):
+        chunk = texts[start:stop]
+        codes, owner = encode_texts(chunk)
+        ids = trigram_ids(codes)
+        # Trigrams must not span two texts; each text is padded, so the first
+        # and last characters still get context
+        valid = owner[:-2] == owner[2:]
+        text_of_trigram = owner[:-2][valid]
+        log_probs = model[ids[valid]]
+        del ids, valid
+
+        counts = np.bincount(text_of_trigram, minlength=len(chunk))
+        sums = np.bincount(text_of_trigram, weights=log_probs, minlength=len(chunk))
+        letters = np.bincount(owner[codes != 0], minlength=len(chunk))
+
+        judged = (letters >= GIBBERISH_MIN_LETTERS) & (counts > 0)
+        result[start:stop][judged] = np.exp(-sums[judged] / counts[judged])
+    return result
+
+
+def gibberish_mask(texts, model=None, max_perplexity=GIBBERISH_PERPLEXITY):
+    """Boolean array: True where the text looks like a keyboard mash."""
+    with np.errstate(invalid='ignore'):
+        return perplexities(texts, model) > max_perplexity
@@ -0,0 +1,64 @@
+"""
+Gunicorn configuration - preloaded app with warm-up in the master.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports app.py, loads the analysis modules and runs the warm-up
+analysis once (BRD_PRELOAD); the workers are forked afterwards and share the
+already imported modules, so each of them is ready right away. Settings can
+be changed on the command line or with the environment variables below.
+
+Every worker admits analyses against its own memory budget (admission.py).
+Unless ANALYSIS_MEMORY_BUDGET_MB is set, the default budget (half of the
+physical memory) is split between the workers, so together they stay
+within it.
+"""
+
+import os
+import tempfile
+import time
+
+from admission import default_memory_budget
+
+os.environ.setdefault('BRD_PRELOAD', '1')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Synchronous analyses of big files take minutes
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 600))
+preload_app = True
+
+# Several workers must share jobs, results and uploads (see README, section 13)
+if workers > 1:
+    os.environ.setdefault('STATE_DIR', os.path.join(tempfile.gettempdir(), 'brd_state'))
+
+# Budget per worker; post_fork splits it again by the actual worker count
+# (-w on the command line overrides WEB_CONCURRENCY)
+_split_budget = 'ANALYSIS_MEMORY_BUDGET_MB' not in os.environ
+if _split_budget:
+    os.environ['ANALYSIS_MEMORY_BUDGET_MB'] = str(default_memory_budget() / max(1, workers) / 1024 ** 2)
+
+_forked = {}
+
+
+def when_ready(server):
+    import app
+    server.log.info("Master ready in %.2f s (app %s)", time.time() - app.IMPORT_STARTED,
+                    'ready' if app.startup['ready'] else 'NOT ready')
+
+
+def post_fork(server, worker):
+    import app
+    _forked[worker.pid] = time.time()
+    if _split_budget:
+        app.memory_budget.budget_bytes = default_memory_budget() // max(1, server.num_workers)
+    server.log.info("Worker %s memory budget %.0f MB", worker.pid, app.memory_budget.budget_bytes / 1024 ** 2)
+    app.after_fork()
+
+
+def post_worker_init(worker):
+    started = _forked.pop(worker.pid, None)
+    if started is not None:
+        worker.log.info("Worker %s booted in %.3f s", worker.pid, time.time() - started)
@@ -0,0 +1,291 @@
+"""
+Job Registry - runs analyses in background threads and records their
+progress events, so clients can follow a long-running analysis (Server-Sent
+Events) and duplicate submissions attach to the run already in flight.
+
+Status, events and the final payload live in a state backend
+(state_backend.py) - the only copy of the events, also for jobs of this
+process - so a job started by one server process can be followed from any
+other one (StoredJob polls the backend).
+"""
+
+import threading
+import time
+import traceback
+import uuid
+
+from state_backend import MemoryStateBackend
+
+# Seconds between backend polls when following a job of another process
+JOB_POLL_SEC = 0.5
+
+
+class Job:
+    """One background analysis and its progress events."""
+
+    def __init__(self, key, backend):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.backend = backend
+        self.status = 'queued'      # queued -> running -> done | error
+        self.payload = None         # JSON response body once finished
+        self.http_status = None
+        self.created = time.time()
+        self.finished = None
+        self.event_count = 0
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ('done', 'error')
+
+    @property
+    def events(self):
+        return self.backend.get_job_events(self.id)
+
+    def emit(self, stage, status, done=None, total=None, **extra):
+        """Record a progress event (thread-safe) and wake up listeners."""
+        with self._cond:
+            event = {
+                'seq': self.event_count,
+                'stage': stage,
+                'status': status,
+                'elapsed_sec': round(time.time() - self.created, 3),
+            }
+            if done is not None:
+                event['done'] = done
+                event['total'] = total
+            event.update(extra)
+            self.backend.add_job_event(self.id, event)
+            self.event_count += 1
+            self._cond.notify_all()
+
+    def progress(self, stage, status, done=None, total=None):
+        """Callback passed to analyze_with_questionnaire(progress=...)."""
+        self.emit(stage, status, done, total)
+
+    def _finish(self, payload, http_status):
+        # Condition uses an RLock - the final event is recorded atomically with
+        # the status change, so listeners never stop before seeing it
+        with self._cond:
+            self.payload = payload
+            self.http_status = http_status
+            self.status = 'done' if http_status < 400 else 'error'
+            self.finished = time.time()
+            # Payload stored before the final event, so other processes
+            # seeing that event can read the result
+            self.backend.update_job(self.id, status=self.status, finished=self.finished,
+                                    http_status=http_status, payload=payload)
+            self.emit('job', self.status, http_status=http_status)
+
+    def wait(self, timeout=None):
+        """Block until the job finished; returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def iter_events(self, start=0, heartbeat=15):
+        """
+        Yield events from index `start` as they arrive; yields None every
+        `heartbeat` seconds without news. Ends after the final event.
+        """
+        position = start
+        while True:
+            with self._cond:
+                if position >= self.event_count and not self.done:
+                    self._cond.wait(heartbeat)
+                # The final event is recorded before done turns True
+                finished = self.done
+            new_events = self.backend.get_job_events(self.id, position) if position < self.event_count else []
+            if not new_events and not finished:
+                yield None
+            for event in new_events:
+                yield event
+            position += len(new_events)
+            # Nothing left (or the events were pruned already)
+            if finished and (position >= self.event_count or not new_events):
+                return
+
+    def to_dict(self):
+        last = self.backend.get_job_events(self.id, max(0, self.event_count - 1))
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'finished': self.finished,
+            'last_event': last[-1] if last else None,
+        }
+
+
+# Result of a job whose process stopped updating it (see StoredJob)
+STALE_JOB_PAYLOAD = {
+    'success': False,
+    'error': 'Analýza přestala odpovídat (proces, který ji zpracovával, pravděpodobně skončil). Zkuste to znovu.'
+}
+
+
+class StoredJob:
+    """
+    Read-only view of a job run by another server process, with the
+    interface of Job; waiting and event streams poll the backend.
+    A running job whose record has not changed for stale_sec counts as
+    failed (its process died), so waiting for it ends.
+    """
+
+    def __init__(self, backend, record, stale_sec=None):
+        self.backend = backend
+        self.stale_sec = stale_sec
+        self._load(record)
+
+    def _load(self, record):
+        self.id = record['id']
+        self.key = record['key']
+        self.status = record['status']
+        self.payload = record['payload']
+        self.http_status = record['http_status']
+        self.created = record['created']
+        self.finished = record['finished']
+        if not self.done and self.stale_sec and record['updated'] < time.time() - self.stale_sec:
+            self.status = 'error'
+            self.payload = STALE_JOB_PAYLOAD
+            self.http_status = 500
+
+    def _refresh(self):
+        record = self.backend.get_job(self.id)
+        if record is None:
+            # Pruned meanwhile - nothing more will come
+            self.status = 'error' if self.status not in ('done', 'error') else self.status
+            return
+        self._load(record)
+
+    @property
+    def done(self):
+        return self.status in ('done', 'error')
+
+    @property
+    def events(self):
+        return self.backend.get_job_events(self.id)
+
+    def wait(self, timeout=None, poll=JOB_POLL_SEC):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll)
+            self._refresh()
+        return True
+
+    def iter_events(self, start=0, heartbeat=15, poll=JOB_POLL_SEC):
+        """Same contract as Job.iter_events."""
+        position = start
+        quiet_since = time.monotonic()
+        while True:
+            self._refresh()
+            finished = self.done
+            new_events = self.backend.get_job_events(self.id, position)
+            for event in new_events:
+                yield event
+            position += len(new_events)
+            if finished:
+                return
+            if new_events:
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= heartbeat:
+                quiet_since = time.monotonic()
+                yield None
+            time.sleep(poll)
+
+    def to_dict(self):
+        events = self.events
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'finished': self.finished,
+            'last_event': events[-1] if events else None,
+        }
+
+
+class JobManager:
+    """
+    Registry of jobs keyed by a content key (e.g. hash of the uploaded files).
+    Submitting a key that is still running - in this process or, through the
+    shared backend, in another one - returns the existing job.
+    Finished jobs are kept for `retention_sec` so results can be fetched.
+    A job of another process whose record has not changed for `stale_sec`
+    no longer blocks new runs of its key (that process probably died).
+    """
+
+    def __init__(self, retention_sec=3600, backend=None, stale_sec=900):
+        self.retention_sec = retention_sec
+        self.backend = backend or MemoryStateBackend()
+        self.stale_sec = stale_sec
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, target):
+        """
+        Start target(job) in a background thread unless a job with the same
+        key is in flight. target returns (payload, http_status).
+        Returns (job, created).
+        """
+        with self._lock:
+            self._prune()
+            existing = self._active.get(key)
+            if existing is not None and not existing.done:
+                return existing, False
+
+            job = Job(key, self.backend)
+            while True:
+                holder = self.backend.claim_job(key, job.id, job.created, self.stale_sec)
+                if holder == job.id:
+                    break
+                record = self.backend.get_job(holder)
+                if record is not None:
+                    return self._jobs.get(holder) or StoredJob(self.backend, record, self.stale_sec), False
+                # The holder was pruned meanwhile - claim again
+            self._jobs[job.id] = job
+            self._active[key] = job
+
+        thread = threading.Thread(target=self._run, args=(job, target),
+                                  name=f"job-{job.id[:8]}", daemon=True)
+        thread.start()
+        return job, True
+
+    def active(self, key):
+        """The in-flight job for key (of this process), or None."""
+        with self._lock:
+            job = self._active.get(key)
+            return job if job is not None and not job.done else None
+
+    def get(self, job_id):
+        """A job of this process, a StoredJob view of another one's, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        record = self.backend.get_job(job_id)
+        return StoredJob(self.backend, record, self.stale_sec) if record else None
+
+    def _run(self, job, target):
+        job.status = 'running'
+        self.backend.update_job(job.id, status='running')
+        job.emit('job', 'started')
+        try:
+            payload, http_status = target(job)
+        except Exception as e:
+            print(f"✗ Job {job.id} failed: {e}")
+            print(traceback.format_exc())
+            payload, http_status = {'success': False, 'error': f'Neočekávaná chyba: {str(e)}'}, 500
+        job._finish(payload, http_status)
+        self.backend.release_job_key(job.key, job.id)
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+
+    def _prune(self):
+        """Forget finished jobs older than the retention period (lock held)."""
+        cutoff = time.time() - self.retention_sec
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.finished < cutoff]:
+            del self._jobs[job_id]
+        self.backend.prune_jobs(cutoff)
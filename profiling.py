@@ -0,0 +1,44 @@
+"""
+Profiling helpers - opt-in cProfile runs of single analyses.
+
+Nothing here is imported or executed unless profiling was requested, so
+regular requests pay no overhead.
+"""
+
+import cProfile
+import os
+import pstats
+from contextlib import contextmanager
+
+
+@contextmanager
+def profiled(enabled=True):
+    """Profile the with-block (current thread only); yields the profiler or None."""
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+
+
+def top_functions(profiler, top_n=25, sort='cumulative'):
+    """The top_n hottest functions of a finished profile as JSON-ready dicts."""
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(sort)
+    rows = []
+    for func in stats.fcn_list[:top_n]:
+        primitive_calls, calls, total_time, cumulative_time, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            'function': name,
+            'location': f"{os.path.basename(filename)}:{line}" if line else filename,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_sec': round(total_time, 4),
+            'cumtime_sec': round(cumulative_time, 4),
+        })
+    return rows
@@ -1,41 +1,143 @@
 """
 Questionnaire Parser - reads DOCX questionnaire files and extracts structure.
 Identifies: open questions, batteries, single-choice, multi-choice questions.
+
+The DOCX is streamed: word/document.xml is read straight from the zip with
+an incremental XML parser and handed over line by line, and every line is
+classified by one precompiled regex. mammoth / python-docx are only used
+as a fallback for files that are not a readable DOCX zip.
 """
 
 import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_P = W_NS + 'p'
+W_T = W_NS + 't'
+W_TAB = W_NS + 'tab'
+W_BR = W_NS + 'br'
+W_CR = W_NS + 'cr'
+
+# Question start (Q1, Q2, Q6aB2, etc.)
+QUESTION_RE = re.compile(r'^(Q\d+[a-zA-Z0-9]*(?:B\d+)*(?:B\d+)*)\.\s*(.*)')
 
-try:
-    import mammoth
-except ImportError:
-    mammoth = None
+# Question type markers. When a line matches several types, the one listed
+# last wins (same precedence as the original sequential checks).
+TYPE_PATTERNS = {
+    'open': [
+        r'OTEVŘENÁ OTÁZKA',
+        r'ODPOVĚĎ TEXT',
+        r'OTEVŘENÁ',
+    ],
+    'battery': [
+        r'BATERIE OTÁZEK',
+        r'BATERIE',
+    ],
+    'single': [
+        r'JEDNA MOŽNÁ ODPOVĚĎ',
+    ],
+    'multi': [
+        r'VÍCE MOŽNÝCH ODPOVĚDÍ',
+    ],
+    'text_only': [
+        r'POUZE TEXT',
+    ],
+    'end': [
+        r'KONEC DOTAZNÍKU',
+        r'VYLOUČENÍ RESPONDENTA',
+    ]
+}
+TYPE_PRECEDENCE = {q_type: i for i, q_type in enumerate(TYPE_PATTERNS)}
 
-try:
-    from docx import Document as DocxDocument
-except ImportError:
-    DocxDocument = None
+# Filters/rules - such open questions are not shown to everybody
+FILTER_PATTERN = r'IF\s*\(.*ISCHECKED|THEN\s+EXIT|Pravidla'
+
+# One alternation for all markers. It sits inside a lookahead, so finditer()
+# reports every marker in the line (even overlapping ones) in a single pass;
+# the named group tells which marker matched.
+LINE_MARKERS_RE = re.compile(
+    '(?=' + '|'.join(
+        [f"(?P<{q_type}>{'|'.join(patterns)})" for q_type, patterns in TYPE_PATTERNS.items()]
+        + [f'(?P<filter>{FILTER_PATTERN})']
+    ) + ')',
+    re.IGNORECASE
+)
+
+# Option lines that are question settings, not answer options
+OPTION_SETTINGS_RE = re.compile(
+    r'Nastavení otázky|Povinná|Délka textu|Min\.|Max\.|Zvolených|Pravidla|IF\s*\(',
+    re.IGNORECASE
+)
 
 
 def parse_questionnaire(docx_file):
     """
     Parse a DOCX questionnaire file and extract its structure.
-    
+
     Returns dict with:
     - open_questions: list of open-ended questions (without filters)
     - batteries: list of battery questions (matrix/grid)
     - all_questions: list of all questions
     """
-    
+    try:
+        return parse_structure(iter_docx_lines(docx_file))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        pass
+
+    # Not a plain DOCX zip - let mammoth / python-docx try
     text = extract_text(docx_file)
-    
+
     if not text:
         return {'open_questions': [], 'batteries': [], 'all_questions': []}
-    
+
     return parse_structure(text)
 
 
+def iter_docx_lines(docx_file):
+    """
+    Stream the paragraphs of a DOCX as text lines.
+
+    word/document.xml is parsed incrementally straight from the zip, so the
+    document is never held in memory as a whole. Tabs become '\\t', line
+    breaks start a new line.
+    Raises zipfile.BadZipFile / KeyError for files that are not a DOCX.
+    """
+    with zipfile.ZipFile(docx_file) as docx:
+        with docx.open('word/document.xml') as xml_stream:
+            # Text boxes may nest paragraphs inside paragraphs - keep a stack
+            stack = []
+            for event, elem in ET.iterparse(xml_stream, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == W_P:
+                        stack.append([])
+                    continue
+
+                if tag == W_T:
+                    if stack and elem.text:
+                        stack[-1].append(elem.text)
+                elif tag == W_TAB:
+                    if stack:
+                        stack[-1].append('\t')
+                elif tag == W_BR or tag == W_CR:
+                    if stack:
+                        stack[-1].append('\n')
+                elif tag == W_P:
+                    parts = stack.pop()
+                    elem.clear()
+                    if parts:
+                        yield from ''.join(parts).split('\n')
+
+
 def extract_text(docx_file):
-    """Extract text from DOCX file."""
+    """Extract text from DOCX file (mammoth, then python-docx)."""
+    # Imported lazily - only needed for files the streaming reader rejects
+    try:
+        import mammoth
+    except ImportError:
+        mammoth = None
+
     # Try mammoth first (better for complex docs)
     if mammoth:
         try:
@@ -44,8 +146,13 @@ def extract_text(docx_file):
                 return result.value
         except Exception:
             pass
-    
+
     # Fallback to python-docx
+    try:
+        from docx import Document as DocxDocument
+    except ImportError:
+        DocxDocument = None
+
     if DocxDocument:
         try:
             doc = DocxDocument(docx_file)
@@ -53,32 +160,51 @@ def extract_text(docx_file):
             return '\n'.join(paragraphs)
         except Exception:
             pass
-    
+
     return None
 
 
+def classify_line(line):
+    """
+    Return (question_type or None, has_filter) for one line: the marker with
+    the highest precedence and whether a filter/rule marker is present.
+    """
+    q_type = None
+    has_filter = False
+    for match in LINE_MARKERS_RE.finditer(line):
+        group = match.lastgroup
+        if group == 'filter':
+            has_filter = True
+        elif q_type is None or TYPE_PRECEDENCE[group] > TYPE_PRECEDENCE[q_type]:
+            q_type = group
+    return q_type, has_filter
+
+
 def parse_structure(text):
-    """Parse questionnaire text into structured format."""
-    
+    """
+    Parse questionnaire text into structured format.
+    text: the whole text, or an iterable of lines (see iter_docx_lines).
+    """
+
     questions = []
     open_questions = []
     batteries = []
-    
-    lines = text.split('\n')
-    
+
+    lines = text.split('\n') if isinstance(text, str) else text
+
     current_question = None
     current_options = []
     current_type = None
     has_filter = False
-    
+
     for line in lines:
         line = line.strip()
         if not line:
             continue
-        
+
         # Detect question start (Q1, Q2, Q6aB2, etc.)
-        q_match = re.match(r'^(Q\d+[a-zA-Z0-9]*(?:B\d+)*(?:B\d+)*)\.\s*(.*)', line)
-        
+        q_match = QUESTION_RE.match(line)
+
         if q_match:
             # Save previous question
             if current_question:
@@ -90,14 +216,14 @@ def parse_structure(text):
                     'has_filter': has_filter
                 }
                 questions.append(q_info)
-                
+
                 # Classify
                 if current_type == 'open' and not has_filter:
                     open_questions.append(q_info)
                 elif current_type == 'battery':
                     q_info['items'] = current_options
                     batteries.append(q_info)
-            
+
             # Start new question
             current_question = q_match.group(1)
             current_text = q_match.group(2).strip()
@@ -105,56 +231,20 @@ def parse_structure(text):
             current_type = None
             has_filter = False
             continue
-        
-        # Detect question type
-        type_patterns = {
-            'open': [
-                r'OTEVŘENÁ OTÁZKA',
-                r'ODPOVĚĎ TEXT',
-                r'OTEVŘENÁ',
-            ],
-            'battery': [
-                r'BATERIE OTÁZEK',
-                r'BATERIE',
-            ],
-            'single': [
-                r'JEDNA MOŽNÁ ODPOVĚĎ',
-            ],
-            'multi': [
-                r'VÍCE MOŽNÝCH ODPOVĚDÍ',
-            ],
-            'text_only': [
-                r'POUZE TEXT',
-            ],
-            'end': [
-                r'KONEC DOTAZNÍKU',
-                r'VYLOUČENÍ RESPONDENTA',
-            ]
-        }
-        
-        for q_type, patterns in type_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, line, re.IGNORECASE):
-                    current_type = q_type
-                    break
-        
-        # Detect filters/rules
-        if re.search(r'IF\s*\(.*ISCHECKED', line, re.IGNORECASE):
-            has_filter = True
-        if re.search(r'THEN\s+EXIT', line, re.IGNORECASE):
-            has_filter = True
-        if re.search(r'Pravidla', line, re.IGNORECASE):
+
+        # Detect question type and filters/rules in one pass
+        line_type, line_filter = classify_line(line)
+        if line_type:
+            current_type = line_type
+        if line_filter:
             has_filter = True
-        
-        # Collect options (lines starting with -)
+
+        # Collect options (lines starting with -); type markers are not options
         if line.startswith('-') or line.startswith('•'):
             option_text = line.lstrip('-•').strip()
-            if option_text and not any(re.search(p, option_text, re.IGNORECASE) 
-                                       for patterns in type_patterns.values() 
-                                       for p in patterns):
-                if not re.search(r'Nastavení otázky|Povinná|Délka textu|Min\.|Max\.|Zvolených|Pravidla|IF\s*\(', option_text, re.IGNORECASE):
-                    current_options.append(option_text)
-    
+            if option_text and line_type is None and not OPTION_SETTINGS_RE.search(option_text):
+                current_options.append(option_text)
+
     # Don't forget the last question
     if current_question:
         q_info = {
@@ -165,18 +255,18 @@ def parse_structure(text):
             'has_filter': has_filter
         }
         questions.append(q_info)
-        
+
         if current_type == 'open' and not has_filter:
             open_questions.append(q_info)
         elif current_type == 'battery':
             q_info['items'] = current_options
             batteries.append(q_info)
-    
+
     print(f"   Questionnaire parser results:")
     print(f"   - Total questions: {len(questions)}")
     print(f"   - Open questions (no filter): {len(open_questions)}")
     print(f"   - Batteries: {len(batteries)}")
-    
+
     return {
         'open_questions': open_questions,
         'batteries': batteries,
@@ -0,0 +1,111 @@
+"""
+Answer relevance - local TF-IDF similarity of open answers to the question.
+
+Texts are folded like in gibberish.py (ASCII letters and single spaces) and
+split into character trigrams. A trigram's alphabet codes index the feature
+space directly (27^3 features, the ids of the gibberish model), so no
+vocabulary is built and there are no hash collisions. Vectors are sparse
+(doc, feature, weight) triplets in plain numpy arrays:
+
+    weight = (1 + log count) * idf[feature]
+
+The IDF is fitted on the question texts of the questionnaire, not on the
+answers: trigrams shared by many questions ("proc", "jak se vam") weigh
+little, the ones specific to a question weigh a lot. It therefore does not
+depend on which rows are analyzed, so sharded runs score like a single one.
+
+Cosine similarity of a batch of answers with one question is one sparse x
+dense product: the question is expanded to a dense vector and the products
+are summed per answer with np.bincount - no Python loop over answers.
+Answers are scored in chunks of about SCORE_CHUNK_CHARS characters (like
+the gibberish model), so memory does not grow with the total answer text.
+Answers that merely copy the question (similarity >= RELEVANCE_ECHO) get 0.
+"""
+
+import numpy as np
+
+from gibberish import ALPHABET_SIZE, encode_texts, text_chunks, trigram_ids
+
+N_FEATURES = ALPHABET_SIZE ** 3
+# Similarity at or above which an answer counts as a copy of the question
+RELEVANCE_ECHO = 0.8
+
+
+def trigram_counts(texts):
+    """
+    Character trigram counts of texts as sparse triplets (doc, feature,
+    count), sorted by doc and feature.
+    """
+    codes, owner = encode_texts(texts)
+    if len(codes) < 3:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    ids = trigram_ids(codes)
+    # Trigrams must not span two texts (each text is space-padded)
+    valid = owner[:-2] == owner[2:]
+    keys = owner[:-2][valid].astype(np.int64)
+    keys *= N_FEATURES
+    keys += ids[valid]
+    del ids, valid
+    if not keys.size:
+        return keys, keys, keys
+
+    # Sort (doc, feature) keys and count equal runs
+    keys.sort()
+    first = np.empty(len(keys), dtype=bool)
+    first[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=first[1:])
+    starts = np.flatnonzero(first)
+    counts = np.diff(starts, append=len(keys))
+    doc, feature = np.divmod(keys[starts], N_FEATURES)
+    return doc, feature, counts
+
+
+class RelevanceModel:
+    """TF-IDF model fitted on the question texts of one questionnaire."""
+
+    def __init__(self, questions):
+        self.questions = [str(q or '') for q in questions]
+        doc, feature, count = trigram_counts(self.questions)
+        doc_freq = np.bincount(feature, minlength=N_FEATURES)
+        # Smoothed IDF; trigrams absent from all questions get the maximum
+        n_docs = len(self.questions)
+        self.idf = (np.log((1 + n_docs) / (1 + doc_freq)) + 1).astype(np.float32)
+        self._question_terms = (doc, feature, self._weights(feature, count))
+
+    def _weights(self, feature, count):
+        # Sublinear term frequency 1 + log(count), looked up per distinct count
+        tf = (1 + np.log(np.arange(1, count.max() + 1))).astype(np.float32) if count.size else None
+        return tf[count - 1] * self.idf[feature] if count.size else np.zeros(0, dtype=np.float32)
+
+    def question_vector(self, index):
+        """Dense L2-normalized TF-IDF vector of question `index`."""
+        doc, feature, weight = self._question_terms
+        own = doc == index
+        vector = np.zeros(N_FEATURES, dtype=np.float32)
+        norm = np.sqrt(np.sum(weight[own] ** 2))
+        if norm > 0:
+            vector[feature[own]] = weight[own] / norm
+        return vector
+
+    def scores(self, index, answers):
+        """
+        Cosine similarity (0-1) of each answer with question `index`; 0 for
+        empty answers and for copies of the question (see RELEVANCE_ECHO).
+        """
+        result = np.zeros(len(answers))
+        if not answers:
+            return result
+        vector = self.question_vector(index)
+        for start, stop in text_chunks(answers):
+            size = stop - start
+            doc, feature, count = trigram_counts(answers[start:stop])
+            weight = self._weights(feature, count)
+            norms = np.sqrt(np.bincount(doc, weights=weight * weight, minlength=size))
+            # Only trigrams of the question contribute to the dot product
+            question = vector[feature]
+            shared = np.flatnonzero(question)
+            dots = np.bincount(doc[shared], weights=weight[shared] * question[shared], minlength=size)
+            np.divide(dots, norms, out=result[start:stop], where=norms > 0)
+        result[result >= RELEVANCE_ECHO] = 0.0
+        return result
@@ -0,0 +1,153 @@
+"""
+Respondent export - the per-respondent flags and scores of an analysis as a
+machine-readable table for downstream cleaning jobs.
+
+One row per respondent (row order of the SAV file):
+
+    <id column>             respondent ID (named like the ID column of the data)
+    tier                    high / medium / low / ok (see recommendations)
+    risk_group              all_three, speeders_open, ... or empty
+    duration_sec            interview duration in seconds
+    duration_reference_sec  median duration the respondent is compared with
+    open_avg                average open-ended answer quality score
+    open_relevance          average relevance of the answers to their question
+    open_adjusted           open_avg minus the cross-question similarity penalty
+                            plus the relevance bonus (see open_adjusted_scores)
+    straight_count          straight-lined batteries
+    flagged_batteries       batteries flagged by the enabled battery metrics
+    speeders, ...           0/1 flag per detector (see DETAIL_DETECTORS)
+
+The table is produced in chunks of rows: CSV is streamed chunk by chunk
+(iter_csv), Parquet is written one row group per chunk (write_parquet), so
+the formatted output is never held in memory as a whole. Parquet needs the
+optional pyarrow package.
+"""
+
+import csv
+import io
+
+import numpy as np
+
+from bad_respondents_detector import DETAIL_DETECTORS, respondent_table
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_CHUNK_ROWS = 10000
+EXPORT_FORMATS = ('csv', 'parquet')
+FLOAT_DIGITS = 4
+
+
+def parquet_available():
+    return pa is not None
+
+
+def export_columns(results):
+    """Column names of the export (the first one is the ID column)."""
+    return ([results.get('id_column') or 'id', 'tier', 'risk_group', 'duration_sec',
+             'duration_reference_sec', 'open_avg', 'open_relevance', 'open_adjusted', 'straight_count',
+             'flagged_batteries'] + list(DETAIL_DETECTORS))
+
+
+def _risk_group_lookup(results):
+    lookup = {}
+    for group, ids in results['risk_groups'].items():
+        for resp_id in ids:
+            lookup[resp_id] = group
+    return lookup
+
+
+def iter_export_chunks(results, table=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield the export as {column: array} chunks of at most chunk_rows rows.
+    table: respondent_table(results) when the caller already has it.
+    """
+    if table is None:
+        table = respondent_table(results)
+    raw = results['raw_metrics']
+    columns = export_columns(results)
+    groups = _risk_group_lookup(results)
+    n = len(table['id'])
+    # Analyses stored before relevance scoring have no relevance metric
+    relevance = raw.get('open_relevance', np.zeros(n))
+
+    for start in range(0, n, chunk_rows):
+        stop = min(start + chunk_rows, n)
+        ids = table['id'][start:stop]
+        chunk = {
+            columns[0]: ids,
+            'tier': table['risk'][start:stop],
+            'risk_group': np.array([groups.get(resp_id, '') for resp_id in ids], dtype=object),
+            'duration_sec': np.round(table['duration_sec'][start:stop], FLOAT_DIGITS),
+            'duration_reference_sec': np.round(table['duration_reference_sec'][start:stop], FLOAT_DIGITS),
+            'open_avg': np.round(raw['open_avg'][start:stop], FLOAT_DIGITS),
+            'open_relevance': np.round(relevance[start:stop], FLOAT_DIGITS),
+            'open_adjusted': np.round(table['open_score'][start:stop], FLOAT_DIGITS),
+            'straight_count': np.asarray(raw['straight_count'][start:stop], dtype=np.int64),
+            'flagged_batteries': np.asarray(table['flagged_batteries'][start:stop], dtype=np.int64),
+        }
+        for name in DETAIL_DETECTORS:
+            chunk[name] = table[name][start:stop]
+        yield chunk
+
+
+def _csv_column(values):
+    """Plain Python values for csv.writer: 0/1 flags, empty cell for NaN."""
+    if values.dtype == bool:
+        return values.astype(np.int8).tolist()
+    if values.dtype.kind == 'f':
+        return [v if v == v else '' for v in values.tolist()]
+    return values.tolist()
+
+
+def iter_csv(results, table=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield the export as UTF-8 CSV, one bytes block per chunk (header first)."""
+    columns = export_columns(results)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def flush():
+        data = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(columns)
+    yield flush()
+    for chunk in iter_export_chunks(results, table, chunk_rows):
+        writer.writerows(zip(*(_csv_column(chunk[col]) for col in columns)))
+        yield flush()
+
+
+def write_parquet(results, path, table=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write the export to a Parquet file, one row group per chunk. Needs pyarrow."""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    columns = export_columns(results)
+    writer = None
+    try:
+        for chunk in iter_export_chunks(results, table, chunk_rows):
+            batch = pa.table({col: pa.array(chunk[col], from_pandas=True) for col in columns})
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_table(batch)
+        if writer is None:
+            pq.write_table(pa.table({col: pa.array([]) for col in columns}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_export(results, path, fmt='csv', table=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Write the export to path in one of EXPORT_FORMATS."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (allowed: {', '.join(EXPORT_FORMATS)})")
+    if fmt == 'parquet':
+        write_parquet(results, path, table, chunk_rows)
+        return
+    with open(path, 'wb') as f:
+        for block in iter_csv(results, table, chunk_rows):
+            f.write(block)
@@ -0,0 +1,331 @@
+"""
+SAV Cache - converts a SAV file once into a memory-mappable columnar format
+so repeated analyses of the same file skip the slow pyreadstat decode.
+
+Layout of one cache entry (directory named by the file's content hash):
+    manifest.pkl        column order, storage kind and dtype of each column
+    meta.pkl            pickled pyreadstat metadata
+    <i>.npy             numeric/datetime column i (loaded with mmap_mode='r')
+    <i>.data.npy        string column i - concatenated UTF-8 bytes (mmapped;
+                        only the rows read are decoded)
+    <i>.offsets.npy     string column i - start offsets (n + 1 values)
+    <i>.pkl             any other object column (pickled, not mmapped)
+
+The cache is optional: it is used only when a cache directory is passed in
+or set via the BRD_CACHE_DIR environment variable. Entries are immutable,
+so the directory can be wiped at any time.
+"""
+
+import copy
+import hashlib
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyreadstat
+
+CACHE_VERSION = 1
+CACHE_DIR_ENV = 'BRD_CACHE_DIR'
+
+
+def get_cache_dir(cache_dir=None):
+    """Return the cache directory to use, or None when caching is disabled."""
+    return cache_dir or os.environ.get(CACHE_DIR_ENV) or None
+
+
+# Digests of recently hashed files by (path, inode, size, mtime): one
+# analysis asks for the hash of its upload several times (job key, metadata,
+# data), the file is read only once
+_HASH_CACHE_SIZE = 64
+_hash_cache = OrderedDict()
+_hash_lock = threading.Lock()
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Content hash of a file (streamed, constant memory; cached while unchanged)."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        digest = _hash_cache.get(key)
+        if digest is not None:
+            _hash_cache.move_to_end(key)
+            return digest
+
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hash_cache[key] = digest
+        while len(_hash_cache) > _HASH_CACHE_SIZE:
+            _hash_cache.popitem(last=False)
+    return digest
+
+
+def read_sav_cached(sav_file, usecols=None, cache_dir=None):
+    """
+    Drop-in replacement for pyreadstat.read_sav(sav_file, usecols=...).
+
+    With caching enabled, the first call converts the whole file into the
+    cache; every later call memory-maps only the requested columns.
+    Returns (df, meta) like pyreadstat.
+    """
+    cache_dir = get_cache_dir(cache_dir)
+    if not cache_dir:
+        return pyreadstat.read_sav(sav_file, usecols=usecols)
+
+    entry = _ensure_entry(sav_file, cache_dir)
+    return _load_entry(entry, usecols)
+
+
+def read_sav_metadata(sav_file, cache_dir=None):
+    """Metadata only (no data rows) - served from the cache when available."""
+    cache_dir = get_cache_dir(cache_dir)
+    entry = _existing_entry(sav_file, cache_dir) if cache_dir else None
+    if entry:
+        return _load_meta(entry)
+
+    _, meta = pyreadstat.read_sav(sav_file, metadataonly=True)
+    return meta
+
+
+def sample_blocks(total_rows, rows, blocks=20, mode='strided', seed=None):
+    """
+    Contiguous (offset, length) row blocks covering about `rows` of
+    `total_rows`. The file is cut into `blocks` equal strata with one block
+    per stratum - at the stratum start ('strided') or at a random position
+    inside it ('random'), so the sample spans the whole fieldwork period even
+    when the file is ordered by completion time.
+    """
+    if mode not in ('strided', 'random'):
+        raise ValueError(f"Unknown sample mode: {mode}")
+    blocks = max(1, min(blocks, rows))
+    stratum = total_rows / blocks
+    length = min(-(-rows // blocks), int(stratum))
+    rng = np.random.default_rng(seed)
+    result = []
+    for i in range(blocks):
+        start = int(i * stratum)
+        if mode == 'random':
+            start += int(rng.integers(0, int(stratum) - length + 1))
+        result.append((start, min(length, total_rows - start)))
+    return result
+
+
+def read_sav_sample(sav_file, rows, usecols=None, cache_dir=None, mode='strided', seed=None, blocks=20):
+    """
+    Read a row sample (see sample_blocks) instead of the whole file.
+
+    When the file is already in the cache, the blocks are sliced from the
+    memory-mapped columns; otherwise each block is read with pyreadstat
+    row_offset / row_limit (a cache miss does not convert the whole file -
+    that would cost more than the sample). Returns (df, meta) like
+    read_sav_cached, with a fresh RangeIndex.
+    """
+    cache_dir = get_cache_dir(cache_dir)
+    entry = _existing_entry(sav_file, cache_dir) if cache_dir else None
+    if entry:
+        total_rows = _load_meta(entry).number_rows
+    else:
+        _, meta = pyreadstat.read_sav(sav_file, metadataonly=True)
+        total_rows = meta.number_rows
+    if not total_rows or rows >= total_rows:
+        return read_sav_cached(sav_file, usecols=usecols, cache_dir=cache_dir)
+
+    spans = sample_blocks(total_rows, rows, blocks, mode, seed)
+    if entry:
+        df, meta = _load_entry(entry, usecols, spans)
+    else:
+        parts = []
+        for start, length in spans:
+            part, meta = pyreadstat.read_sav(sav_file, usecols=usecols, row_offset=start, row_limit=length)
+            parts.append(part)
+        df = pd.concat(parts, ignore_index=True)
+    meta = copy.copy(meta)
+    meta.number_rows = len(df)
+    return df, meta
+
+
+def read_sav_rows(sav_file, row_offset, row_limit, usecols=None, cache_dir=None):
+    """
+    Read one contiguous row range (a shard, see sharding.py). Returns
+    (df, meta) like read_sav_cached, with a fresh RangeIndex.
+    """
+    cache_dir = get_cache_dir(cache_dir)
+    if cache_dir:
+        df, meta = _load_entry(_ensure_entry(sav_file, cache_dir), usecols, [(row_offset, row_limit)])
+    else:
+        df, meta = pyreadstat.read_sav(sav_file, usecols=usecols, row_offset=row_offset, row_limit=row_limit)
+    meta = copy.copy(meta)
+    meta.number_rows = len(df)
+    return df, meta
+
+
+# =============================================================================
+# BUILDING CACHE ENTRIES
+# =============================================================================
+
+def _entry_name(digest):
+    return f"v{CACHE_VERSION}_{digest}"
+
+
+def _existing_entry(sav_file, cache_dir):
+    """The complete entry directory of sav_file, or None when it is not cached."""
+    entry = os.path.join(cache_dir, _entry_name(file_hash(sav_file)))
+    return entry if os.path.exists(os.path.join(entry, 'manifest.pkl')) else None
+
+
+def _load_meta(entry):
+    with open(os.path.join(entry, 'meta.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+def _ensure_entry(sav_file, cache_dir):
+    """Return the entry directory for sav_file, converting the file if needed."""
+    entry = os.path.join(cache_dir, _entry_name(file_hash(sav_file)))
+    if os.path.exists(os.path.join(entry, 'manifest.pkl')):
+        return entry
+
+    print(f"   Cache miss - converting {os.path.basename(sav_file)} to columnar cache")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Build in a private directory and rename at the end, so concurrent
+    # processes never see a half-written entry
+    tmp_entry = f"{entry}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_entry)
+    try:
+        df, meta = pyreadstat.read_sav(sav_file)
+        _write_entry(tmp_entry, df, meta)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process finished the same entry first
+            if not os.path.exists(os.path.join(entry, 'manifest.pkl')):
+                raise
+    finally:
+        if os.path.exists(tmp_entry):
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    return entry
+
+
+def _write_entry(entry, df, meta):
+    columns = []
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if series.dtype.kind in 'biufcmM':
+            np.save(os.path.join(entry, f"{i}.npy"), series.to_numpy())
+            kind = 'array'
+        elif _is_text(series):
+            _write_strings(entry, i, series)
+            kind = 'strings'
+        else:
+            with open(os.path.join(entry, f"{i}.pkl"), 'wb') as f:
+                pickle.dump(series.to_numpy(dtype=object), f, protocol=pickle.HIGHEST_PROTOCOL)
+            kind = 'pickle'
+        columns.append({'name': col, 'index': i, 'kind': kind})
+
+    with open(os.path.join(entry, 'meta.pkl'), 'wb') as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Manifest last - its presence marks the entry as complete
+    manifest = {'version': CACHE_VERSION, 'rows': len(df), 'columns': columns}
+    with open(os.path.join(entry, 'manifest.pkl'), 'wb') as f:
+        pickle.dump(manifest, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _is_text(series):
+    """True for string columns that hold only str values (missing = '')."""
+    values = series.to_numpy(dtype=object)
+    return all(isinstance(v, str) for v in values)
+
+
+def _write_strings(entry, i, series):
+    encoded = [v.encode('utf-8') for v in series.to_numpy(dtype=object)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    np.save(os.path.join(entry, f"{i}.data.npy"), data)
+    np.save(os.path.join(entry, f"{i}.offsets.npy"), offsets)
+
+
+# =============================================================================
+# LOADING CACHE ENTRIES
+# =============================================================================
+
+def _load_entry(entry, usecols=None, spans=None):
+    """
+    (df, meta) of the cached columns usecols, limited to the (offset, length)
+    row spans when given. Numeric columns of a single span stay memory
+    mapped; string columns decode just the rows of the spans.
+    """
+    with open(os.path.join(entry, 'manifest.pkl'), 'rb') as f:
+        manifest = pickle.load(f)
+    meta = _load_meta(entry)
+    rows = manifest['rows']
+    spans = [(min(start, rows), max(0, min(length, rows - start))) for start, length in (spans or [(0, rows)])]
+
+    columns = manifest['columns']
+    if usecols is not None:
+        wanted = set(usecols)
+        columns = [c for c in columns if c['name'] in wanted]
+        meta = _subset_meta(meta, [c['name'] for c in columns])
+
+    data = {}
+    for c in columns:
+        base = os.path.join(entry, str(c['index']))
+        if c['kind'] == 'array':
+            data[c['name']] = _take_spans(np.load(f"{base}.npy", mmap_mode='r'), spans)
+        elif c['kind'] == 'strings':
+            data[c['name']] = _load_strings(base, spans)
+        else:
+            with open(f"{base}.pkl", 'rb') as f:
+                data[c['name']] = _take_spans(pickle.load(f), spans)
+
+    df = pd.DataFrame(data, columns=[c['name'] for c in columns], copy=False)
+    if not columns:
+        df = pd.DataFrame(index=pd.RangeIndex(sum(length for _, length in spans)))
+    return df, meta
+
+
+def _take_spans(values, spans):
+    """Rows of the spans; a single span is a view (no copy of an mmap)."""
+    if len(spans) == 1:
+        start, length = spans[0]
+        return values[start:start + length]
+    return np.concatenate([values[start:start + length] for start, length in spans])
+
+
+def _load_strings(base, spans):
+    """Decode the rows of the spans from the memory-mapped UTF-8 buffer."""
+    raw = np.load(f"{base}.data.npy", mmap_mode='r')
+    offsets = np.load(f"{base}.offsets.npy", mmap_mode='r')
+    values = []
+    for start, length in spans:
+        bounds = (offsets[start:start + length + 1] - offsets[start]).tolist()
+        buf = raw[offsets[start]:offsets[start + length]].tobytes()
+        values.extend(buf[bounds[k]:bounds[k + 1]].decode('utf-8') for k in range(len(bounds) - 1))
+    result = np.empty(len(values), dtype=object)
+    result[:] = values
+    return result
+
+
+def _subset_meta(meta, names):
+    """Restrict pyreadstat metadata to the selected columns (as usecols does)."""
+    meta = copy.copy(meta)
+    keep = set(names)
+    positions = [i for i, name in enumerate(meta.column_names) if name in keep]
+
+    for attr, value in list(vars(meta).items()):
+        if isinstance(value, dict) and attr not in ('value_labels', 'mr_sets'):
+            setattr(meta, attr, {k: v for k, v in value.items() if k in keep})
+    meta.column_labels = [meta.column_labels[i] for i in positions]
+    meta.column_names = [meta.column_names[i] for i in positions]
+    meta.number_columns = len(meta.column_names)
+    return meta
@@ -0,0 +1,516 @@
+"""
+Sharded analysis - map/reduce over row ranges of one SAV file.
+
+A coordinator (analyze_sharded) plans the analysis once - questionnaire,
+columns, ID column - and cuts the file into row ranges (shards). Workers run
+the map phase (map_shard) on one shard each and return a compact partial:
+
+    raw             per-row raw metrics, the arrays apply_thresholds() uses
+    results         per-shard detector output (open-ended scores, battery
+                    codes, segment labels, ...)
+    page_seconds    per-row page times (the page ratios need global medians)
+    sketches        mergeable DurationSketch histograms of interview and
+                    page times
+
+The reduce phase (reduce_partials) merges the partials in row order -
+aligning batteries, pages and segment codes that differ between shards -
+takes page medians from the merged sketches and classifies everything with
+apply_thresholds(), so the result has the standard shape.
+
+Shards travel through queues served by a multiprocessing BaseManager.
+Local workers are processes that connect to it exactly like workers on
+other hosts do:
+
+    python sharding.py --connect coordinator-host:50000
+
+(with the same BRD_SHARD_AUTHKEY; the SAV/DOCX must be readable under the
+same path on every host, e.g. on shared storage).
+"""
+
+import contextlib
+import io
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+from bad_respondents_detector import (
+    StageStats,
+    apply_thresholds,
+    empty_results,
+    find_id_column,
+    load_questionnaire,
+    optimize_dtypes,
+    print_summary,
+    resolve_thresholds,
+)
+from sav_cache import read_sav_cached, read_sav_metadata, read_sav_rows, read_sav_sample
+
+AUTHKEY_ENV = 'BRD_SHARD_AUTHKEY'
+
+# Default shard size when the number of shards is not given
+SHARD_ROWS = 50_000
+
+# Rows read by the coordinator to choose the ID column
+PLAN_SAMPLE_ROWS = 10_000
+
+# Seconds without any finished shard before the run is given up
+SHARD_TIMEOUT_SEC = 600
+
+# How often a failed shard is handed out again
+SHARD_RETRIES = 1
+
+
+# =============================================================================
+# DURATION SKETCH
+# =============================================================================
+
+class DurationSketch:
+    """
+    Mergeable histogram of positive durations with log-spaced buckets.
+
+    Bucket edges grow by GROWTH, so quantiles come back within about 1 % of
+    the exact value whatever the scale; merging is adding the counts, so
+    sketches of shards combine in any order.
+    """
+
+    MIN_SEC = 0.01
+    MAX_SEC = 1e7
+    GROWTH = 1.02
+    BUCKETS = int(math.ceil(math.log(MAX_SEC / MIN_SEC) / math.log(GROWTH))) + 1
+
+    def __init__(self):
+        self.counts = np.zeros(self.BUCKETS, dtype=np.int64)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values) & (values > 0)]
+        buckets = np.floor(np.log(values / self.MIN_SEC) / math.log(self.GROWTH))
+        buckets = np.clip(buckets, 0, self.BUCKETS - 1).astype(np.int64)
+        self.counts += np.bincount(buckets, minlength=self.BUCKETS)
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q):
+        """Approximate q-quantile (geometric bucket centre), NaN when empty."""
+        total = self.count
+        if not total:
+            return np.nan
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q * total, side='left'))
+        bucket = min(bucket, self.BUCKETS - 1)
+        return self.MIN_SEC * self.GROWTH ** (bucket + 0.5)
+
+    def quantiles(self, qs=(0.1, 0.25, 0.5, 0.75, 0.9)):
+        return {f"p{round(q * 100)}": round(self.quantile(q), 1) for q in qs}
+
+
+# =============================================================================
+# PLAN & MAP PHASE
+# =============================================================================
+
+def shard_ranges(total_rows, shards=None, shard_rows=SHARD_ROWS):
+    """(row_offset, row_limit) of each shard, in file order."""
+    if shards is None:
+        shards = -(-total_rows // shard_rows)
+    shards = max(1, min(int(shards), total_rows or 1))
+    bounds = np.linspace(0, total_rows, shards + 1).astype(np.int64)
+    return [(int(start), int(end - start)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def plan_analysis(sav_file, docx_file=None, cache_dir=None, thresholds=None, detectors=None,
+                  optimize_memory=True, segment_by=None, shards=None):
+    """
+    Everything the shards must agree on: questionnaire structure, columns
+    to read and the ID column (chosen from a row sample spread over the
+    file). The plan is plain data, so it can be sent to remote workers.
+    """
+    from detectors import DEFAULT_DETECTORS, id_column_candidates, select_analysis_columns
+
+    detectors = DEFAULT_DETECTORS if detectors is None else detectors
+    structure = load_questionnaire(docx_file) if docx_file else None
+    meta = read_sav_metadata(sav_file, cache_dir=cache_dir)
+    usecols = select_analysis_columns(meta, structure, detectors, segment_by)
+
+    id_columns = [col for col in usecols if col in set(id_column_candidates(meta.column_names))]
+    if meta.number_rows and meta.number_rows > PLAN_SAMPLE_ROWS:
+        head, _ = read_sav_sample(sav_file, PLAN_SAMPLE_ROWS, usecols=id_columns, cache_dir=cache_dir)
+    else:
+        head, _ = read_sav_cached(sav_file, usecols=id_columns, cache_dir=cache_dir)
+
+    return {
+        'sav_file': os.path.abspath(sav_file),
+        'cache_dir': cache_dir,
+        'structure': structure,
+        'usecols': usecols,
+        'id_column': find_id_column(head),
+        'total_rows': meta.number_rows,
+        'total_columns': meta.number_columns,
+        'thresholds': resolve_thresholds(thresholds),
+        'detectors': list(detectors),
+        'optimize_memory': optimize_memory,
+        'segment_by': segment_by,
+        'shards': shard_ranges(meta.number_rows or 0, shards),
+    }
+
+
+def map_shard(plan, index):
+    """
+    Map phase: analyze shard `index` of the plan and return its partial.
+    Page speeders are only timed here - their ratios need the medians of
+    all shards and are computed in reduce_partials().
+    """
+    from detectors import PageSpeederDetector, run_detectors
+
+    started = time.perf_counter()
+    row_offset, row_limit = plan['shards'][index]
+    df, meta = read_sav_rows(plan['sav_file'], row_offset, row_limit, usecols=plan['usecols'],
+                             cache_dir=plan['cache_dir'])
+    if plan['optimize_memory']:
+        df, _ = optimize_dtypes(df, meta)
+
+    ctx = {
+        'thresholds': plan['thresholds'],
+        'progress': None,
+        'segment_by': plan['segment_by'],
+        'id_column': plan['id_column'],
+        'structure': plan['structure'],
+        'meta': meta,
+    }
+    page_detectors = [d for d in plan['detectors'] if isinstance(d, PageSpeederDetector)]
+    others = [d for d in plan['detectors'] if not isinstance(d, PageSpeederDetector)]
+    raw, extra = run_detectors(df, ctx, others, max_workers=1)
+
+    page_seconds, pages = None, []
+    if page_detectors:
+        page_seconds, pages = page_detectors[0].page_times(df, ctx)
+        if page_seconds is not None:
+            page_seconds = page_seconds.astype(np.float32)
+
+    return {
+        'index': index,
+        'rows': len(df),
+        'raw': raw,
+        'results': extra,
+        'page_seconds': page_seconds,
+        'pages': pages,
+        'duration_sketch': DurationSketch().add(raw['duration_sec']),
+        'page_sketches': [DurationSketch().add(page_seconds[:, j]) for j in range(len(pages))],
+        'elapsed_sec': round(time.perf_counter() - started, 3),
+    }
+
+
+# =============================================================================
+# REDUCE PHASE
+# =============================================================================
+
+def _fill_value(dtype):
+    if dtype.kind == 'b':
+        return False
+    return np.nan if dtype.kind in 'fc' else 0
+
+
+def _align_columns(parts, keys_of_parts):
+    """
+    Stack per-shard row × key matrices whose key lists may differ
+    (a battery or page missing in one shard) into one matrix over the
+    union of keys; missing cells get NaN / False / 0.
+    """
+    keys = list(dict.fromkeys(key for part_keys in keys_of_parts for key in part_keys))
+    dtype = next((part.dtype for part in parts if part.shape[1]), np.dtype(np.float32))
+    rows = []
+    for part, part_keys in zip(parts, keys_of_parts):
+        n = part.shape[0]
+        full = np.full((n, len(keys)), _fill_value(dtype), dtype=dtype)
+        if part_keys:
+            full[:, [keys.index(key) for key in part_keys]] = part
+        rows.append(full)
+    return np.concatenate(rows), keys
+
+
+def reduce_partials(partials, plan):
+    """
+    Reduce phase: merge partials (any order) and classify.
+    Returns a results dict like analyze_with_questionnaire().
+    """
+    from detectors import page_time_ratios
+
+    partials = sorted(partials, key=lambda p: p['index'])
+    raws = [p['raw'] for p in partials]
+    extras = [p['results'] for p in partials]
+
+    raw = {'ids': [resp_id for r in raws for resp_id in r['ids']]}
+    battery_codes = [e.get('battery_codes', []) for e in extras]
+    for key in dict.fromkeys(key for r in raws for key in r):
+        if key in ('ids', 'segment'):
+            continue
+        if key.startswith('battery_'):
+            raw[key], _ = _align_columns(
+                [r[key] if key in r else np.empty((p['rows'], 0), dtype=np.float32)
+                 for p, r in zip(partials, raws)],
+                battery_codes)
+        else:
+            raw[key] = np.concatenate([r[key] for r in raws])
+
+    results = empty_results(len(raw['ids']), plan['id_column'])
+    for extra in extras:
+        results['open_ended_scores'].update(extra.get('open_ended_scores', {}))
+        results['battery_length'] = max(results['battery_length'], extra.get('battery_length', 0))
+    if any(battery_codes):
+        results['battery_codes'] = list(dict.fromkeys(code for codes in battery_codes for code in codes))
+
+    # Segment codes are per shard - map them onto one label list
+    if plan['segment_by'] and all('segment' in r for r in raws):
+        labels = list(dict.fromkeys(label for e in extras for label in e['segment_labels']))
+        position = {label: code for code, label in enumerate(labels)}
+        segments = []
+        for r, e in zip(raws, extras):
+            mapping = np.array([position[label] for label in e['segment_labels']] + [-1], dtype=np.int32)
+            segments.append(mapping[r['segment']])  # code -1 picks the trailing -1
+        raw['segment'] = np.concatenate(segments)
+        results['segment_column'] = plan['segment_by']
+        results['segment_labels'] = labels
+
+    # Page ratios against the medians of the merged page sketches
+    timed = [p for p in partials if p['pages']]
+    if timed:
+        sketches = {}
+        for p in timed:
+            for page, sketch in zip(p['pages'], p['page_sketches']):
+                sketches.setdefault(page, DurationSketch()).merge(sketch)
+        seconds, pages = _align_columns(
+            [np.empty((p['rows'], 0), dtype=np.float32) if p['page_seconds'] is None else p['page_seconds']
+             for p in partials],
+            [p['pages'] for p in partials])
+        medians = np.array([sketches[page].quantile(0.5) for page in pages])
+        raw['page_time_ratio'] = page_time_ratios(seconds, medians)
+        results['timing_pages'] = pages
+
+    durations = DurationSketch()
+    for p in partials:
+        durations.merge(p['duration_sketch'])
+    results['sharding'] = {
+        'shards': len(partials),
+        'shard_sec': [p['elapsed_sec'] for p in partials],
+        'duration_quantiles_sec': durations.quantiles() if durations.count else None,
+    }
+
+    results['raw_metrics'] = raw
+    return apply_thresholds(results, plan['thresholds'])
+
+
+# =============================================================================
+# COORDINATOR & WORKERS
+# =============================================================================
+
+# Queues live in the manager's server process
+_tasks = queue.Queue()
+_partials = queue.Queue()
+
+
+def _get_tasks():
+    return _tasks
+
+
+def _get_partials():
+    return _partials
+
+
+class ShardManager(BaseManager):
+    """Serves the task and partial queues to local and remote workers."""
+
+
+ShardManager.register('get_tasks', callable=_get_tasks)
+ShardManager.register('get_partials', callable=_get_partials)
+
+
+def parse_address(text):
+    """'host:port' -> (host, port)."""
+    host, sep, port = text.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError(f"Address must be HOST:PORT: {text}")
+    return host or '0.0.0.0', int(port)
+
+
+def get_authkey(authkey=None):
+    """Explicit key, else BRD_SHARD_AUTHKEY, else None."""
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+
+def run_worker(address, authkey, verbose=False):
+    """
+    Worker loop: take (plan, shard index) tasks until told to stop (None)
+    or the coordinator goes away. Map errors are sent back, not raised.
+    """
+    manager = ShardManager(address=address, authkey=authkey)
+    manager.connect()
+    tasks = manager.get_tasks()
+    partials = manager.get_partials()
+    while True:
+        try:
+            task = tasks.get()
+        except (EOFError, OSError):
+            break  # coordinator finished
+        if task is None:
+            break
+        plan, index = task
+        log = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(sys.stdout if verbose else log):
+                partial = map_shard(plan, index)
+        except Exception as e:
+            partial = {'index': index, 'error': f"{type(e).__name__}: {e}"}
+        try:
+            partials.put(partial)
+        except (EOFError, OSError):
+            break
+
+
+def analyze_sharded(sav_file, docx_file=None, shards=None, workers=None, cache_dir=None, thresholds=None,
+                    detectors=None, optimize_memory=True, segment_by=None, listen=None, authkey=None,
+                    timeout=SHARD_TIMEOUT_SEC, verbose=False):
+    """
+    Map/reduce analysis of one SAV file.
+
+    shards: number of row ranges (default: one per SHARD_ROWS rows).
+    workers: local worker processes (default: CPU count, at most one per
+    shard; 0 = remote workers only).
+    listen: (host, port) the queues are served on - needed for workers on
+    other hosts, which then must use the same authkey (default:
+    BRD_SHARD_AUTHKEY). Without it the queues listen on localhost only.
+
+    Returns results like analyze_with_questionnaire() (there is no
+    DataFrame to return - no process ever holds all rows).
+    """
+    print("=" * 80)
+    print("BAD RESPONDENTS DETECTOR v2.0 (sharded)")
+    print("=" * 80)
+
+    stages = StageStats()
+    with stages.track('plan'):
+        plan = plan_analysis(sav_file, docx_file, cache_dir=cache_dir, thresholds=thresholds,
+                             detectors=detectors, optimize_memory=optimize_memory,
+                             segment_by=segment_by, shards=shards)
+    count = len(plan['shards'])
+    print(f"\nData: {plan['total_rows']} respondents, {len(plan['usecols'])} of {plan['total_columns']} "
+          f"variables, {count} shard(s), ID column: {plan['id_column']}")
+
+    authkey = get_authkey(authkey)
+    if listen and not authkey:
+        raise ValueError(f"Serving shards to other hosts needs an authkey (set {AUTHKEY_ENV})")
+    workers = min(os.cpu_count() or 1, count) if workers is None else workers
+    if not listen and workers < 1:
+        raise ValueError("Without listen, at least one local worker is needed")
+
+    authkey = authkey or os.urandom(16)
+    manager = ShardManager(address=listen or ('127.0.0.1', 0), authkey=authkey)
+    manager.start()
+    processes = []
+    try:
+        tasks = manager.get_tasks()
+        partial_queue = manager.get_partials()
+        for index in range(count):
+            tasks.put((plan, index))
+        for _ in range(workers):
+            process = multiprocessing.Process(target=run_worker, args=(manager.address, authkey),
+                                              kwargs={'verbose': verbose}, daemon=True)
+            process.start()
+            processes.append(process)
+        if listen:
+            print(f"Serving {count} shard(s) on {manager.address[0]}:{manager.address[1]} "
+                  f"({workers} local worker(s))")
+
+        with stages.track('map'):
+            partials = _collect_partials(plan, tasks, partial_queue, processes, remote=bool(listen),
+                                         timeout=timeout)
+        for _ in processes:
+            tasks.put(None)
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        manager.shutdown()
+
+    with stages.track('reduce'):
+        results = reduce_partials(partials, plan)
+    results['stages'] = stages.stages
+    print_summary(results, stages)
+    return results
+
+
+def _collect_partials(plan, tasks, partial_queue, processes, remote, timeout):
+    count = len(plan['shards'])
+    partials = {}
+    failures = {}
+    last_progress = time.monotonic()
+    while len(partials) < count:
+        try:
+            partial = partial_queue.get(timeout=1)
+        except queue.Empty:
+            if not remote and not any(p.is_alive() for p in processes):
+                raise RuntimeError("All shard workers exited before the analysis finished")
+            if time.monotonic() - last_progress > timeout:
+                raise RuntimeError(f"No shard finished within {timeout}s "
+                                   f"({len(partials)} of {count} done)")
+            continue
+
+        last_progress = time.monotonic()
+        index = partial['index']
+        if 'error' in partial:
+            failures[index] = failures.get(index, 0) + 1
+            print(f"   Shard {index + 1}/{count} failed: {partial['error']}")
+            if failures[index] > SHARD_RETRIES:
+                raise RuntimeError(f"Shard {index + 1} failed: {partial['error']}")
+            tasks.put((plan, index))
+            continue
+        partials[index] = partial
+        print(f"   Shard {index + 1}/{count}: {partial['rows']} rows in {partial['elapsed_sec']:.2f}s")
+    return list(partials.values())
+
+
+def main(argv=None):
+    """Remote worker entry point: python sharding.py --connect HOST:PORT"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='python sharding.py',
+        description='Worker for sharded analyses - processes shards served by a coordinator.'
+    )
+    parser.add_argument('--connect', required=True, metavar='HOST:PORT',
+                        help='Address the coordinator serves shards on (--listen of the batch tool)')
+    parser.add_argument('--authkey', help=f"Shared secret (default: ${AUTHKEY_ENV})")
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print the analysis log of every shard')
+    args = parser.parse_args(argv)
+
+    authkey = get_authkey(args.authkey)
+    if not authkey:
+        parser.error(f"an authkey is required (--authkey or ${AUTHKEY_ENV})")
+    try:
+        address = parse_address(args.connect)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Worker connecting to {address[0]}:{address[1]}...")
+    run_worker(address, authkey, verbose=args.verbose)
+    print("Coordinator finished - worker exiting.")
+    return 0
+
+
+if __name__ == '__main__':
+    # Run from the importable module, so partials pickle as sharding.*
+    # (not __main__.*) and the coordinator can load them
+    import sharding
+    sys.exit(sharding.main())
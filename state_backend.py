@@ -0,0 +1,401 @@
+"""
+State Backend - where jobs, finished analyses and kept uploads live, so that
+any server process can answer for any of them.
+
+    MemoryStateBackend   one process (python app.py, a single gunicorn worker)
+    SQLiteStateBackend   all workers of one host: a SQLite database plus
+                         directories for kept uploads next to it
+
+Both implement StateBackend; a store shared by several hosts (a database,
+Redis, ...) implements the same methods. Generated files are kept by an
+ArtifactStore on a directory all workers see (see app.py: STATE_DIR).
+"""
+
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def remove_paths(*paths):
+    for path in paths:
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Warning: Cleanup of {path} failed: {e}")
+
+
+class StateBackend:
+    """
+    Interface of the shared state.
+
+    Jobs: a record (dict with id, key, status, created, finished, updated,
+    http_status, payload) plus an ordered list of progress events.
+    `updated` changes with every event - a running job whose record stops
+    changing for `stale_sec` is considered dead (its worker exited).
+    """
+
+    name = 'state'
+
+    # --- jobs ------------------------------------------------------------------
+
+    def claim_job(self, key, job_id, created, stale_sec):
+        """
+        Create the record of job_id as the run of `key` unless another live
+        job holds the key - checked and written in one step, so two
+        processes never both claim it. Returns the id of the job holding the
+        key (job_id when claimed).
+        """
+        raise NotImplementedError
+
+    def update_job(self, job_id, **fields):
+        """Set status / finished / http_status / payload (and bump updated)."""
+        raise NotImplementedError
+
+    def get_job(self, job_id):
+        """Job record or None."""
+        raise NotImplementedError
+
+    def add_job_event(self, job_id, event):
+        raise NotImplementedError
+
+    def get_job_events(self, job_id, start=0):
+        raise NotImplementedError
+
+    def release_job_key(self, key, job_id):
+        raise NotImplementedError
+
+    def prune_jobs(self, finished_before):
+        """Forget jobs finished before the given time."""
+        raise NotImplementedError
+
+    # --- analyses ----------------------------------------------------------------
+
+    def put_analysis(self, analysis_id, results):
+        raise NotImplementedError
+
+    def get_analysis(self, analysis_id):
+        """Results dict or None. Unchanged analyses return the same object."""
+        raise NotImplementedError
+
+    # --- uploads kept for a later full run -----------------------------------------
+
+    def keep_upload(self, preview_id, sav_path, docx_path):
+        """Take ownership of the files (they may be moved) until taken or expired."""
+        raise NotImplementedError
+
+    def take_upload(self, preview_id):
+        """(sav_path, docx_path) - the caller owns them again - or None."""
+        raise NotImplementedError
+
+
+# =============================================================================
+# SINGLE PROCESS
+# =============================================================================
+
+class MemoryStateBackend(StateBackend):
+    """Everything in dictionaries of this process."""
+
+    name = 'memory'
+
+    def __init__(self, max_analyses=20, upload_ttl_sec=3600, max_uploads=20):
+        self.max_analyses = max_analyses
+        self.upload_ttl_sec = upload_ttl_sec
+        self.max_uploads = max_uploads
+        self._jobs = {}
+        self._events = {}
+        self._keys = {}
+        self._analyses = OrderedDict()
+        self._uploads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim_job(self, key, job_id, created, stale_sec):
+        with self._lock:
+            holder = self._jobs.get(self._keys.get(key))
+            if holder is not None and holder['status'] in ('queued', 'running') \
+                    and holder['updated'] >= time.time() - stale_sec:
+                return holder['id']
+            self._jobs[job_id] = {'id': job_id, 'key': key, 'status': 'queued', 'created': created,
+                                  'finished': None, 'updated': created, 'http_status': None, 'payload': None}
+            self._events[job_id] = []
+            self._keys[key] = job_id
+            return job_id
+
+    def update_job(self, job_id, **fields):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is not None:
+                record.update(fields, updated=time.time())
+
+    def get_job(self, job_id):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record else None
+
+    def add_job_event(self, job_id, event):
+        with self._lock:
+            if job_id in self._jobs:
+                self._events[job_id].append(event)
+                self._jobs[job_id]['updated'] = time.time()
+
+    def get_job_events(self, job_id, start=0):
+        with self._lock:
+            return list(self._events.get(job_id, [])[start:])
+
+    def release_job_key(self, key, job_id):
+        with self._lock:
+            if self._keys.get(key) == job_id:
+                del self._keys[key]
+
+    def prune_jobs(self, finished_before):
+        with self._lock:
+            for job_id in [j['id'] for j in self._jobs.values()
+                           if j['finished'] is not None and j['finished'] < finished_before]:
+                del self._jobs[job_id]
+                del self._events[job_id]
+
+    def put_analysis(self, analysis_id, results):
+        with self._lock:
+            self._analyses[analysis_id] = results
+            self._analyses.move_to_end(analysis_id)
+            while len(self._analyses) > self.max_analyses:
+                self._analyses.popitem(last=False)
+
+    def get_analysis(self, analysis_id):
+        with self._lock:
+            results = self._analyses.get(analysis_id)
+            if results is not None:
+                self._analyses.move_to_end(analysis_id)
+            return results
+
+    def keep_upload(self, preview_id, sav_path, docx_path):
+        with self._lock:
+            self._uploads[preview_id] = (sav_path, docx_path, time.time())
+            expired = self._expire_uploads()
+        remove_paths(*expired)
+
+    def take_upload(self, preview_id):
+        with self._lock:
+            expired = self._expire_uploads()
+            entry = self._uploads.pop(preview_id, None)
+        remove_paths(*expired)
+        return entry[:2] if entry else None
+
+    def _expire_uploads(self):
+        """Drop expired and surplus entries (lock held); returns their file paths."""
+        paths = []
+        cutoff = time.time() - self.upload_ttl_sec
+        while self._uploads:
+            preview_id, (sav_path, docx_path, kept_at) = next(iter(self._uploads.items()))
+            if kept_at >= cutoff and len(self._uploads) <= self.max_uploads:
+                break
+            del self._uploads[preview_id]
+            paths += [sav_path, docx_path]
+        return paths
+
+
+# =============================================================================
+# ALL WORKERS OF ONE HOST
+# =============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY, key TEXT, status TEXT, created REAL, finished REAL,
+    updated REAL, http_status INTEGER, payload TEXT
+);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT, seq INTEGER, event TEXT, PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_keys (key TEXT PRIMARY KEY, job_id TEXT);
+CREATE TABLE IF NOT EXISTS analyses (id TEXT PRIMARY KEY, updated REAL, results BLOB);
+CREATE TABLE IF NOT EXISTS kept_uploads (
+    id TEXT PRIMARY KEY, sav_path TEXT, docx_path TEXT, kept_at REAL
+);
+"""
+
+JOB_FIELDS = ('id', 'key', 'status', 'created', 'finished', 'updated', 'http_status', 'payload')
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    State in <root>/state.sqlite3 (WAL mode, one connection per thread),
+    kept uploads moved into <root>/kept. Results are pickled; the last
+    `cache_size` unpickled analyses are cached per process and reused while
+    their row is unchanged. Meant for one host - SQLite locking is not
+    reliable on network file systems.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, root, max_analyses=20, upload_ttl_sec=3600, max_uploads=20, cache_size=4):
+        self.root = root
+        self.path = os.path.join(root, 'state.sqlite3')
+        self.kept_dir = os.path.join(root, 'kept')
+        self.max_analyses = max_analyses
+        self.upload_ttl_sec = upload_ttl_sec
+        self.max_uploads = max_uploads
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        os.makedirs(self.kept_dir, exist_ok=True)
+        self._connection().db.executescript(SCHEMA)
+
+    def _connection(self):
+        # A connection must not be used across fork (preloaded gunicorn
+        # workers inherit the master's thread-local state)
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return _Transaction(db)
+
+    # --- jobs ------------------------------------------------------------------
+
+    def claim_job(self, key, job_id, created, stale_sec):
+        # One IMMEDIATE transaction: the holder check, the job row and the key
+        with self._connection() as db:
+            row = db.execute("SELECT j.id FROM job_keys k JOIN jobs j ON j.id = k.job_id "
+                             "WHERE k.key = ? AND j.status IN ('queued', 'running') AND j.updated >= ?",
+                             (key, time.time() - stale_sec)).fetchone()
+            if row is not None:
+                return row[0]
+            db.execute("INSERT INTO jobs (id, key, status, created, updated) VALUES (?, ?, 'queued', ?, ?)",
+                       (job_id, key, created, created))
+            db.execute("INSERT OR REPLACE INTO job_keys (key, job_id) VALUES (?, ?)", (key, job_id))
+            return job_id
+
+    def update_job(self, job_id, **fields):
+        if 'payload' in fields:
+            fields['payload'] = json.dumps(fields['payload'], ensure_ascii=False, default=str)
+        fields['updated'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields if name in JOB_FIELDS)
+        values = [value for name, value in fields.items() if name in JOB_FIELDS]
+        with self._connection() as db:
+            db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values, job_id))
+
+    def get_job(self, job_id):
+        with self._connection() as db:
+            row = db.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(JOB_FIELDS, row))
+        if record['payload'] is not None:
+            record['payload'] = json.loads(record['payload'])
+        return record
+
+    def add_job_event(self, job_id, event):
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                       (job_id, event['seq'], json.dumps(event, ensure_ascii=False, default=str)))
+            db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (time.time(), job_id))
+
+    def get_job_events(self, job_id, start=0):
+        with self._connection() as db:
+            rows = db.execute("SELECT event FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq",
+                              (job_id, start)).fetchall()
+        return [json.loads(event) for (event,) in rows]
+
+    def release_job_key(self, key, job_id):
+        with self._connection() as db:
+            db.execute("DELETE FROM job_keys WHERE key = ? AND job_id = ?", (key, job_id))
+
+    def prune_jobs(self, finished_before):
+        with self._connection() as db:
+            db.execute("DELETE FROM job_events WHERE job_id IN "
+                       "(SELECT id FROM jobs WHERE finished IS NOT NULL AND finished < ?)", (finished_before,))
+            db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (finished_before,))
+
+    # --- analyses ----------------------------------------------------------------
+
+    def put_analysis(self, analysis_id, results):
+        blob = pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL)
+        updated = time.time()
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO analyses (id, updated, results) VALUES (?, ?, ?)",
+                       (analysis_id, updated, blob))
+            db.execute("DELETE FROM analyses WHERE id NOT IN "
+                       "(SELECT id FROM analyses ORDER BY updated DESC LIMIT ?)", (self.max_analyses,))
+        self._remember(analysis_id, updated, results)
+
+    def get_analysis(self, analysis_id):
+        with self._connection() as db:
+            row = db.execute("SELECT updated FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        if row is None:
+            return None
+        with self._cache_lock:
+            cached = self._cache.get(analysis_id)
+            if cached is not None and cached[0] == row[0]:
+                self._cache.move_to_end(analysis_id)
+                return cached[1]
+
+        with self._connection() as db:
+            row = db.execute("SELECT updated, results FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        if row is None:
+            return None
+        results = pickle.loads(row[1])
+        self._remember(analysis_id, row[0], results)
+        return results
+
+    def _remember(self, analysis_id, updated, results):
+        with self._cache_lock:
+            self._cache[analysis_id] = (updated, results)
+            self._cache.move_to_end(analysis_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- uploads kept for a later full run -----------------------------------------
+
+    def keep_upload(self, preview_id, sav_path, docx_path):
+        # Moved under the state directory, so the worker taking them can read them
+        kept = [None, None]
+        for i, path in enumerate((sav_path, docx_path)):
+            if path:
+                kept[i] = os.path.join(self.kept_dir, f"{preview_id}_{i}_{os.path.basename(path)}")
+                shutil.move(path, kept[i])
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO kept_uploads (id, sav_path, docx_path, kept_at) VALUES (?, ?, ?, ?)",
+                       (preview_id, kept[0], kept[1], time.time()))
+        self._expire_uploads()
+
+    def take_upload(self, preview_id):
+        self._expire_uploads()
+        with self._connection() as db:
+            row = db.execute("SELECT sav_path, docx_path FROM kept_uploads WHERE id = ?", (preview_id,)).fetchone()
+            deleted = db.execute("DELETE FROM kept_uploads WHERE id = ?", (preview_id,)).rowcount
+        # Only the worker whose DELETE succeeded owns the files
+        return tuple(row) if row is not None and deleted else None
+
+    def _expire_uploads(self):
+        cutoff = time.time() - self.upload_ttl_sec
+        with self._connection() as db:
+            rows = db.execute("SELECT id, sav_path, docx_path FROM kept_uploads WHERE kept_at < ? OR id NOT IN "
+                              "(SELECT id FROM kept_uploads ORDER BY kept_at DESC LIMIT ?)",
+                              (cutoff, self.max_uploads)).fetchall()
+            expired = [row for row in rows
+                       if db.execute("DELETE FROM kept_uploads WHERE id = ?", (row[0],)).rowcount]
+        for _, sav_path, docx_path in expired:
+            remove_paths(sav_path, docx_path)
+
+
+class _Transaction:
+    """`with` block = one IMMEDIATE transaction on a thread's connection."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
@@ -0,0 +1,76 @@
+"""
+Synthetic survey - a generated SAV-like dataset and the questionnaire that
+describes it, shared by the start-up warm-up (warmup.py) and the benchmarks
+(benchmark_memory.py, benchmark_load.py).
+
+The memory baseline (benchmark_baseline.json) was recorded on make_survey()
+with the default seed; changing the data changes that measurement, so
+record a new baseline together with any change here.
+"""
+
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+SEED = 0
+
+WORDS = ("cena kvalita dobra sluzba rychle doruceni produkt libi nelibi "
+         "protoze drahy levny pekny obal chut").split()
+
+# Questionnaire matching the columns of make_survey
+QUESTIONNAIRE = [
+    'Q5. Proč se vám produkt líbí?', 'OTEVŘENÁ OTÁZKA',
+    'Q7. Co byste zlepšili?', 'OTEVŘENÁ OTÁZKA',
+    'Q10. Ohodnoťte výroky', 'BATERIE OTÁZEK',
+    'Q11. Další výroky', 'BATERIE OTÁZEK',
+    'Q12. Co používáte', 'VÍCE MOŽNÝCH ODPOVĚDÍ',
+    'Q13. Poslední baterie', 'BATERIE OTÁZEK',
+    'KONEC DOTAZNÍKU',
+]
+
+DOCUMENT_XML = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                '<w:body>{}</w:body></w:document>')
+
+
+def make_survey(n, seed=SEED):
+    """
+    Reference dataset: durations with ~8 % speeders, two open-ended questions
+    (with "nevim", gibberish and empty answers), three 1-7 batteries with ~7 %
+    straight-liners and one multiple-choice question.
+    """
+    rng = np.random.default_rng(seed)
+
+    def answer():
+        r = rng.random()
+        if r < .1:
+            return 'nevim'
+        if r < .15:
+            return 'asdfghjklqwrt'
+        if r < .2:
+            return ''
+        return ' '.join(rng.choice(WORDS, rng.integers(1, 12)))
+
+    data = {'ExternalId': [f'R{i:06d}' for i in range(n)]}
+    secs = rng.normal(900, 200, n).clip(60)
+    secs[rng.random(n) < .08] = rng.uniform(60, 250)
+    data['duration'] = [f'{int(s // 3600)}:{int(s % 3600 // 60):02d}:{int(s % 60):02d}' for s in secs]
+    data['Q5'] = [answer() for _ in range(n)]
+    data['Q7'] = [answer() for _ in range(n)]
+    straight = rng.random(n) < .07
+    for battery, items in (('Q10', 6), ('Q11', 5), ('Q13', 4)):
+        base = rng.integers(1, 8, n)
+        for j in range(1, items + 1):
+            data[f'{battery}__{j}'] = np.where(straight, base, rng.integers(1, 8, n)).astype(float)
+    for j in range(1, 6):
+        data[f'Q12__{j}'] = rng.integers(0, 2, n).astype(float)
+    return pd.DataFrame(data)
+
+
+def write_questionnaire(path, lines=QUESTIONNAIRE):
+    """Minimal DOCX (just word/document.xml, one paragraph per line)."""
+    paragraphs = ''.join(f'<w:p><w:r><w:t>{escape(line)}</w:t></w:r></w:p>' for line in lines)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('word/document.xml', DOCUMENT_XML.format(paragraphs))
@@ -70,6 +70,64 @@ except Exception as e:
     errors.append(f"Cannot import questionnaire_parser: {e}")
     print(f"  ✗ questionnaire_parser.py FAILED")
 
+try:
+    from detectors import DEFAULT_DETECTORS
+    print("  → detectors.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import detectors: {e}")
+    print(f"  ✗ detectors.py FAILED")
+
+try:
+    from sav_cache import read_sav_cached
+    print("  → sav_cache.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import sav_cache: {e}")
+    print(f"  ✗ sav_cache.py FAILED")
+
+try:
+    from jobs import JobManager
+    print("  → jobs.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import jobs: {e}")
+    print(f"  ✗ jobs.py FAILED")
+
+try:
+    from admission import MemoryBudget
+    print("  → admission.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import admission: {e}")
+    print(f"  ✗ admission.py FAILED")
+
+try:
+    from profiling import profiled
+    print("  → profiling.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import profiling: {e}")
+    print(f"  ✗ profiling.py FAILED")
+
+try:
+    from artifact_store import ArtifactStore
+    print("  → artifact_store.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import artifact_store: {e}")
+    print(f"  ✗ artifact_store.py FAILED")
+
+try:
+    from uploads import save_data_upload
+    print("  → uploads.py ✓")
+except Exception as e:
+    errors.append(f"Cannot import uploads: {e}")
+    print(f"  ✗ uploads.py FAILED")
+
+try:
+    from gibberish import load_model
+    if load_model() is None:
+        raise RuntimeError("gibberish_trigrams.npy missing or invalid (run build_gibberish_model.py)")
+    print("  → gibberish.py ✓")
+except Exception as e:
+    errors.append(f"Cannot load gibberish model: {e}")
+    print(f"  ✗ gibberish.py FAILED")
+
 try:
     from spss_syntax_unified import generate_spss_syntax_unified
     print("  → spss_syntax_unified.py ✓")
@@ -86,6 +144,15 @@ required_files = [
     'bad_respondents_detector.py',
     'questionnaire_parser.py',
     'spss_syntax_unified.py',
+    'detectors.py',
+    'sav_cache.py',
+    'jobs.py',
+    'artifact_store.py',
+    'admission.py',
+    'profiling.py',
+    'gibberish.py',
+    'uploads.py',
+    'gibberish_trigrams.npy',
     'static/index.html',
     'requirements.txt',
 ]
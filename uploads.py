@@ -0,0 +1,373 @@
+"""
+Upload handling - compressed SAV data and zip bundles.
+
+Accepted data uploads:
+    .sav        plain SPSS data file
+    .zsav       compressed SPSS data file (read natively by pyreadstat)
+    .sav.gz     gzip-compressed SAV
+    .zip        bundle with one SAV/ZSAV/SAV.GZ file and optionally the DOCX questionnaire
+
+Compressed content is decompressed in chunks straight to disk, never held in
+memory as a whole. The request size limit (MAX_CONTENT_LENGTH) applies to
+the compressed payload; the decompressed size is capped separately so a
+small archive cannot expand without bound.
+
+Large files can also arrive in parts (ChunkedUploads): init -> put parts
+(in any order, retried freely) -> complete. Parts live on disk until the
+upload completes or expires, so an interrupted upload resumes from the
+parts the server already confirmed.
+"""
+
+import gzip
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import zipfile
+import zlib
+
+from werkzeug.utils import secure_filename
+
+COPY_CHUNK_BYTES = 1024 * 1024
+DEFAULT_MAX_DECOMPRESSED_BYTES = 4 * 1024 ** 3
+
+DATA_SUFFIXES = ('.sav.gz', '.zsav', '.sav')  # longest first
+BUNDLE_SUFFIX = '.zip'
+DOCX_SUFFIX = '.docx'
+
+
+class UploadError(ValueError):
+    """Upload rejected; the message is shown to the user."""
+
+
+def upload_kind(filename):
+    """'.sav', '.zsav', '.sav.gz' or '.zip' for an accepted data upload, else None."""
+    name = (filename or '').lower()
+    for suffix in DATA_SUFFIXES + (BUNDLE_SUFFIX,):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def copy_limited(source, target, limit, label):
+    """Copy file object source to target in chunks; UploadError past limit bytes."""
+    written = 0
+    while True:
+        chunk = source.read(COPY_CHUNK_BYTES)
+        if not chunk:
+            return written
+        written += len(chunk)
+        if written > limit:
+            raise UploadError(f'{label} je po rozbalení větší než povolených {limit // 1024 ** 2} MB')
+        target.write(chunk)
+
+
+def _stored_name(prefix, filename, kind):
+    """Target file name: .sav.gz becomes .sav, everything else keeps its suffix."""
+    name = secure_filename(os.path.basename(filename)) or f"upload{kind}"
+    if kind == '.sav.gz':
+        name = name[:-len('.gz')]
+    return f"{prefix}_{name}"
+
+
+def _write_data(source, filename, kind, directory, prefix, limit):
+    """Write one data stream (plain or gzip) to directory; returns the path."""
+    path = os.path.join(directory, _stored_name(prefix, filename, kind))
+    try:
+        with open(path, 'wb') as target:
+            if kind != '.sav.gz':
+                copy_limited(source, target, limit, filename)
+                return path
+            try:
+                with gzip.GzipFile(fileobj=source, mode='rb') as unpacked:
+                    copy_limited(unpacked, target, limit, filename)
+            except (gzip.BadGzipFile, EOFError, zlib.error) as e:
+                raise UploadError(f'Soubor {filename} není platný gzip: {e}')
+    except BaseException:
+        _remove(path)
+        raise
+    return path
+
+
+def save_data_upload(file_storage, directory, prefix, max_bytes=DEFAULT_MAX_DECOMPRESSED_BYTES):
+    """
+    Save an uploaded data file (werkzeug FileStorage).
+
+    Returns (sav_path, docx_path) - docx_path is set only when a zip bundle
+    contained a questionnaire. Raises UploadError for unsupported or broken
+    uploads.
+    """
+    return save_data_stream(file_storage.stream, file_storage.filename, directory, prefix, max_bytes)
+
+
+def save_data_stream(stream, filename, directory, prefix, max_bytes=DEFAULT_MAX_DECOMPRESSED_BYTES):
+    """save_data_upload() for any binary file object (seekable for .zip)."""
+    kind = upload_kind(filename)
+    if kind is None:
+        raise UploadError('Datový soubor musí mít příponu .sav, .zsav, .sav.gz nebo .zip')
+    if kind == BUNDLE_SUFFIX:
+        return extract_bundle(stream, directory, prefix, max_bytes)
+    return _write_data(stream, filename, kind, directory, prefix, max_bytes), None
+
+
+def extract_bundle(stream, directory, prefix, max_bytes=DEFAULT_MAX_DECOMPRESSED_BYTES):
+    """
+    Extract a zip bundle: exactly one data file (.sav/.zsav/.sav.gz) and at
+    most one .docx questionnaire. Members are streamed to disk one by one.
+    """
+    try:
+        bundle = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        raise UploadError(f'Soubor ZIP je poškozený: {e}')
+
+    with bundle:
+        data_members, docx_members = [], []
+        for info in bundle.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            kind = upload_kind(name)
+            if kind in DATA_SUFFIXES:
+                data_members.append((info, kind))
+            elif name.lower().endswith(DOCX_SUFFIX):
+                docx_members.append(info)
+
+        if len(data_members) != 1:
+            raise UploadError(f'ZIP musí obsahovat právě jeden SAV soubor (nalezeno {len(data_members)})')
+        if len(docx_members) > 1:
+            raise UploadError(f'ZIP obsahuje více dotazníků DOCX ({len(docx_members)})')
+
+        remaining = max_bytes
+        info, kind = data_members[0]
+        try:
+            with bundle.open(info) as member:
+                sav_path = _write_data(member, os.path.basename(info.filename), kind,
+                                       directory, prefix, remaining)
+            remaining -= os.path.getsize(sav_path)
+
+            docx_path = None
+            if docx_members:
+                info = docx_members[0]
+                docx_path = os.path.join(directory, _stored_name(prefix, info.filename, DOCX_SUFFIX))
+                try:
+                    with bundle.open(info) as member, open(docx_path, 'wb') as target:
+                        copy_limited(member, target, remaining, os.path.basename(info.filename))
+                except Exception:
+                    _remove(docx_path)
+                    _remove(sav_path)
+                    raise
+        except (zipfile.BadZipFile, zlib.error, NotImplementedError, RuntimeError) as e:
+            # RuntimeError: encrypted member, NotImplementedError: unsupported compression
+            raise UploadError(f'Soubor ZIP nelze rozbalit: {e}')
+
+    print(f"Bundle extracted: {os.path.basename(sav_path)}"
+          f"{' + ' + os.path.basename(docx_path) if docx_path else ''}")
+    return sav_path, docx_path
+
+
+# =============================================================================
+# SAV HEADER CHECK
+# =============================================================================
+
+SAV_MAGICS = (b'$FL2', b'$FL3')   # $FL3 = ZSAV
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+def check_data_header(kind, head):
+    """
+    Validate the first bytes of a data upload of the given kind; raises
+    UploadError when they cannot start a SAV file (or an archive).
+    """
+    if kind in ('.sav', '.zsav'):
+        ok = head[:4] in SAV_MAGICS
+    elif kind == '.sav.gz':
+        ok = False
+        if head[:2] == GZIP_MAGIC:
+            try:
+                ok = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head, 4)[:4] in SAV_MAGICS
+            except zlib.error:
+                ok = False
+    elif kind == BUNDLE_SUFFIX:
+        ok = head[:4] == ZIP_MAGIC
+    else:
+        ok = False
+    if not ok:
+        raise UploadError('Soubor nezačíná hlavičkou SPSS (.sav) - nejde o platná data')
+
+
+# =============================================================================
+# CHUNKED (RESUMABLE) UPLOADS
+# =============================================================================
+
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+class ChunkedUploads:
+    """
+    Multi-part uploads stored under root/<upload_id>/:
+        meta.json       file name, kind, declared size, part size, creation time
+        part_00000 ...  received parts (written atomically)
+
+    The directory is the only source of truth, so parts may be sent to any
+    server process sharing it. Unfinished uploads expire after ttl_sec.
+    """
+
+    def __init__(self, root, max_bytes, ttl_sec=24 * 3600, max_part_size=DEFAULT_PART_SIZE * 4):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        self.max_part_size = max_part_size
+        os.makedirs(root, exist_ok=True)
+
+    def create(self, filename, size, part_size=DEFAULT_PART_SIZE):
+        """Start an upload; returns its status dict."""
+        kind = upload_kind(filename)
+        if kind is None:
+            raise UploadError('Datový soubor musí mít příponu .sav, .zsav, .sav.gz nebo .zip')
+        if size <= 0:
+            raise UploadError('Velikost souboru musí být kladná')
+        if size > self.max_bytes:
+            raise UploadError(f'Soubor je větší než povolených {self.max_bytes // 1024 ** 2} MB')
+        if not 0 < part_size <= self.max_part_size:
+            raise UploadError(f'Velikost části musí být 1 B až {self.max_part_size // 1024 ** 2} MB')
+
+        self.sweep()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id))
+        meta = {
+            'id': upload_id,
+            'filename': os.path.basename(filename),
+            'kind': kind,
+            'size': size,
+            'part_size': part_size,
+            'parts_total': -(-size // part_size),
+            'created': time.time(),
+        }
+        with open(self._meta_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """Metadata plus the sorted list of received part numbers, or None."""
+        meta = self._meta(upload_id)
+        if meta is None:
+            return None
+        received = sorted(int(name[5:]) for name in os.listdir(self._dir(upload_id))
+                          if name.startswith('part_') and name[5:].isdigit())
+        return dict(meta, received=received, complete=len(received) == meta['parts_total'])
+
+    def put_part(self, upload_id, number, stream):
+        """
+        Store part `number` from a binary stream. The length must match the
+        declared layout; part 0 must start with a SAV (or archive) header.
+        Re-sending a part replaces it. Returns the updated status.
+        """
+        meta = self._meta(upload_id)
+        if meta is None:
+            raise KeyError(upload_id)
+        if not 0 <= number < meta['parts_total']:
+            raise UploadError(f"Část {number} je mimo rozsah 0-{meta['parts_total'] - 1}")
+        expected = min(meta['part_size'], meta['size'] - number * meta['part_size'])
+
+        path = self._part_path(upload_id, number)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            written = 0
+            with open(tmp_path, 'wb') as target:
+                while True:
+                    chunk = stream.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    if number == 0 and written == 0:
+                        check_data_header(meta['kind'], chunk)
+                    written += len(chunk)
+                    if written > expected:
+                        raise UploadError(f'Část {number} je delší než očekávaných {expected} B')
+                    target.write(chunk)
+            if written != expected:
+                raise UploadError(f'Část {number} má {written} B, očekáváno {expected} B')
+            os.replace(tmp_path, path)
+        finally:
+            _remove(tmp_path)
+        return self.status(upload_id)
+
+    def assemble(self, upload_id, target_path):
+        """
+        Concatenate all parts into target_path and delete the upload. Returns
+        the metadata. Only one caller wins when complete is sent twice.
+        """
+        status = self.status(upload_id)
+        if status is None:
+            raise KeyError(upload_id)
+        missing = sorted(set(range(status['parts_total'])) - set(status['received']))
+        if missing:
+            raise UploadError(f"Chybí části: {', '.join(map(str, missing[:20]))}")
+
+        # Claim the upload atomically - a concurrent complete gets KeyError
+        claimed = f"{self._dir(upload_id)}.assembling"
+        try:
+            os.rename(self._dir(upload_id), claimed)
+        except OSError:
+            raise KeyError(upload_id)
+        try:
+            with open(target_path, 'wb') as target:
+                for number in range(status['parts_total']):
+                    with open(os.path.join(claimed, f"part_{number:05d}"), 'rb') as part:
+                        shutil.copyfileobj(part, target, COPY_CHUNK_BYTES)
+        except BaseException:
+            _remove(target_path)
+            raise
+        finally:
+            shutil.rmtree(claimed, ignore_errors=True)
+        return status
+
+    def delete(self, upload_id):
+        if UPLOAD_ID_RE.match(upload_id or ''):
+            shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def sweep(self):
+        """Remove uploads (and abandoned assemblies) older than the TTL."""
+        cutoff = time.time() - self.ttl_sec
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _dir(self, upload_id):
+        return os.path.join(self.root, upload_id)
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self._dir(upload_id), 'meta.json')
+
+    def _part_path(self, upload_id, number):
+        return os.path.join(self._dir(upload_id), f"part_{number:05d}")
+
+    def _meta(self, upload_id):
+        if not UPLOAD_ID_RE.match(upload_id or ''):
+            return None
+        try:
+            with open(self._meta_path(upload_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,59 @@
+"""
+Warm-up - one tiny synthetic analysis before the server takes traffic.
+
+The first analysis in a process pays for code paths nothing else touches:
+pyreadstat readers, pandas groupby / factorize machinery, the gibberish
+model load, the questionnaire parser, syntax generation and Flask's request
+handling. Running them once at start-up (in the gunicorn master when the app
+is preloaded, so forked workers inherit the warm state) keeps that cost out
+of the first real request.
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import pyreadstat
+
+from bad_respondents_detector import analyze_with_questionnaire, summarize_results
+from gibberish import load_model
+from spss_syntax_unified import generate_spss_syntax_unified
+from synthetic import make_survey, write_questionnaire
+
+WARMUP_ROWS = 300
+
+
+def run_warm_up(app=None, rows=WARMUP_ROWS):
+    """
+    Analyze a synthetic survey end to end (and request /health through
+    app's test client when given). Returns {step: seconds}; the analysis
+    log is swallowed.
+    """
+    timings = {}
+
+    @contextlib.contextmanager
+    def step(name):
+        started = time.perf_counter()
+        yield
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    with tempfile.TemporaryDirectory(prefix='brd_warmup_') as tmp:
+        sav_path = os.path.join(tmp, 'warmup.sav')
+        docx_path = os.path.join(tmp, 'warmup.docx')
+        with step('data'):
+            pyreadstat.write_sav(make_survey(rows), sav_path)
+            write_questionnaire(docx_path)
+        with step('model'):
+            load_model()
+        with step('analysis'), contextlib.redirect_stdout(io.StringIO()):
+            results, _ = analyze_with_questionnaire(sav_path, docx_path)
+            summarize_results(results)
+        with step('syntax'):
+            generate_spss_syntax_unified(results, id_column=results['id_column'],
+                                         output_file=os.path.join(tmp, 'warmup.sps'))
+    if app is not None:
+        with step('request'):
+            app.test_client().get('/health')
+    return timings